@@ -1,10 +1,14 @@
 import streamlit as st
-import pandas as pd
 import database as db
+import search
+import backup
+import record_cache
 from datetime import datetime
 import hashlib
-import plotly.express as px
-import plotly.graph_objects as go
+import os
+
+# pandas and plotly are imported after the password check so the login page
+# renders without loading them. See profile_startup.py for the budget.
 
 # Initialize the DB
 db.init_db()
@@ -88,6 +92,9 @@ st.markdown("""
 if not check_password():
     st.stop()
 
+import pandas as pd
+import plotly.express as px
+
 # --- ADMIN PANEL CONTENT ---
 st.title("🔐 Admin Panel - Diabetes Prediction System")
 st.markdown("---")
@@ -102,9 +109,9 @@ with col2:
 # Get statistics
 stats = db.get_statistics()
 
-# Get all data for visualizations
-df_clinical_all = db.get_all_clinical_records()
-df_lifestyle_all = db.get_all_lifestyle_records()
+# Get all data for visualizations (cached per process; each rerun only reads new rows)
+df_clinical_all = record_cache.get_records('clinical')
+df_lifestyle_all = record_cache.get_records('lifestyle')
 
 # Calculate derived metrics with error handling
 total_screenings = stats.get('total_clinical', 0) + stats.get('total_lifestyle', 0)
@@ -422,13 +429,21 @@ with timeline_col2:
 
 st.markdown("---")
 
-# Row 6: Age Distribution
+# Row 6: Age Distribution (from the stored streaming sketches, not a table scan)
 st.subheader("👥 Age Distribution of Users")
-if not df_clinical_all.empty:
-    fig_age_dist = px.histogram(
-        df_clinical_all,
+age_sketch = db.get_column_sketch('clinical_predictions', 'age')
+if age_sketch.count > 0:
+    age_bins = []
+    for risk_level in ['Non-Diabetic', 'Diabetic']:
+        segment_sketch = db.get_column_sketch('clinical_predictions', 'age', risk_level)
+        for low, high, count in zip(segment_sketch.edges[:-1], segment_sketch.edges[1:], segment_sketch.histogram):
+            if count:
+                age_bins.append({'age': (low + high) / 2, 'Risk Level': risk_level, 'count': count})
+    
+    fig_age_dist = px.bar(
+        pd.DataFrame(age_bins),
         x='age',
-        nbins=20,
+        y='count',
         color='Risk Level',
         color_discrete_map={
             'Non-Diabetic': '#4facfe',
@@ -442,18 +457,246 @@ if not df_clinical_all.empty:
     st.plotly_chart(fig_age_dist, use_container_width=True)
     
     # Age insights
-    age_col1, age_col2, age_col3 = st.columns(3)
+    age_col1, age_col2, age_col3, age_col4 = st.columns(4)
     with age_col1:
-        st.metric("Average Age", f"{df_clinical_all['age'].mean():.1f} years")
+        st.metric("Average Age", f"{age_sketch.mean:.1f} years")
     with age_col2:
-        st.metric("Youngest User", f"{df_clinical_all['age'].min()} years")
+        st.metric("Median Age", f"{age_sketch.percentiles((50,))[50]:.0f} years")
     with age_col3:
-        st.metric("Oldest User", f"{df_clinical_all['age'].max()} years")
+        st.metric("Youngest User", f"{age_sketch.min:.0f} years")
+    with age_col4:
+        st.metric("Oldest User", f"{age_sketch.max:.0f} years")
     
     st.info("💡 **Insight**: Track if at-risk populations are getting younger, which aligns with medical trends of Type 2 Diabetes in younger adults.")
 else:
     st.info("No age data available yet")
 
+# Percentile summaries for the other measurements
+st.subheader("📐 Measurement Percentiles")
+summary_col1, summary_col2 = st.columns(2)
+with summary_col1:
+    st.markdown("**Clinical**")
+    st.dataframe(db.get_column_summary('clinical_predictions'), use_container_width=True, hide_index=True)
+with summary_col2:
+    st.markdown("**Lifestyle**")
+    st.dataframe(db.get_column_summary('lifestyle_predictions'), use_container_width=True, hide_index=True)
+
+st.markdown("---")
+
+# --- COHORT EXPLORER ---
+# Reads the pre-aggregated cohort cube, and reruns on its own when its
+# widgets change instead of redrawing the whole dashboard
+@st.fragment
+def show_cohort_explorer():
+    import cube
+    dimension_labels = {'month': 'Month', 'age_band': 'Age Band', 'bmi_band': 'BMI Band',
+                        'glucose_band': 'Glucose Band', 'risk_class': 'Risk Class'}
+
+    cube_mode = st.radio("Assessment type", ['clinical', 'lifestyle'], horizontal=True,
+                         format_func=str.title, key='cube_mode')
+    dimensions = ['month'] + cube.MODE_BANDS[cube_mode] + ['risk_class']
+    if cube_mode == 'lifestyle':
+        dimensions += db.LIFESTYLE_FLAGS
+
+    def label(name):
+        return dimension_labels.get(name, name.replace('_', ' ').title())
+
+    group_by = st.multiselect("Break down by", dimensions, default=['risk_class'],
+                              format_func=label, key=f'cube_group_{cube_mode}')
+    filters = {}
+    with st.expander("🔎 Filter cohort"):
+        filter_cols = st.columns(3)
+        for i, name in enumerate(dimensions):
+            options = db.query_cube(cube_mode, [name])[name].tolist()
+            with filter_cols[i % 3]:
+                chosen = st.multiselect(label(name), options, key=f'cube_filter_{cube_mode}_{name}')
+            if chosen:
+                filters[name] = chosen
+
+    cohort = db.query_cube(cube_mode, group_by, filters)
+    if cohort.empty:
+        st.info("No assessments match this cohort.")
+        return
+
+    if group_by:
+        chart_data = cohort.astype({name: str for name in group_by[1:]})
+        fig_cohort = px.bar(
+            chart_data,
+            x=group_by[0],
+            y='records',
+            color=group_by[1] if len(group_by) > 1 else None,
+            barmode='group',
+            hover_data=['share_pct', 'mean_bmi'],
+            labels={name: label(name) for name in group_by} | {'records': 'Assessments'},
+            title=f"{cube_mode.title()} Assessments by {' × '.join(label(name) for name in group_by)}"
+        )
+        fig_cohort.update_layout(height=400)
+        st.plotly_chart(fig_cohort, use_container_width=True)
+    st.dataframe(cohort, use_container_width=True, hide_index=True)
+
+st.subheader("🧊 Cohort Explorer")
+show_cohort_explorer()
+
+st.markdown("---")
+
+# --- INPUT DRIFT ---
+st.subheader("🌊 Input Drift vs. Training Data")
+drift_alerts = db.get_drift_alerts()
+for _, alert in drift_alerts.iterrows():
+    st.error(f"🚨 Drift alert: **{alert['mode']} / {alert['feature']}** — PSI {alert['psi']:.3f}, KS {alert['ks']:.3f} (since {alert['timestamp']})")
+
+drift_scores = db.get_drift_scores()
+if drift_scores['psi'].notna().any():
+    fig_drift = px.bar(
+        drift_scores.dropna(subset=['psi']),
+        x='feature',
+        y='psi',
+        color='status',
+        facet_col='mode',
+        color_discrete_map={'stable': '#4facfe', 'watch': '#fee140', 'drift': '#f5576c'},
+        title='Population Stability Index per Feature (0.1 = watch, 0.2 = drift)'
+    )
+    fig_drift.update_xaxes(matches=None)
+    fig_drift.update_layout(height=400)
+    st.plotly_chart(fig_drift, use_container_width=True)
+    st.dataframe(drift_scores, use_container_width=True, hide_index=True)
+else:
+    st.info("Drift scores need reference histograms (python drift.py export ...) and at least "
+            f"{db.drift.MIN_SAMPLES} assessments per mode.")
+
+st.markdown("---")
+
+# --- SHADOW MODEL AGREEMENT ---
+st.subheader("🌓 Shadow Model Agreement")
+shadow_summary = db.get_shadow_summary()
+if not shadow_summary.empty:
+    total_comparisons = int(shadow_summary['comparisons'].sum())
+    weighted_agreement = (shadow_summary['agreement_pct'] * shadow_summary['comparisons']).sum() / total_comparisons
+    
+    shadow_col1, shadow_col2, shadow_col3 = st.columns(3)
+    with shadow_col1:
+        st.metric("Shadow Comparisons", total_comparisons)
+    with shadow_col2:
+        st.metric("Agreement with Live Model", f"{weighted_agreement:.1f}%")
+    with shadow_col3:
+        st.metric("Worst Probability Delta", f"{shadow_summary['worst_delta'].max():.3f}")
+    
+    st.dataframe(shadow_summary, use_container_width=True, hide_index=True)
+    st.info("💡 **Insight**: Promote a candidate only when agreement is high and disagreements are explained by the retraining.")
+else:
+    st.info("No shadow comparisons yet. Register a '<mode>_candidate' model in models/manifest.json to start shadow scoring.")
+
+rescore_summary = db.get_rescore_summary()
+if not rescore_summary.empty:
+    st.markdown("**🔁 Stored Records Rescored with Newer Models**")
+    st.dataframe(rescore_summary, use_container_width=True, hide_index=True)
+    st.caption("Records keep the prediction of the model that was live when they were saved; "
+               "`python rescore.py <mode>` scores them again with the current model.")
+
+st.markdown("---")
+
+# --- CONFIRMED DIAGNOSES ---
+st.subheader("🧪 Confirmed Diagnoses & Model Updates")
+with st.form("confirm_outcome_form", clear_on_submit=True):
+    confirm_col1, confirm_col2, confirm_col3, confirm_col4 = st.columns(4)
+    with confirm_col1:
+        confirm_mode = st.selectbox("Assessment type", ['clinical', 'lifestyle'], format_func=str.title)
+    with confirm_col2:
+        confirm_id = st.number_input("Record ID", min_value=1, step=1)
+    with confirm_col3:
+        confirm_hba1c = st.number_input("HbA1c (%)", min_value=3.0, max_value=20.0, value=5.5, step=0.1)
+    with confirm_col4:
+        confirm_site = st.selectbox("Site", db.SHARDS) if db.SHARDS else None
+    if st.form_submit_button("✅ Record Confirmed Result"):
+        outcome = db.confirm_outcome(db.PREDICTION_TABLES[confirm_mode], int(confirm_id),
+                                     confirm_hba1c, site=confirm_site)
+        if outcome is None:
+            st.error(f"No {confirm_mode} record with ID {int(confirm_id)}.")
+        else:
+            label = ({1.0: 'Diabetic', 0.0: 'Non-Diabetic'} if confirm_mode == 'clinical' else db.RISK_CLASSES)[outcome]
+            st.success(f"Record {int(confirm_id)} confirmed as {label} (HbA1c {confirm_hba1c:.1f}%).")
+
+model_update_history = db.get_model_updates()
+if not model_update_history.empty:
+    st.dataframe(model_update_history, use_container_width=True, hide_index=True)
+st.caption("`python model_updates.py <mode>` adds trees fit on outcomes confirmed since the last update "
+           "and publishes the grown forest as a new version, evaluated on held-out confirmed records.")
+
+st.markdown("---")
+
+# --- BACKGROUND JOBS ---
+st.subheader("⚙️ Background Jobs")
+import jobs
+job_summary = db.get_job_summary()
+if not job_summary.empty:
+    job_col1, job_col2, job_col3 = st.columns(3)
+    with job_col1:
+        st.metric("Queued", int(job_summary['queued'].sum()))
+    with job_col2:
+        st.metric("Running", int(job_summary['running'].sum()))
+    with job_col3:
+        st.metric("Failed", int(job_summary['failed'].sum()))
+    st.dataframe(job_summary, use_container_width=True, hide_index=True)
+
+with st.form("enqueue_job_form"):
+    queue_col1, queue_col2, queue_col3 = st.columns(3)
+    with queue_col1:
+        queue_task = st.selectbox("Task", sorted(jobs.TASKS))
+    with queue_col2:
+        queue_mode = st.selectbox("Mode (rescore / model update)", ['clinical', 'lifestyle'])
+    with queue_col3:
+        queue_priority = st.number_input("Priority", -100, 100, 5)
+    if st.form_submit_button("➕ Queue Job"):
+        queue_args = {'mode': queue_mode} if queue_task in ('rescore', 'model_update') else {}
+        job_id = jobs.enqueue(queue_task, queue_args, int(queue_priority))
+        st.success(f"Queued job {job_id} ({queue_task}); the worker will pick it up.")
+
+job_schedules = db.get_job_schedules()
+if not job_schedules.empty:
+    st.markdown("**🗓️ Schedules (UTC)**")
+    st.dataframe(job_schedules, use_container_width=True, hide_index=True)
+recent_jobs = db.get_recent_jobs(limit=50)
+if not recent_jobs.empty:
+    st.markdown("**🕒 Recent Jobs**")
+    st.dataframe(recent_jobs, use_container_width=True, hide_index=True)
+st.caption("Maintenance runs in `python worker.py`, outside the app; jobs queued here wait until a worker is running.")
+
+st.markdown("---")
+
+# --- SIMILAR PATIENTS ---
+st.subheader("👥 Similar Patients & Near-Duplicates")
+try:
+    import model_registry
+    import similarity
+    clinical_scaler = model_registry.get_registry().get('clinical').scaler
+except FileNotFoundError:
+    clinical_scaler = None
+
+if clinical_scaler is None:
+    st.info("The clinical scaler is not available, so the similarity index cannot be built.")
+elif df_clinical_all.empty:
+    st.info("No clinical records to compare yet")
+else:
+    similar_col1, similar_col2 = st.columns(2)
+    with similar_col1:
+        reference_id = st.number_input("Clinical record ID", min_value=1, step=1, key="similar_record_id")
+        reference = df_clinical_all[df_clinical_all['id'] == reference_id]
+        if reference.empty:
+            st.caption("Enter the ID of a stored clinical record to list its nearest neighbors.")
+        else:
+            similar = similarity.find_similar(reference[similarity.FEATURES].iloc[0].to_numpy(),
+                                              clinical_scaler, k=6)
+            st.dataframe(similar[similar['id'] != reference_id].head(5), use_container_width=True, hide_index=True)
+    with similar_col2:
+        max_distance = st.slider("Near-duplicate distance (standardized units)", 0.0, 0.5, 0.05, 0.01)
+        if st.button("🔎 Find Near-Duplicate Submissions"):
+            duplicates = similarity.find_near_duplicates(clinical_scaler, max_distance)
+            if duplicates.empty:
+                st.success("No near-duplicate clinical submissions found")
+            else:
+                st.warning(f"{len(duplicates)} pairs of near-identical submissions")
+                st.dataframe(duplicates, use_container_width=True, hide_index=True)
+
 st.markdown("---")
 
 # --- MASTER DATA LOG ---
@@ -465,25 +708,28 @@ with tab1:
     st.subheader("Clinical Assessment Records")
     
     if not df_clinical_all.empty:
-        # Search functionality
+        # Search functionality (answered by the database's search indexes)
         search_col1, search_col2, search_col3 = st.columns(3)
         
         with search_col1:
-            search_id = st.text_input("Search by ID", key="search_clinical_id")
+            search_query = st.text_input("Search by ID, ID range (10-20) or status text", key="search_clinical_id")
         with search_col2:
             min_glucose = st.number_input("Min Glucose", 0, 300, 0, key="min_gluc")
         with search_col3:
             min_bmi = st.number_input("Min BMI", 0, 100, 0, key="min_bmi")
         
         # Filter data
-        filtered_df = df_clinical_all.copy()
-        
-        if search_id:
-            filtered_df = filtered_df[filtered_df['id'].astype(str).str.contains(search_id)]
+        record_id, id_range, search_text = search.parse_search_box(search_query)
+        clinical_filters = {}
         if min_glucose > 0:
-            filtered_df = filtered_df[filtered_df['glucose'] >= min_glucose]
+            clinical_filters['glucose'] = (min_glucose, None)
         if min_bmi > 0:
-            filtered_df = filtered_df[filtered_df['bmi'] >= min_bmi]
+            clinical_filters['bmi'] = (min_bmi, None)
+        
+        if search_query or clinical_filters:
+            filtered_df = db.search_records('clinical', record_id, id_range, search_text, clinical_filters)
+        else:
+            filtered_df = df_clinical_all
         
         # Display
         st.dataframe(
@@ -510,27 +756,28 @@ with tab2:
     st.subheader("Lifestyle Assessment Records")
     
     if not df_lifestyle_all.empty:
-        # Search functionality
+        # Search functionality (answered by the database's search indexes)
         search_col1, search_col2, search_col3 = st.columns(3)
         
         with search_col1:
-            search_id_life = st.text_input("Search by ID", key="search_lifestyle_id")
+            search_query_life = st.text_input("Search by ID, ID range (10-20) or status text", key="search_lifestyle_id")
         with search_col2:
             filter_risk = st.selectbox("Filter by Risk", ["All", "Healthy", "Pre-Diabetic", "Diabetic"], key="filter_risk")
         with search_col3:
             min_bmi_life = st.number_input("Min BMI", 0, 100, 0, key="min_bmi_life")
         
         # Filter data
-        filtered_df_life = df_lifestyle_all.copy()
-        
-        if search_id_life:
-            filtered_df_life = filtered_df_life[filtered_df_life['id'].astype(str).str.contains(search_id_life)]
-        
+        record_id, id_range, search_text = search.parse_search_box(search_query_life)
+        lifestyle_filters = {}
         if filter_risk != "All":
-            filtered_df_life = filtered_df_life[filtered_df_life['risk_class'] == filter_risk]
-        
+            lifestyle_filters['risk_class'] = filter_risk
         if min_bmi_life > 0:
-            filtered_df_life = filtered_df_life[filtered_df_life['bmi'] >= min_bmi_life]
+            lifestyle_filters['bmi'] = (min_bmi_life, None)
+        
+        if search_query_life or lifestyle_filters:
+            filtered_df_life = db.search_records('lifestyle', record_id, id_range, search_text, lifestyle_filters)
+        else:
+            filtered_df_life = df_lifestyle_all
         
         # Display
         st.dataframe(
@@ -565,10 +812,34 @@ with st.expander("⚙️ Database Management & Settings"):
     if confirm:
         if st.button("🗑️ Clear All Records", type="primary"):
             db.clear_all_records()
-            st.success("✅ All records have been deleted!")
+            st.success("✅ All records have been deleted! A snapshot was saved first and can be restored below.")
             st.balloons()
             st.rerun()
     
+    st.markdown("---")
+    st.markdown("### 💾 Backups")
+    st.caption(f"Snapshots are stored in `{os.path.abspath(backup.BACKUP_DIR)}`; "
+               f"the newest {backup.KEEP} per database are kept, plus the newest {backup.KEEP_SAFETY} "
+               f"taken before a clear or restore.")
+    
+    if st.button("💾 Take Snapshot Now"):
+        with st.spinner("Backing up..."):
+            written = backup.snapshot('manual')
+        st.success(f"✅ Wrote {len(written)} snapshot(s)")
+    
+    backups = backup.list_backups()
+    if backups:
+        st.dataframe(pd.DataFrame(backups), use_container_width=True, hide_index=True)
+        restore_file = st.selectbox("Snapshot to restore", [b['file'] for b in backups])
+        confirm_restore = st.checkbox("Replace the current database with this snapshot")
+        if confirm_restore and st.button("♻️ Restore Snapshot"):
+            with st.spinner("Restoring..."):
+                backup.restore(restore_file)
+            st.success(f"✅ Restored {restore_file} (the previous state was snapshotted first)")
+            st.rerun()
+    else:
+        st.info("No snapshots yet")
+    
     st.markdown("---")
     st.markdown("### 🔐 Change Admin Password")
     st.write("Use the password hash generator below:")
@@ -1,11 +1,13 @@
+import os
+import threading
 import streamlit as st
-import pandas as pd
-import pickle
-import numpy as np
 import database as db
 from logic import get_clinical_advice, get_lifestyle_advice
 
-# Initialize the DB once when app starts
+# numpy, pickle and the models are loaded on demand so the home page renders
+# without paying for them. See profile_startup.py for the import-time budget.
+
+# Initialize the DB once per server process (a no-op on reruns)
 db.init_db()
 
 # --- PAGE CONFIGURATION ---
@@ -15,20 +17,300 @@ st.set_page_config(page_title="Diabetes Prediction System", layout="wide")
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
 
-# --- LOAD MODELS & SCALERS ---
+# --- LOAD MODELS & SCALERS (lazily, per mode, via the model registry) ---
+@st.cache_resource
+def get_model_registry():
+    import model_registry
+    return model_registry.get_registry()
+
+@st.cache_resource
+def get_explainer(key, version, _model):
+    """Attribution tables for one model version (built once, then reused)."""
+    import attributions
+    return attributions.ForestExplainer(_model)
+
+def warm_up_models():
+    """Load both models and run one dummy prediction each to fill cold caches."""
+    import numpy as np
+    registry = get_model_registry()
+    for key, n_features in (('clinical', 8), ('lifestyle', 10)):
+        try:
+            entry = registry.get(key)
+            entry.model.predict_proba(entry.scaler.transform(np.zeros((1, n_features))))
+        except Exception as e:
+            print(f"Model warm-up skipped: {e}")
+
+@st.cache_resource
+def start_background_warm_up():
+    """Start the warm-up thread once per server process."""
+    thread = threading.Thread(target=warm_up_models, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# --- PATIENT IDENTITY & HISTORY HELPERS ---
+def get_patient_id():
+    """Optional patient identifier; only its hash is stored or queried."""
+    patient_ref = st.text_input(
+        "Patient ID (optional)",
+        key="patient_ref",
+        help="Your clinic or patient number. It is stored only as a secure hash and lets you see your own history."
+    )
+    if not patient_ref:
+        return None
+    try:
+        return db.hash_patient_id(patient_ref)
+    except RuntimeError:
+        st.warning("Patient IDs are disabled until the administrator sets DIABETES_PATIENT_ID_SALT. "
+                   "This assessment will be saved without a Patient ID.")
+        return None
+
+def get_submission_key(mode, inputs):
+    """
+    Idempotency key for submitting these inputs from this session (see
+    db.submission_key). The submission number only advances when the inputs
+    differ from the mode's previous submission.
+    """
+    if 'session_key' not in st.session_state:
+        import uuid
+        st.session_state.session_key = uuid.uuid4().hex
+    submissions = st.session_state.setdefault('submissions', {})
+    number, last_inputs = submissions.get(mode, (0, None))
+    if inputs != last_inputs:
+        number += 1
+        submissions[mode] = (number, inputs)
+    return db.submission_key(mode, st.session_state.session_key, number)
+
+def get_cached_history(mode, patient_id):
+    """A patient's recent history, cached in this session until it saves a new assessment."""
+    cache = st.session_state.setdefault('history_cache', {})
+    if (mode, patient_id) not in cache:
+        cache[(mode, patient_id)] = {
+            'history': db.get_patient_history(mode, patient_id, limit=50),
+            'figure': None
+        }
+    return cache[(mode, patient_id)]
+
+def invalidate_history(mode):
+    """Drop this session's cached histories for a mode."""
+    cache = st.session_state.get('history_cache', {})
+    for key in [key for key in cache if key[0] == mode]:
+        del cache[key]
+
+def show_trend_chart(cached, labels):
+    """Line chart of a patient's measurements over time (built once per cached history)."""
+    if cached['figure'] is None:
+        import plotly.express as px
+        trend = cached['history'].sort_values('timestamp').rename(columns=labels)
+        fig = px.line(trend, x='timestamp', y=list(labels.values()), markers=True,
+                      labels={'timestamp': 'Date', 'value': 'Value', 'variable': 'Measure'})
+        fig.update_layout(height=320, margin=dict(t=20, b=20))
+        cached['figure'] = fig
+    st.plotly_chart(cached['figure'], use_container_width=True)
+
+def show_saved_notice(saved, what="This assessment has"):
+    if saved:
+        st.info(f"✅ {what} been saved to your records.")
+    else:
+        st.info(f"ℹ️ {what} already been saved; the repeated submission was not stored again.")
+
+def show_result_header(status, saved):
+    st.divider()
+    if "DIABETIC" in status:
+        st.error(f"### {status}")
+    elif "PRE-DIABETIC" in status:
+        st.warning(f"### {status}")
+    else:
+        st.success(f"### {status}")
+    show_saved_notice(saved)
+
+# --- HISTORY & RESULT PANELS ---
+# Fragments, so interacting with them reruns only the panel, and the history
+# comes from the session cache instead of the database on every rerun.
+@st.fragment
+def show_clinical_history(patient_id):
+    with st.expander("📜 View Your Recent Clinical Records (Last 5)"):
+        cached = get_cached_history('clinical', patient_id) if patient_id else None
+        if cached is None:
+            st.info("Enter your Patient ID above to see your own assessment history.")
+        elif not cached['history'].empty:
+            clinical_history = cached['history']
+            if len(clinical_history) > 1:
+                show_trend_chart(cached, {
+                    'glucose': 'Glucose (mg/dL)', 'bmi': 'BMI', 'risk_percentage': 'Risk (%)'
+                })
+            for idx, row in clinical_history.head(5).iterrows():
+                status_emoji = "🚨" if row['prediction'] == 1 else "✅"
+                st.markdown(f"""
+                <div class="history-card">
+                    <strong>{status_emoji} {row['timestamp']}</strong><br>
+                    Status: {row['status']}<br>
+                    Glucose: {row['glucose']} mg/dL | BMI: {row['bmi']} | Age: {row['age']} years<br>
+                    Risk: {row['risk_percentage']}%
+                </div>
+                """, unsafe_allow_html=True)
+        else:
+            st.info("No previous records found. Complete an assessment to start tracking your history!")
+
+@st.fragment
+def show_lifestyle_history(patient_id):
+    with st.expander("📜 View Your Recent Lifestyle Records (Last 5)"):
+        cached = get_cached_history('lifestyle', patient_id) if patient_id else None
+        if cached is None:
+            st.info("Enter your Patient ID above to see your own assessment history.")
+        elif not cached['history'].empty:
+            lifestyle_history = cached['history']
+            if len(lifestyle_history) > 1:
+                show_trend_chart(cached, {
+                    'bmi': 'BMI', 'prediction': 'Risk Level (0=Healthy, 2=Diabetic)'
+                })
+            for idx, row in lifestyle_history.head(5).iterrows():
+                if row['prediction'] == 2.0:
+                    status_emoji = "🚨"
+                elif row['prediction'] == 1.0:
+                    status_emoji = "⚠️"
+                else:
+                    status_emoji = "✅"
+                
+                st.markdown(f"""
+                <div class="history-card">
+                    <strong>{status_emoji} {row['timestamp']}</strong><br>
+                    Status: {row['status']}<br>
+                    BMI: {row['bmi']} | Risk Class: {row['risk_class']}
+                </div>
+                """, unsafe_allow_html=True)
+        else:
+            st.info("No previous records found. Complete an assessment to start tracking your history!")
+
+def keep_result(mode, inputs):
+    """The session's last result for a mode, dropped once the inputs change."""
+    result = st.session_state.get(f'{mode}_result')
+    if result is not None and result['inputs'] != inputs:
+        del st.session_state[f'{mode}_result']
+
+@st.fragment
+def show_clinical_result():
+    result = st.session_state.get('clinical_result')
+    if result is None:
+        return
+    show_result_header(result['status'], result['saved'])
+    
+    st.subheader("🔍 Why this result?")
+    for r in result['reasons']:
+        st.write(f"- {r}")
+    
+    st.subheader("💡 Recommended Health Tips")
+    for t in result['tips']:
+        st.write(f"{t}")
+    
+    similar = result['similar']
+    if not similar.empty:
+        st.subheader("👥 Similar Past Assessments")
+        st.caption("The stored clinical assessments closest to yours (distance 0 means identical inputs).")
+        similar_view = similar[['timestamp', 'glucose', 'bmi', 'age', 'blood_pressure', 'status', 'distance']]
+        st.dataframe(similar_view.round({'distance': 3}), use_container_width=True, hide_index=True)
+
+@st.fragment
+def show_lifestyle_result():
+    result = st.session_state.get('lifestyle_result')
+    if result is None:
+        return
+    show_result_header(result['status'], result['saved'])
+    
+    # Display Explanations
+    st.subheader("🔍 Why this result?")
+    if result['reasons']:
+        for r in result['reasons']:
+            st.write(f"- {r}")
+    else:
+        st.write("- Your lifestyle habits indicate low vulnerability at this time.")
+    
+    # Display Tips
+    st.subheader("💡 Recommended Lifestyle Changes")
+    for t in result['tips']:
+        st.write(f"{t}")
+
+@st.fragment
+def show_whatif(mode):
+    """What-if curve or heatmap for the last result, scored as one batch (see whatif.py)."""
+    result = st.session_state.get(f'{mode}_result')
+    if result is None:
+        return
+    import time
+    import whatif
+    st.subheader("🔮 What If?")
+    st.caption("See how your risk changes if one or two of your values were different. Everything else stays as you entered it.")
+    labels = {feature: spec[0] for feature, spec in whatif.RANGES[mode].items()}
+    col1, col2 = st.columns(2)
+    with col1:
+        first = st.selectbox("Vary", list(labels), format_func=labels.get, key=f'whatif_{mode}_first')
+    with col2:
+        second = st.selectbox("...and (optional)", [None] + [f for f in labels if f != first],
+                              format_func=lambda f: "Nothing else" if f is None else labels[f],
+                              key=f'whatif_{mode}_second')
+    variations = [(feature, whatif.grid_values(mode, feature)) for feature in (first, second) if feature]
+    
+    started = time.perf_counter()
+    entry = get_model_registry().get(mode)
+    risk = whatif.risk_grid(entry, mode, result['features'], variations)
+    fig = whatif.figure(mode, result['features'], variations, risk)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{risk.size} variations scored in {elapsed_ms:.0f} ms. "
+               "This is a model estimate, not a treatment target — discuss changes with your doctor.")
+
+@st.fragment
+def show_combined_result():
+    result = st.session_state.get('combined_result')
+    if result is None:
+        return
+    summary = result['summary']
+    st.divider()
+    if summary['level'] == 2:
+        st.error(f"### {summary['title']} ({summary['risk_percent']}% combined risk)")
+    elif summary['level'] == 1:
+        st.warning(f"### {summary['title']} ({summary['risk_percent']}% combined risk)")
+    else:
+        st.success(f"### {summary['title']} ({summary['risk_percent']}% combined risk)")
+    st.write(summary['explanation'])
+    if not summary['agree']:
+        st.caption("The two assessments disagree; the higher risk is shown.")
+    show_saved_notice(result['saved'], "Both assessments have")
+
+    col1, col2 = st.columns(2)
+    for col, title, engine in ((col1, "🏥 Clinical", result['clinical']), (col2, "🥗 Lifestyle", result['lifestyle'])):
+        with col:
+            st.subheader(title)
+            st.write(f"**{engine['status']}**")
+            for r in engine['reasons']:
+                st.write(f"- {r}")
+
+    st.subheader("💡 Recommended Health Tips")
+    for t in summary['tips']:
+        st.write(f"{t}")
+    how = "in parallel" if result['parallel'] else "one after the other"
+    st.caption(f"Scored in {result['ms']:.0f} ms (clinical {result['clinical']['ms']:.0f} ms, "
+               f"lifestyle {result['lifestyle']['ms']:.0f} ms, run {how}).")
+
+# Opt-in (DIABETES_WARMUP=1): warming loads both models at start-up, which is
+# exactly what lazy loading avoids, so only enable it where the first
+# assessment's latency matters more than memory and start-up time.
+if os.environ.get('DIABETES_WARMUP', '0') == '1':
+    start_background_warm_up()
+
+@st.cache_resource
+def start_backup_scheduler():
+    """Start scheduled snapshots once per server process (DIABETES_BACKUP_INTERVAL seconds)."""
+    import backup
+    return backup.start_scheduler()
+
+if os.environ.get('DIABETES_BACKUP_INTERVAL', '0') != '0':
+    start_backup_scheduler()
+
 @st.cache_resource
-def load_assets():
-    with open('../models/pima_model.pkl', 'rb') as f:
-        p_model = pickle.load(f)
-    with open('../models/pima_scaler.pkl', 'rb') as f:
-        p_scaler = pickle.load(f)
-    with open('../models/cdc_model.pkl', 'rb') as f:
-        c_model = pickle.load(f)
-    with open('../models/cdc_scaler.pkl', 'rb') as f:  # Add this line
-        c_scaler = pickle.load(f)
-    return p_model, p_scaler, c_model, c_scaler
-
-p_model, p_scaler, c_model, c_scaler = load_assets()
+def start_engine_processes():
+    """Start the combined page's engine processes once per server process, in the background."""
+    import combined
+    combined.warm()
 
 # --- CUSTOM CSS FOR BETTER STYLING ---
 st.markdown("""
@@ -148,7 +430,13 @@ if st.session_state.page == 'home':
         if st.button("🥗 Start Lifestyle Assessment", use_container_width=True, type="primary"):
             st.session_state.page = 'lifestyle'
             st.rerun()
-    
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    st.write("Have both lab results and a few minutes for the lifestyle questions? Run both assessments at once for one combined risk summary.")
+    if st.button("🔗 Start Combined Assessment", use_container_width=True):
+        st.session_state.page = 'combined'
+        st.rerun()
+
     # Footer
     st.markdown("---")
 
@@ -164,22 +452,10 @@ elif st.session_state.page == 'clinical':
     st.header("🏥 Clinical Assessment (Lab-based)")
     st.write("Please enter the values from your clinical report.")
     
-    # Show previous records
-    with st.expander("📜 View Your Recent Clinical Records (Last 5)"):
-        recent_clinical = db.get_last_clinical_records(5)
-        if not recent_clinical.empty:
-            for idx, row in recent_clinical.iterrows():
-                status_emoji = "🚨" if row['prediction'] == 1 else "✅"
-                st.markdown(f"""
-                <div class="history-card">
-                    <strong>{status_emoji} {row['timestamp']}</strong><br>
-                    Status: {row['status']}<br>
-                    Glucose: {row['glucose']} mg/dL | BMI: {row['bmi']} | Age: {row['age']} years<br>
-                    Risk: {row['risk_percentage']}%
-                </div>
-                """, unsafe_allow_html=True)
-        else:
-            st.info("No previous records found. Complete an assessment to start tracking your history!")
+    patient_id = get_patient_id()
+    
+    # Show previous records (only this patient's)
+    show_clinical_history(patient_id)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -224,7 +500,15 @@ elif st.session_state.page == 'clinical':
 
     st.markdown("<br>", unsafe_allow_html=True)
     
+    keep_result('clinical', (preg, gluc, bp, skin, ins, bmi, pedi, age, patient_id))
+    
     if st.button("🔬 Analyze Clinical Risk", use_container_width=True, type="primary"):
+        import numpy as np
+        # Hold on to this entry for the whole request; a hot reload swaps in a
+        # new one for later requests without affecting this one
+        clinical_entry = get_model_registry().get('clinical')
+        p_model, p_scaler = clinical_entry.model, clinical_entry.scaler
+        
         # 1. Prepare data & Scale
         features = np.array([[preg, gluc, bp, skin, ins, bmi, pedi, age]])
         features_scaled = p_scaler.transform(features)
@@ -236,11 +520,21 @@ elif st.session_state.page == 'clinical':
         # 3. Convert to percentage
         risk_percent = round(prob_scores[1] * 100, 2)
         
-        # 4. Get advice
-        status, reasons, tips = get_clinical_advice(prediction, features[0], risk_percent)
+        # Compare against a candidate model in the background, if one is registered
+        import shadow
+        shadow.submit('clinical', features, prediction, prob_scores, clinical_entry.version)
+        
+        # 4. Get advice, ranking the reasons by what the forest actually used
+        explainer = get_explainer('clinical', clinical_entry.version, p_model)
+        contributions = explainer.risk_contributions(features_scaled, [1])[0]
+        status, reasons, tips = get_clinical_advice(prediction, features[0], risk_percent, contributions)
+        
+        # Look up comparable past assessments before saving, so this one is not its own match
+        import similarity
+        similar = similarity.find_similar(features[0], p_scaler, k=5)
         
-        # 5. Save to database
-        db.save_clinical_prediction(
+        # 5. Save to database (nothing is saved for a repeated submission)
+        saved = db.save_clinical_prediction(
             pregnancies=int(preg),
             glucose=float(gluc),
             blood_pressure=float(bp),
@@ -251,28 +545,23 @@ elif st.session_state.page == 'clinical':
             age=int(age),
             prediction=int(prediction),
             risk_percentage=float(risk_percent),
-            status=status
+            status=status,
+            model_version=clinical_entry.version,
+            patient_id=patient_id,
+            idempotency_key=get_submission_key('clinical', (preg, gluc, bp, skin, ins, bmi, pedi, age, patient_id))
         )
         
-        st.divider()
-        
-        # 6. Display Result
-        if "DIABETIC" in status:
-            st.error(f"### {status}")
-        elif "PRE-DIABETIC" in status:
-            st.warning(f"### {status}")
-        else:
-            st.success(f"### {status}")
+        invalidate_history('clinical')
         
-        st.info("✅ This assessment has been saved to your records.")
-        
-        st.subheader("🔍 Why this result?")
-        for r in reasons:
-            st.write(f"- {r}")
-        
-        st.subheader("💡 Recommended Health Tips")
-        for t in tips:
-            st.write(f"{t}")
+        # 6. Keep the result for the result panel until the inputs change
+        st.session_state.clinical_result = {
+            'inputs': (preg, gluc, bp, skin, ins, bmi, pedi, age, patient_id),
+            'status': status, 'reasons': reasons, 'tips': tips, 'similar': similar,
+            'features': features[0].tolist(), 'saved': saved
+        }
+    
+    show_clinical_result()
+    show_whatif('clinical')
 
 # =============================================================================
 # LIFESTYLE MODE PAGE
@@ -286,27 +575,10 @@ elif st.session_state.page == 'lifestyle':
     st.header("🥗 General Health & Lifestyle Assessment")
     st.write("Answer the following questions about your lifestyle and health habits.")
     
-    # Show previous records
-    with st.expander("📜 View Your Recent Lifestyle Records (Last 5)"):
-        recent_lifestyle = db.get_last_lifestyle_records(5)
-        if not recent_lifestyle.empty:
-            for idx, row in recent_lifestyle.iterrows():
-                if row['prediction'] == 2.0:
-                    status_emoji = "🚨"
-                elif row['prediction'] == 1.0:
-                    status_emoji = "⚠️"
-                else:
-                    status_emoji = "✅"
-                
-                st.markdown(f"""
-                <div class="history-card">
-                    <strong>{status_emoji} {row['timestamp']}</strong><br>
-                    Status: {row['status']}<br>
-                    BMI: {row['bmi']} | Risk Class: {row['risk_class']}
-                </div>
-                """, unsafe_allow_html=True)
-        else:
-            st.info("No previous records found. Complete an assessment to start tracking your history!")
+    patient_id = get_patient_id()
+    
+    # Show previous records (only this patient's)
+    show_lifestyle_history(patient_id)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -375,7 +647,13 @@ elif st.session_state.page == 'lifestyle':
 
     st.markdown("<br>", unsafe_allow_html=True)
     
+    keep_result('lifestyle', (hp, hc, bmi_c, smoke, act, fruit, veg, alc, gen, men, patient_id))
+    
     if st.button("🔍 Assess Lifestyle Risk", use_container_width=True, type="primary"):
+        import numpy as np
+        lifestyle_entry = get_model_registry().get('lifestyle')
+        c_model, c_scaler = lifestyle_entry.model, lifestyle_entry.scaler
+        
         # Convert inputs (radio buttons always have a value)
         hp_val = 1 if hp == "Yes" else 0
         hc_val = 1 if hc == "Yes" else 0
@@ -392,11 +670,17 @@ elif st.session_state.page == 'lifestyle':
         prediction = c_model.predict(inputs_scaled)[0]
         prob_scores = c_model.predict_proba(inputs_scaled)[0]
         
+        # Compare against a candidate model in the background, if one is registered
+        import shadow
+        shadow.submit('lifestyle', inputs, prediction, prob_scores, lifestyle_entry.version)
+        
         # Convert to percentages
         risk_percents = [round(p * 100, 2) for p in prob_scores]
         
-        # Get advice
-        status, reasons, tips = get_lifestyle_advice(prediction, inputs[0], risk_percents)
+        # Get advice, ranking the reasons by what the forest actually used
+        explainer = get_explainer('lifestyle', lifestyle_entry.version, c_model)
+        contributions = explainer.risk_contributions(inputs_scaled, [1.0, 2.0])[0]
+        status, reasons, tips = get_lifestyle_advice(prediction, inputs[0], risk_percents, contributions)
         
         # Determine risk class for database
         if prediction == 2.0:
@@ -406,8 +690,8 @@ elif st.session_state.page == 'lifestyle':
         else:
             risk_class = "Healthy"
         
-        # Save to database
-        db.save_lifestyle_prediction(
+        # Save to database (nothing is saved for a repeated submission)
+        saved = db.save_lifestyle_prediction(
             high_bp=hp_val,
             high_chol=hc_val,
             bmi=float(bmi_c),
@@ -420,33 +704,124 @@ elif st.session_state.page == 'lifestyle':
             mental_health=men,
             prediction=float(prediction),
             risk_class=risk_class,
-            status=status
+            status=status,
+            model_version=lifestyle_entry.version,
+            patient_id=patient_id,
+            idempotency_key=get_submission_key('lifestyle', (hp, hc, bmi_c, smoke, act, fruit, veg, alc, gen, men, patient_id))
         )
         
-        st.divider() 
+        invalidate_history('lifestyle')
         
-        # Display Result with Color Coding
-        if "DIABETIC" in status:
-            st.error(f"### {status}")
-        elif "PRE-DIABETIC" in status:
-            st.warning(f"### {status}")
-        else:
-            st.success(f"### {status}")
+        # Keep the result for the result panel until the inputs change
+        st.session_state.lifestyle_result = {
+            'inputs': (hp, hc, bmi_c, smoke, act, fruit, veg, alc, gen, men, patient_id),
+            'status': status, 'reasons': reasons, 'tips': tips,
+            'features': inputs[0].tolist(), 'saved': saved
+        }
+    
+    show_lifestyle_result()
+    show_whatif('lifestyle')
 
-        st.info("✅ This assessment has been saved to your records.")
+# =============================================================================
+# COMBINED ASSESSMENT PAGE
+# =============================================================================
+elif st.session_state.page == 'combined':
+    # Home Button
+    if st.button("🏠 Back to Home", type="secondary"):
+        st.session_state.page = 'home'
+        st.rerun()
 
-        # Display Explanations
-        st.subheader("🔍 Why this result?")
-        if reasons:
-            for r in reasons:
-                st.write(f"- {r}")
-        else:
-            st.write("- Your lifestyle habits indicate low vulnerability at this time.")
+    # Loads the lifestyle engine while the form is being filled in
+    start_engine_processes()
+
+    st.header("🔗 Combined Assessment (Clinical + Lifestyle)")
+    st.write("Enter your clinical report values and answer the lifestyle questions. Both models score them together.")
+
+    patient_id = get_patient_id()
+
+    # Show previous records (only this patient's)
+    show_clinical_history(patient_id)
+    show_lifestyle_history(patient_id)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    st.subheader("🏥 Clinical Report")
+    col1, col2 = st.columns(2)
+    with col1:
+        preg = st.number_input("Pregnancies", 0, 20, 0,
+                               help="Number of times the patient has been pregnant.")
+        gluc = st.number_input("Glucose Level (mg/dL)", 0, 300, 100,
+                               help="Plasma glucose concentration (2 hours in an oral glucose tolerance test).")
+        bp = st.number_input("Blood Pressure (mmHg)", 0, 150, 70,
+                             help="Diastolic blood pressure (the bottom number of a blood pressure reading).")
+        skin = st.number_input("Skin Thickness (mm)", 0, 100, 20,
+                               help="Thickness of the skin at the triceps, measured in millimeters. Used as an indicator of body fat.")
+    with col2:
+        ins = st.number_input("Insulin Level (mu U/ml)", 0, 900, 80,
+                               help="2-Hour serum insulin levels. High levels may indicate insulin resistance.")
+        bmi = st.number_input("BMI (Body Mass Index)", 10.0, 70.0, 25.0,
+                               help="Weight in kg divided by (height in meters squared). Used by both assessments.")
+        pedi = st.number_input("Diabetes Pedigree Function", 0.0, 3.0, 0.5,
+                               help="This number represents how likely you are to develop diabetes based on your family's medical history.")
+        age = st.number_input("Age", 1, 120, 30,
+                               help="Current age of the user in years.")
+
+    st.subheader("🥗 Lifestyle & Health History")
+    col1, col2 = st.columns(2)
+    with col1:
+        hp = st.radio("Do you have High Blood Pressure?", ["No", "Yes"], horizontal=True,
+                      help="Have you ever been told by a doctor that you have high blood pressure?")
+        hc = st.radio("Do you have High Cholesterol?", ["No", "Yes"], horizontal=True,
+                      help="Have you ever been told by a doctor that you have high cholesterol?")
+        smoke = st.radio("Have you smoked >100 cigarettes in your lifetime?", ["No", "Yes"], horizontal=True,
+                        help="Have you smoked at least 100 cigarettes in your entire life?")
+        act = st.radio("Physical activity in last 30 days?", ["No", "Yes"], horizontal=True,
+                       help="Any exercise or physical activity other than your regular job.")
+        fruit = st.radio("Do you eat fruits daily?", ["No", "Yes"], horizontal=True,
+                        help="Do you consume fruit 1 or more times per day?")
+    with col2:
+        veg = st.radio("Do you eat vegetables daily?", ["No", "Yes"], horizontal=True,
+                      help="Do you consume vegetables 1 or more times per day?")
+        alc = st.radio("Are you a heavy drinker?", ["No", "Yes"], horizontal=True,
+                      help="Men: >14 drinks/week. Women: >7 drinks/week.")
+        gen = st.slider("General Health (1=Excellent, 5=Poor)", 1, 5, 3,
+                        help="How would you rate your general health in the last month?")
+        men = st.slider("Mental health 'not good' days", 0, 30, 0,
+                        help="Number of days in the last 30 days your mental health was not good.")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    keep_result('combined', (preg, gluc, bp, skin, ins, bmi, pedi, age,
+                             hp, hc, smoke, act, fruit, veg, alc, gen, men, patient_id))
+
+    if st.button("🔗 Run Combined Assessment", use_container_width=True, type="primary"):
+        import combined
+        clinical_inputs = {
+            'pregnancies': int(preg), 'glucose': float(gluc), 'blood_pressure': float(bp),
+            'skin_thickness': float(skin), 'insulin': float(ins), 'bmi': float(bmi),
+            'diabetes_pedigree': float(pedi), 'age': int(age),
+        }
+        lifestyle_inputs = {
+            'high_bp': int(hp == "Yes"), 'high_chol': int(hc == "Yes"), 'bmi': float(bmi),
+            'smoker': int(smoke == "Yes"), 'physical_activity': int(act == "Yes"),
+            'fruits': int(fruit == "Yes"), 'vegetables': int(veg == "Yes"),
+            'heavy_alcohol': int(alc == "Yes"), 'general_health': gen, 'mental_health': men,
+        }
+        # The lifestyle engine runs in an engine process where there is a core
+        # for it (see combined.py); both records are saved in one transaction
+        combined_inputs = (preg, gluc, bp, skin, ins, bmi, pedi, age,
+                           hp, hc, smoke, act, fruit, veg, alc, gen, men, patient_id)
+        result = combined.assess(get_model_registry(), clinical_inputs, lifestyle_inputs,
+                                 explainer_for=get_explainer, patient_id=patient_id,
+                                 idempotency_key=get_submission_key('combined', combined_inputs))
+
+        invalidate_history('clinical')
+        invalidate_history('lifestyle')
+
+        # Keep the result for the result panel until the inputs change
+        st.session_state.combined_result = {'inputs': combined_inputs, **result}
 
-        # Display Tips
-        st.subheader("💡 Recommended Lifestyle Changes")
-        for t in tips:
-            st.write(f"{t}")
+    show_combined_result()
 
 # --- FOOTER (shown on all pages) ---
 st.markdown("---")
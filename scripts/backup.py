@@ -0,0 +1,248 @@
+"""
+Online backups of the records database.
+
+Snapshots use SQLite's online backup API, copying PAGES_PER_STEP pages at a
+time and sleeping briefly between steps, so writers are only held up for one
+step instead of the whole copy (a plain file copy can also catch a half-written
+page). Each snapshot is gzip-compressed into BACKUP_DIR as
+<database>-<YYYYmmdd-HHMMSSffffff>-<reason>.db.gz and only the newest KEEP
+generations per database are kept. The safety snapshots taken before a
+destructive operation ('preclear', 'prerestore') are counted separately and
+KEEP_SAFETY of them are kept, so routine snapshots never push them out. A
+scheduled snapshot is skipped when the database has not changed since the
+previous one.
+
+With sharding on (see database.SHARDS) every shard file is backed up too.
+
+    python backup.py snapshot            # on-demand snapshot
+    python backup.py list
+    python backup.py restore <file.db.gz>
+    python backup.py prune
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+import database as db
+
+BACKUP_DIR = os.environ.get('DIABETES_BACKUP_DIR',
+                            os.path.join(os.path.dirname(__file__), '..', 'backups'))
+KEEP = int(os.environ.get('DIABETES_BACKUP_KEEP', '7'))
+KEEP_SAFETY = int(os.environ.get('DIABETES_BACKUP_KEEP_SAFETY', '3'))
+SAFETY_REASONS = ('preclear', 'prerestore')
+# Scheduled snapshot interval in seconds (0 disables the scheduler)
+INTERVAL_SECONDS = int(os.environ.get('DIABETES_BACKUP_INTERVAL', '0'))
+PAGES_PER_STEP = 256
+STEP_SLEEP_SECONDS = 0.005
+
+_INDEX_NAME = 'index.json'
+_lock = threading.Lock()
+_scheduler = None
+
+
+def _database_paths():
+    """Every database file to back up (the main file plus any shards)."""
+    paths = [db.DB_PATH] + [path for _, path in db._shard_paths() if path != db.DB_PATH]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _read_index():
+    try:
+        with open(os.path.join(BACKUP_DIR, _INDEX_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_index(index):
+    path = os.path.join(BACKUP_DIR, _INDEX_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def copy_online(source_path, target_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP_SECONDS):
+    """Copy a live database with the online backup API, a few pages per step."""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _unique_name(stem, reason):
+    """(name, path) for a new snapshot, to the microsecond and never an existing file."""
+    while True:
+        name = f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S%f')}-{reason}.db.gz"
+        target = os.path.join(BACKUP_DIR, name)
+        if not os.path.exists(target):
+            return name, target
+
+
+def snapshot(reason='manual', skip_unchanged=False):
+    """
+    Back up every database file. Returns the list of snapshot files written
+    (unchanged databases are skipped when skip_unchanged is set).
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    written = []
+    with _lock:
+        index = _read_index()
+        for path in _database_paths():
+            stem = _stem(path)
+            fd, raw_path = tempfile.mkstemp(suffix='.db', dir=BACKUP_DIR)
+            os.close(fd)
+            try:
+                copy_online(path, raw_path)
+                checksum = _file_sha256(raw_path)
+                if skip_unchanged and index.get(stem, {}).get('sha256') == checksum:
+                    continue
+                name, target = _unique_name(stem, reason)
+                with open(raw_path, 'rb') as src, gzip.open(target + '.tmp', 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(target + '.tmp', target)
+                index[stem] = {'sha256': checksum, 'latest': name}
+                written.append(target)
+            finally:
+                os.remove(raw_path)
+        _write_index(index)
+        prune()
+    return written
+
+
+def list_backups():
+    """Snapshots on disk, newest first, as dicts (file, database, created, reason, size)."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for name in os.listdir(BACKUP_DIR):
+        if not name.endswith('.db.gz'):
+            continue
+        stem, date, time_of_day, reason = name[:-len('.db.gz')].rsplit('-', 3)
+        # Snapshots from before microsecond names have HHMMSS
+        time_format = '%H%M%S%f' if len(time_of_day) > 6 else '%H%M%S'
+        backups.append({
+            'file': name,
+            'database': stem,
+            'created': datetime.strptime(f'{date}{time_of_day}', f'%Y%m%d{time_format}'),
+            'reason': reason,
+            'size_kb': round(os.path.getsize(os.path.join(BACKUP_DIR, name)) / 1024, 1),
+        })
+    # Older names can share a second (e.g. preclear right after manual)
+    return sorted(backups, key=lambda b: (b['created'], os.path.getmtime(os.path.join(BACKUP_DIR, b['file']))),
+                  reverse=True)
+
+
+def prune(keep=None, keep_safety=None):
+    """
+    Delete all but the newest `keep` routine snapshots and the newest
+    `keep_safety` safety snapshots (SAFETY_REASONS) of each database.
+    """
+    limits = {False: KEEP if keep is None else keep,
+              True: KEEP_SAFETY if keep_safety is None else keep_safety}
+    seen = {}
+    removed = []
+    for backup in list_backups():
+        group = (backup['database'], backup['reason'] in SAFETY_REASONS)
+        seen[group] = seen.get(group, 0) + 1
+        if seen[group] > limits[group[1]]:
+            os.remove(os.path.join(BACKUP_DIR, backup['file']))
+            removed.append(backup['file'])
+    return removed
+
+
+def restore(backup_file):
+    """
+    Restore one database from a snapshot. The snapshot is decompressed first
+    (the prerestore snapshot prunes, which may remove the source), then the
+    current contents are saved as a 'prerestore' snapshot and the snapshot is
+    copied into the live file through the backup API so open connections stay
+    valid.
+    """
+    name = os.path.basename(backup_file)
+    source = backup_file if os.path.exists(backup_file) else os.path.join(BACKUP_DIR, name)
+    stem = name[:-len('.db.gz')].rsplit('-', 3)[0]
+    targets = {_stem(path): path for path in [db.DB_PATH] + [p for _, p in db._shard_paths()]}
+    if stem not in targets:
+        raise ValueError(f"Backup '{name}' does not belong to a configured database")
+    target = targets[stem]
+
+    fd, raw_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        with gzip.open(source, 'rb') as src, open(raw_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        if os.path.exists(target):
+            snapshot('prerestore')
+        generations = db.get_record_generations(target) if os.path.exists(target) else {}
+        copy_online(raw_path, target)
+    finally:
+        os.remove(raw_path)
+    # Bring an older snapshot up to the current schema and tell row caches
+    # that the contents were replaced: the snapshot's generation can be at or
+    # below the live one they hold, so move past both
+    db._init_database(target)
+    db.mark_records_changed(target, generations)
+    return target
+
+
+def _run_scheduler(interval, stop_event):
+    while not stop_event.wait(interval):
+        try:
+            snapshot('scheduled', skip_unchanged=True)
+        except Exception as e:
+            print(f"Scheduled backup failed: {e}")
+
+
+def start_scheduler(interval=None):
+    """Take a snapshot every `interval` seconds in a daemon thread (once per process)."""
+    global _scheduler
+    interval = INTERVAL_SECONDS if interval is None else interval
+    if interval <= 0 or _scheduler is not None:
+        return _scheduler
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_run_scheduler, args=(interval, stop_event),
+                              name='db-backup', daemon=True)
+    thread.stop_event = stop_event
+    thread.start()
+    _scheduler = thread
+    return thread
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'snapshot':
+        for path in snapshot('manual'):
+            print(f"Wrote {path}")
+    elif command == 'list':
+        for backup in list_backups():
+            print(f"{backup['file']}  {backup['size_kb']} KB")
+    elif command == 'restore' and len(sys.argv) == 3:
+        print(f"Restored {restore(sys.argv[2])}")
+    elif command == 'prune':
+        for name in prune():
+            print(f"Removed {name}")
+    else:
+        print("Usage: python backup.py snapshot | list | restore <file.db.gz> | prune")
+        sys.exit(1)
@@ -0,0 +1,69 @@
+"""
+Server time per Streamlit rerun of app.py.
+
+Uses Streamlit's AppTest harness against a temporary database seeded with a
+patient's history, opens the lifestyle page with that patient's ID, then
+nudges the General Health slider repeatedly and times each rerun (script
+execution on the server, no browser).
+
+Usage:
+    python bench_rerun.py [--reruns 50] [--history 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+os.environ.setdefault('DIABETES_WARMUP', '0')
+os.environ.setdefault('DIABETES_PATIENT_ID_SALT', 'bench-rerun')
+
+import database as db
+
+
+def seed(patient_ref, history):
+    """Point the app at a fresh database holding `history` assessments for one patient."""
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.init_db()
+    patient_id = db.hash_patient_id(patient_ref)
+    for i in range(history):
+        db.save_lifestyle_prediction(i % 2, 1, 22.0 + i % 10, 0, 1, 1, 1, 0, 3, i % 30,
+                                     float(i % 3), ['Healthy', 'Pre-diabetic', 'Diabetic'][i % 3],
+                                     'Seeded record', patient_id=patient_id)
+
+
+def main():
+    from streamlit.testing.v1 import AppTest
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reruns', type=int, default=50)
+    parser.add_argument('--history', type=int, default=50)
+    args = parser.parse_args()
+
+    seed('BENCH-1', args.history)
+    at = AppTest.from_file(os.path.join(SCRIPTS_DIR, 'app.py'), default_timeout=120)
+    at.session_state['page'] = 'lifestyle'
+    at.run()
+    at.text_input(key='patient_ref').set_value('BENCH-1').run()
+    if at.exception:
+        raise SystemExit(at.exception[0].message)
+
+    timings = []
+    for i in range(args.reruns):
+        slider = at.slider[0]
+        started = time.perf_counter()
+        slider.set_value(1 + i % 5).run()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    print(f"{args.reruns} reruns of the lifestyle page ({args.history} history rows)")
+    print(f"  median {statistics.median(timings):.1f} ms   "
+          f"p90 {timings[int(len(timings) * 0.9) - 1]:.1f} ms   "
+          f"mean {statistics.mean(timings):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
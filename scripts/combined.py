@@ -0,0 +1,289 @@
+"""
+Combined assessment: the clinical (Pima) and lifestyle (CDC) engines on one
+set of answers.
+
+The union of both input forms is collected once (BMI is shared). The
+lifestyle engine (scale, predict_proba, attributions, advice) runs in a pool
+of DIABETES_ENGINE_WORKERS engine processes (models and explainers cached
+there per version) while the clinical engine runs in the calling thread, so
+the latency is close to the slower engine rather than the sum. Each process
+holds its own copy of the lifestyle model, so size the pool to the number of
+combined assessments expected at once.
+
+The pool is started lazily: warm(), called when the combined page is shown,
+starts it and loads the lifestyle model there before the first assessment
+needs it. It is shut down when the interpreter exits.
+
+Scoring a single row is dominated by per-tree Python overhead in
+scikit-learn, which holds the GIL, so a thread pool gains nothing. On a
+single core (or with DIABETES_ENGINE_PROCESS=0) the lifestyle engine runs in
+a thread and the latency is the sum of both engines; the result's 'parallel'
+says which way it was scored.
+
+The two results are fused into one risk summary, and both records are saved
+in a single transaction under a shared assessment ID
+(database.save_combined_assessment).
+
+    result = combined.assess(registry, clinical_inputs, lifestyle_inputs, patient_id=...)
+"""
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import database as db
+import logic
+import model_registry
+
+# 'auto': engine processes wherever there is a second core to run them on
+_ENGINE_PROCESS = os.environ.get('DIABETES_ENGINE_PROCESS', 'auto')
+USE_ENGINE_PROCESS = _ENGINE_PROCESS == '1' or (_ENGINE_PROCESS == 'auto' and (os.cpu_count() or 1) > 1)
+ENGINE_WORKERS = int(os.environ.get('DIABETES_ENGINE_WORKERS', '2'))
+
+CLINICAL_INPUTS = ['pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin',
+                   'bmi', 'diabetes_pedigree', 'age']
+LIFESTYLE_INPUTS = ['high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity', 'fruits',
+                    'vegetables', 'heavy_alcohol', 'general_health', 'mental_health']
+
+# Fused risk levels
+LEVELS = {
+    2: ('High Risk', "At least one of the two assessments indicates diabetes."),
+    1: ('Elevated Risk', "At least one of the two assessments indicates pre-diabetes or elevated glucose."),
+    0: ('Low Risk', "Neither assessment indicates diabetes or pre-diabetes."),
+}
+
+# Clinical status codes (logic.STATUS_TEMPLATES) -> risk level
+CLINICAL_STATUS_LEVELS = {1: 2, 2: 2, 3: 1, 4: 0}
+
+_thread_pool = None
+_process_pool = None
+_pool_lock = threading.Lock()
+
+
+def score_clinical(entry, inputs, explainer=None):
+    """Run the clinical engine on a dict of CLINICAL_INPUTS."""
+    import numpy as np
+    started = time.perf_counter()
+    features = np.array([[inputs[name] for name in CLINICAL_INPUTS]], dtype=np.float64)
+    features_scaled = entry.scaler.transform(features)
+    probabilities = entry.model.predict_proba(features_scaled)[0]
+    prediction = int(entry.model.classes_[probabilities.argmax()])
+    risk_percent = round(probabilities[1] * 100, 2)
+    contributions = explainer.risk_contributions(features_scaled, [1])[0] if explainer else None
+    status, reasons, tips = logic.get_clinical_advice(prediction, features[0], risk_percent, contributions)
+    return {
+        'features': features, 'prediction': prediction, 'probabilities': probabilities,
+        'risk_percent': risk_percent, 'status': status, 'reasons': reasons, 'tips': tips,
+        'level': CLINICAL_STATUS_LEVELS.get(logic.encode_status(status)[0], prediction * 2),
+        'version': entry.version, 'ms': (time.perf_counter() - started) * 1000,
+    }
+
+
+def score_lifestyle(entry, inputs, explainer=None):
+    """Run the lifestyle engine on a dict of LIFESTYLE_INPUTS (0/1 answers)."""
+    import numpy as np
+    started = time.perf_counter()
+    features = np.array([[inputs[name] for name in LIFESTYLE_INPUTS]], dtype=np.float64)
+    features_scaled = entry.scaler.transform(features)
+    probabilities = entry.model.predict_proba(features_scaled)[0]
+    prediction = float(entry.model.classes_[probabilities.argmax()])
+    risk_percents = [round(p * 100, 2) for p in probabilities]
+    contributions = explainer.risk_contributions(features_scaled, [1.0, 2.0])[0] if explainer else None
+    status, reasons, tips = logic.get_lifestyle_advice(prediction, features[0], risk_percents, contributions)
+    return {
+        'features': features, 'prediction': prediction, 'probabilities': probabilities,
+        'risk_percents': risk_percents, 'status': status, 'reasons': reasons, 'tips': tips,
+        'level': int(prediction), 'version': entry.version,
+        'ms': (time.perf_counter() - started) * 1000,
+    }
+
+
+SCORERS = {'clinical': score_clinical, 'lifestyle': score_lifestyle}
+
+
+def fuse(clinical, lifestyle):
+    """One risk summary from both engine results."""
+    level = max(clinical['level'], lifestyle['level'])
+    title, explanation = LEVELS[level]
+    # Probability of any diabetes risk, averaged over the engines
+    lifestyle_at_risk = 100 - lifestyle['risk_percents'][0]
+    tips, seen = [], set()
+    for tip in clinical['tips'] + lifestyle['tips']:
+        if tip.strip() not in seen:
+            seen.add(tip.strip())
+            tips.append(tip)
+    return {
+        'level': level,
+        'title': title,
+        'explanation': explanation,
+        'risk_percent': round((clinical['risk_percent'] + lifestyle_at_risk) / 2, 1),
+        'agree': clinical['level'] == lifestyle['level'],
+        'tips': tips,
+    }
+
+
+# --- ENGINE PROCESS ---
+_worker = {}
+
+
+def _init_worker(models_dir, manifest_path):
+    model_registry.MODELS_DIR, model_registry.MANIFEST_PATH = models_dir, manifest_path
+
+
+def _worker_engine(key, version=None):
+    """The worker's (entry, explainer) for a model version (default: the current one)."""
+    cached = _worker.get(key)
+    if cached is None or version is None or cached[0].version != version:
+        entry = model_registry.ModelRegistry().get(key)
+        if version is not None and entry.version != version:
+            raise RuntimeError(f"Engine process loaded {key} model {entry.version}, expected {version}")
+        if cached is None or cached[0].version != entry.version:
+            import attributions
+            cached = _worker[key] = (entry, attributions.ForestExplainer(entry.model))
+    return cached
+
+
+def _score_in_worker(key, version, inputs, explain):
+    """Score one engine with the worker's copy of the given model version."""
+    entry, explainer = _worker_engine(key, version)
+    return SCORERS[key](entry, inputs, explainer if explain else None)
+
+
+def _warm_worker(key):
+    return _worker_engine(key)[0].version
+
+
+def _engine_process():
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            import multiprocessing
+            # forkserver: forking the multithreaded app server directly is unsafe
+            _process_pool = ProcessPoolExecutor(
+                max_workers=ENGINE_WORKERS, mp_context=multiprocessing.get_context('forkserver'),
+                initializer=_init_worker, initargs=(model_registry.MODELS_DIR, model_registry.MANIFEST_PATH))
+        return _process_pool
+
+
+def _reset_engine_process():
+    """Drop a broken engine process; the next request starts a new one."""
+    global _process_pool
+    with _pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def warm():
+    """
+    Start the engine processes and load the lifestyle model in them, in the
+    background. Returns at once; does nothing when engine processes are off.
+    """
+    if not USE_ENGINE_PROCESS:
+        return
+    try:
+        pool = _engine_process()
+        # Idle workers pick these up; one that gets two loads the model once
+        for _ in range(ENGINE_WORKERS):
+            pool.submit(_warm_worker, 'lifestyle')
+    except RuntimeError:
+        _reset_engine_process()
+
+
+def _engine_threads():
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='engine')
+        return _thread_pool
+
+
+@atexit.register
+def _shutdown_engines():
+    """Stop the engine pools before the interpreter tears down their locks."""
+    global _thread_pool, _process_pool
+    with _pool_lock:
+        pools, _thread_pool, _process_pool = (_thread_pool, _process_pool), None, None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def assess(registry, clinical_inputs, lifestyle_inputs, explainer_for=None, patient_id=None,
+           site=None, save=True, idempotency_key=None):
+    """
+    Score both engines, fuse the results and (unless save is False) store
+    both records under one assessment ID. explainer_for(key, version, model)
+    returns an attributions.ForestExplainer or None; a repeated idempotency
+    key saves nothing (see database.submission_key). The result's 'saved'
+    says whether new records were stored, 'parallel' whether the engines ran
+    in parallel (in an engine process) or one after the other.
+    """
+    started = time.perf_counter()
+    # Hold on to both entries for the whole request (see app.py)
+    clinical_entry, lifestyle_entry = registry.get('clinical'), registry.get('lifestyle')
+
+    def explainer(entry):
+        return explainer_for(entry.key, entry.version, entry.model) if explainer_for else None
+
+    lifestyle_future, parallel = None, USE_ENGINE_PROCESS
+    if USE_ENGINE_PROCESS:
+        try:
+            lifestyle_future = _engine_process().submit(_score_in_worker, 'lifestyle', lifestyle_entry.version,
+                                                        lifestyle_inputs, explainer_for is not None)
+        except RuntimeError:
+            _reset_engine_process()
+    if lifestyle_future is None:
+        parallel = False
+        lifestyle_future = _engine_threads().submit(score_lifestyle, lifestyle_entry, lifestyle_inputs,
+                                                    explainer(lifestyle_entry))
+    clinical = score_clinical(clinical_entry, clinical_inputs, explainer(clinical_entry))
+    try:
+        lifestyle = lifestyle_future.result()
+    except Exception as e:
+        # A broken engine process or a model reload in progress: score here instead
+        print(f"Engine process failed ({e}); scoring lifestyle in-process")
+        if isinstance(e, BrokenProcessPool):
+            _reset_engine_process()
+        parallel = False
+        lifestyle = score_lifestyle(lifestyle_entry, lifestyle_inputs, explainer(lifestyle_entry))
+
+    # Compare against candidate models in the background, if any are registered
+    import shadow
+    shadow.submit('clinical', clinical['features'], clinical['prediction'], clinical['probabilities'],
+                  clinical_entry.version)
+    shadow.submit('lifestyle', lifestyle['features'], lifestyle['prediction'], lifestyle['probabilities'],
+                  lifestyle_entry.version)
+
+    assessment_id, saved = None, False
+    if save:
+        assessment_id, saved = db.save_combined_assessment(
+            clinical={
+                **{name: clinical_inputs[name] for name in CLINICAL_INPUTS},
+                'prediction': clinical['prediction'],
+                'risk_percentage': float(clinical['risk_percent']),
+                'status': clinical['status'],
+                'model_version': clinical_entry.version,
+            },
+            lifestyle={
+                **{name: lifestyle_inputs[name] for name in LIFESTYLE_INPUTS},
+                'prediction': lifestyle['prediction'],
+                'risk_class': db.RISK_CLASSES[lifestyle['prediction']],
+                'status': lifestyle['status'],
+                'model_version': lifestyle_entry.version,
+            },
+            patient_id=patient_id,
+            site=site,
+            idempotency_key=idempotency_key,
+        )
+    return {
+        'assessment_id': assessment_id,
+        'saved': saved,
+        'clinical': clinical,
+        'lifestyle': lifestyle,
+        'summary': fuse(clinical, lifestyle),
+        'parallel': parallel,
+        'ms': (time.perf_counter() - started) * 1000,
+    }
@@ -0,0 +1,158 @@
+"""
+Pre-aggregated cohort cube for the admin cohort explorer.
+
+Every record is counted in one cell of the cohort_cube table, keyed by
+(mode, month, age band, BMI band, glucose band, risk class, lifestyle flags),
+with the sums needed for averages. Cells are upserted in the same transaction
+as each insert, so rolling up or drilling down any subset of dimensions is a
+GROUP BY over a few hundred cells instead of a scan of the record tables.
+
+Dimensions that a mode does not collect are stored as '' (age and glucose for
+lifestyle records) or 0 (flags for clinical records). The flags column packs
+the seven lifestyle answers in database.LIFESTYLE_FLAGS bit order, so each
+answer can be drilled into or filtered on by name.
+"""
+
+# Band edges (lower bounds of every band but the first) and labels
+BANDS = {
+    'age_band': ('age', [30, 40, 50, 60], ['<30', '30-39', '40-49', '50-59', '60+']),
+    'bmi_band': ('bmi', [18.5, 25, 30, 35], ['<18.5', '18.5-24.9', '25-29.9', '30-34.9', '35+']),
+    'glucose_band': ('glucose', [100, 126], ['<100', '100-125', '126+']),
+}
+
+# Bands each mode has data for
+MODE_BANDS = {
+    'clinical': ['age_band', 'bmi_band', 'glucose_band'],
+    'lifestyle': ['bmi_band'],
+}
+
+CELL_DIMENSIONS = ['month', 'age_band', 'bmi_band', 'glucose_band', 'risk_class']
+
+RISK_CLASS_SQL = {
+    'clinical': "CASE WHEN prediction = 1 THEN 'Diabetic' ELSE 'Non-Diabetic' END",
+    'lifestyle': "CASE prediction WHEN 2 THEN 'Diabetic' WHEN 1 THEN 'Pre-diabetic' ELSE 'Healthy' END",
+}
+
+
+def band(value, band_name):
+    """Label of the band a value falls in ('' when missing)."""
+    if value is None:
+        return ''
+    _, edges, labels = BANDS[band_name]
+    for edge, label in zip(edges, labels):
+        if value < edge:
+            return label
+    return labels[-1]
+
+
+def band_sql(band_name):
+    """SQL expression for a band label, matching band()."""
+    column, edges, labels = BANDS[band_name]
+    cases = ' '.join(f"WHEN {column} < {edge} THEN '{label}'" for edge, label in zip(edges, labels))
+    return f"CASE WHEN {column} IS NULL THEN '' {cases} ELSE '{labels[-1]}' END"
+
+
+def risk_class(mode, prediction):
+    if mode == 'clinical':
+        return 'Diabetic' if prediction == 1 else 'Non-Diabetic'
+    return {2.0: 'Diabetic', 1.0: 'Pre-diabetic'}.get(prediction, 'Healthy')
+
+
+def _cell_sql(mode):
+    """SQL expressions for the band columns of one mode's rows."""
+    return {name: band_sql(name) if name in MODE_BANDS[mode] else "''" for name in BANDS}
+
+
+def _cell(mode, row, flag_names):
+    """(age band, BMI band, glucose band, risk class, flags) of a row."""
+    flags = 0
+    if mode == 'lifestyle':
+        for bit, name in enumerate(flag_names):
+            if row.get(name):
+                flags |= 1 << bit
+    bands = {name: band(row.get(BANDS[name][0]), name) if name in MODE_BANDS[mode] else ''
+             for name in BANDS}
+    return (bands['age_band'], bands['bmi_band'], bands['glucose_band'],
+            risk_class(mode, row.get('prediction')), flags)
+
+
+def record_row(cursor, mode, row, flag_names):
+    """Count one inserted row in its cube cell (same transaction)."""
+    cursor.execute('''
+        INSERT INTO cohort_cube (mode, month, age_band, bmi_band, glucose_band, risk_class, flags,
+                                 count, bmi_sum, risk_sum)
+        VALUES (?, strftime('%Y-%m', 'now'), ?, ?, ?, ?, ?, 1, ?, ?)
+        ON CONFLICT (mode, month, age_band, bmi_band, glucose_band, risk_class, flags)
+        DO UPDATE SET count = count + 1,
+                      bmi_sum = bmi_sum + excluded.bmi_sum,
+                      risk_sum = risk_sum + excluded.risk_sum
+    ''', (mode, *_cell(mode, row, flag_names), row.get('bmi') or 0, row.get('risk_percentage') or 0))
+
+
+def forget_row(cursor, mode, row, flag_names):
+    """Take a deleted row (with its timestamp) out of its cube cell (same transaction)."""
+    key = (mode, row['timestamp'], *_cell(mode, row, flag_names))
+    cursor.execute('''
+        UPDATE cohort_cube SET count = count - 1, bmi_sum = bmi_sum - ?, risk_sum = risk_sum - ?
+        WHERE mode = ? AND month = strftime('%Y-%m', ?) AND age_band = ? AND bmi_band = ?
+          AND glucose_band = ? AND risk_class = ? AND flags = ?
+    ''', (row.get('bmi') or 0, row.get('risk_percentage') or 0, *key))
+    cursor.execute('''
+        DELETE FROM cohort_cube
+        WHERE mode = ? AND month = strftime('%Y-%m', ?) AND age_band = ? AND bmi_band = ?
+          AND glucose_band = ? AND risk_class = ? AND flags = ? AND count <= 0
+    ''', key)
+
+
+def rebuild(cursor, mode, view_name, flag_names):
+    """Recount a mode's cube cells from its records (backfill and after dedupes)."""
+    cursor.execute('DELETE FROM cohort_cube WHERE mode = ?', (mode,))
+    bands = _cell_sql(mode)
+    if mode == 'lifestyle':
+        flags = ' | '.join(f'(COALESCE({name}, 0) << {bit})' for bit, name in enumerate(flag_names))
+        risk = '0'
+    else:
+        flags, risk = '0', 'COALESCE(risk_percentage, 0)'
+    cursor.execute(f'''
+        INSERT INTO cohort_cube (mode, month, age_band, bmi_band, glucose_band, risk_class, flags,
+                                 count, bmi_sum, risk_sum)
+        SELECT ?, strftime('%Y-%m', timestamp), {bands['age_band']}, {bands['bmi_band']},
+               {bands['glucose_band']}, {RISK_CLASS_SQL[mode]}, {flags},
+               COUNT(*), COALESCE(SUM(bmi), 0), SUM({risk})
+        FROM {view_name}
+        GROUP BY 2, 3, 4, 5, 6, 7
+    ''', (mode,))
+
+
+def query_sql(mode, dimensions, filters, flag_names):
+    """
+    (sql, params) that rolls the cube up to `dimensions`, keeping only cells
+    matching `filters` ({dimension: value or list of values}). Flag names are
+    dimensions too (0/1). Returns additive columns only (records, bmi_sum,
+    risk_sum, <flag>_count), so results from several shards can be summed.
+    """
+    flag_bits = {name: bit for bit, name in enumerate(flag_names)}
+    allowed = CELL_DIMENSIONS + (list(flag_bits) if mode == 'lifestyle' else [])
+
+    def expression(name):
+        if name not in allowed:
+            raise ValueError(f"Unknown cube dimension for {mode}: {name}")
+        return f'((flags >> {flag_bits[name]}) & 1)' if name in flag_bits else name
+
+    select = [f'{expression(name)} AS {name}' for name in dimensions]
+    select += ['SUM(count) AS records', 'SUM(bmi_sum) AS bmi_sum', 'SUM(risk_sum) AS risk_sum']
+    if mode == 'lifestyle':
+        select += [f'SUM(CASE WHEN flags & {1 << bit} THEN count ELSE 0 END) AS {name}_count'
+                   for name, bit in flag_bits.items()]
+
+    where, params = ['mode = ?'], [mode]
+    for name, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        where.append(f"{expression(name)} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+    sql = f"SELECT {', '.join(select)} FROM cohort_cube WHERE {' AND '.join(where)}"
+    if dimensions:
+        sql += f" GROUP BY {', '.join(str(i + 1) for i in range(len(dimensions)))}"
+        sql += f" ORDER BY {', '.join(str(i + 1) for i in range(len(dimensions)))}"
+    return sql, params
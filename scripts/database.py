@@ -1,14 +1,208 @@
 import sqlite3
-import pandas as pd
 from datetime import datetime
+import hashlib
+import hmac
+import itertools
+import json
 import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import query_profiler
+import drift
+import search
+import sketches
+import cube
+import logic
+
+# pandas is imported inside the read functions so that importing this module
+# stays cheap for the app's home page, which never reads records.
 
 # Database file path
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'diabetes_records.db')
 
-def init_db():
-    """Initialize the database and create tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
+# Secret mixed into patient identifier hashes. There is no default: a salt
+# anyone can read in the source would let clinic numbers be brute-forced back
+# from their hashes, so patient IDs are refused until one is set.
+PATIENT_ID_SALT = os.environ.get('DIABETES_PATIENT_ID_SALT')
+
+PREDICTION_TABLES = {'clinical': 'clinical_predictions', 'lifestyle': 'lifestyle_predictions'}
+
+# Seconds a connection waits for another writer's lock before raising
+# "database is locked" (sqlite3's default is 5)
+BUSY_TIMEOUT = float(os.environ.get('DIABETES_BUSY_TIMEOUT', '5'))
+
+# Seconds within which identical records of one patient count as duplicates
+# for the batched dedupe job (dedupe.py); new submissions are keyed instead
+# (see submission_key)
+IDEMPOTENCY_WINDOW = int(os.environ.get('DIABETES_IDEMPOTENCY_WINDOW', '600'))
+
+# --- COMPACT STORAGE ---
+# With DIABETES_COMPACT_STORAGE=1 new rows store the status as a code plus the
+# percentage in tenths (see logic.STATUS_TEMPLATES), pack the seven 0/1
+# lifestyle answers into `flags` and leave status, risk_class and the flag
+# columns NULL. Existing rows are converted by init_db. Reads go through the
+# clinical_records / lifestyle_records views, which decode both layouts into
+# the original columns.
+COMPACT_STORAGE = os.environ.get('DIABETES_COMPACT_STORAGE', '0') == '1'
+
+RECORD_VIEWS = {'clinical': 'clinical_records', 'lifestyle': 'lifestyle_records'}
+
+# Bit i of lifestyle_predictions.flags
+LIFESTYLE_FLAGS = ['high_bp', 'high_chol', 'smoker', 'physical_activity', 'fruits',
+                   'vegetables', 'heavy_alcohol']
+
+RISK_CLASSES = {2.0: 'Diabetic', 1.0: 'Pre-diabetic', 0.0: 'Healthy'}
+
+# HbA1c (%) cut-offs for a confirmed outcome: >= 6.5 diabetic, >= 5.7 pre-diabetic
+HBA1C_DIABETIC = 6.5
+HBA1C_PREDIABETIC = 5.7
+
+# Columns that only exist to hold the compact encoding, the submission key or
+# the search status class (hidden by the views)
+_ENCODING_COLUMNS = {'status_code', 'status_tenths', 'flags', 'idempotency_key', 'status_class'}
+
+# --- SHARDING ---
+# DIABETES_SHARDS="north,south" writes each site's records to its own file
+# (diabetes_records_north.db, ...); DIABETES_SHARDS="4" creates four
+# hash-routed shards. Unset keeps everything in DB_PATH. DB_PATH always holds
+# the tables that are not per-record (shadow comparisons and similar).
+SHARDS = [site.strip() for site in os.environ.get('DIABETES_SHARDS', '').split(',') if site.strip()]
+if len(SHARDS) == 1 and SHARDS[0].isdigit():
+    SHARDS = [f'shard{i}' for i in range(int(SHARDS[0]))]
+
+_round_robin = itertools.count()
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+
+
+def configure_shards(sites):
+    """Set the shard list at runtime (an empty list disables sharding)."""
+    global SHARDS
+    SHARDS = list(sites)
+
+
+def shard_path(site):
+    """Database file for one shard."""
+    base, ext = os.path.splitext(DB_PATH)
+    return f'{base}_{site}{ext}'
+
+
+def _shard_paths():
+    """(site, path) for every database holding prediction records."""
+    if not SHARDS:
+        return [(None, DB_PATH)]
+    return [(site, shard_path(site)) for site in SHARDS]
+
+
+def _route(site=None, patient_id=None):
+    """Pick the database a new record is written to."""
+    if not SHARDS:
+        return DB_PATH
+    if site in SHARDS:
+        return shard_path(site)
+    key = site or patient_id
+    if key:
+        index = zlib.crc32(str(key).encode()) % len(SHARDS)
+    else:
+        index = next(_round_robin) % len(SHARDS)
+    return shard_path(SHARDS[index])
+
+
+def _fan_out(func):
+    """Run func(site, path) on every shard in parallel; results in shard order."""
+    global _shard_pool
+    shards = _shard_paths()
+    if len(shards) == 1:
+        return [func(*shards[0])]
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ThreadPoolExecutor(max_workers=max(len(shards), 4), thread_name_prefix='shard')
+    return list(_shard_pool.map(lambda shard: func(*shard), shards))
+
+
+def _read_frames(query, params=(), sort_by=None, limit=None):
+    """
+    Run a read query on every shard and merge the frames. Each shard's result
+    is already ordered and limited, so the merge only re-sorts the union. With
+    sharding on, a 'site' column says which shard each row came from.
+    """
+    import pandas as pd
+    
+    def read(site, path):
+        conn = _connect(path)
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        if site is not None:
+            df.insert(1, 'site', site)
+        return df
+    
+    frames = _fan_out(read)
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    if sort_by:
+        df = df.sort_values(sort_by, ascending=False, kind='mergesort', ignore_index=True)
+    if limit is not None:
+        df = df.head(limit)
+    return df
+
+
+def _connect(path=None):
+    """Open a connection to the records database (profiled when enabled)."""
+    path = path or DB_PATH
+    if query_profiler.is_enabled():
+        return sqlite3.connect(path, timeout=BUSY_TIMEOUT, factory=query_profiler.ProfiledConnection)
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+
+
+def _add_missing_columns(cursor, table_name, columns):
+    """Add columns that older databases were created without. Returns the columns added."""
+    cursor.execute(f'PRAGMA table_info({table_name})')
+    existing = {row[1] for row in cursor.fetchall()}
+    added = [column for column in columns if column not in existing]
+    for column in added:
+        cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN {column} {columns[column]}')
+    return added
+
+
+# --- SCHEMA VERSION ---
+# Bump when _init_database changes. Each file records the version it was last
+# migrated to in PRAGMA user_version (offset when compact storage is on, so
+# switching it still converts the rows), and init_db skips files that are
+# current. Streamlit reruns app.py on every interaction; after the first run
+# init_db costs a set lookup.
+SCHEMA_VERSION = 52
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def _schema_stamp():
+    return SCHEMA_VERSION + (1000 if COMPACT_STORAGE else 0)
+
+
+def init_db(force=False):
+    """Initialize the database (and every shard) and create tables if they don't exist."""
+    paths = [DB_PATH] + [path for _, path in _shard_paths() if path != DB_PATH]
+    with _init_lock:
+        migrated = []
+        for path in paths:
+            if path in _initialized and not force:
+                continue
+            conn = _connect(path)
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            conn.close()
+            if force or current != _schema_stamp():
+                _init_database(path)
+                migrated.append(path)
+            _initialized.add(path)
+    if migrated:
+        print("Database initialized successfully!")
+
+
+def _init_database(path):
+    """Create or migrate the schema of one database file."""
+    conn = _connect(path)
     cursor = conn.cursor()
     
     # Create table for clinical predictions
@@ -26,7 +220,8 @@ def init_db():
             age INTEGER,
             prediction INTEGER,
             risk_percentage REAL,
-            status TEXT
+            status TEXT,
+            model_version TEXT
         )
     ''')
     
@@ -47,100 +242,931 @@ def init_db():
             mental_health INTEGER,
             prediction REAL,
             risk_class TEXT,
-            status TEXT
+            status TEXT,
+            model_version TEXT
+        )
+    ''')
+    
+    # Create table for shadow (candidate model) comparisons
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shadow_predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            mode TEXT,
+            live_version TEXT,
+            shadow_version TEXT,
+            live_prediction REAL,
+            shadow_prediction REAL,
+            agree INTEGER,
+            live_probability REAL,
+            shadow_probability REAL,
+            probability_delta REAL,
+            max_abs_delta REAL,
+            latency_ms REAL
+        )
+    ''')
+    
+    # Create tables for streaming input-drift monitoring
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS feature_histograms (
+            mode TEXT,
+            feature TEXT,
+            bin INTEGER,
+            count INTEGER,
+            PRIMARY KEY (mode, feature, bin)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS drift_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            mode TEXT,
+            feature TEXT,
+            psi REAL,
+            ks REAL,
+            samples INTEGER,
+            resolved_at DATETIME
+        )
+    ''')
+    
+    # Create table for the admin summary sketches
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS column_sketches (
+            table_name TEXT,
+            column_name TEXT,
+            segment TEXT,
+            state TEXT,
+            PRIMARY KEY (table_name, column_name, segment)
+        )
+    ''')
+    # Last record id folded into the sketches, per table, and whether a
+    # delete since means rebuilding them (sketches.catch_up)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sketch_progress (
+            table_name TEXT PRIMARY KEY,
+            last_id INTEGER,
+            stale INTEGER DEFAULT 0
+        )
+    ''')
+    _add_missing_columns(cursor, 'sketch_progress', {'stale': 'INTEGER DEFAULT 0'})
+    
+    # Change counter for readers that cache rows: inserts only append, so
+    # only deletes and updates bump the generation
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS record_changes (
+            table_name TEXT PRIMARY KEY,
+            generation INTEGER DEFAULT 0
+        )
+    ''')
+    for table_name in PREDICTION_TABLES.values():
+        cursor.execute('INSERT OR IGNORE INTO record_changes (table_name) VALUES (?)', (table_name,))
+        for event in ('DELETE', 'UPDATE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table_name}_{event.lower()}_generation
+                AFTER {event} ON {table_name} BEGIN
+                    UPDATE record_changes SET generation = generation + 1
+                    WHERE table_name = '{table_name}';
+                END
+            ''')
+    
+    # Pre-aggregated cohort counts for the admin cohort explorer (cube.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cohort_cube (
+            mode TEXT,
+            month TEXT,
+            age_band TEXT,
+            bmi_band TEXT,
+            glucose_band TEXT,
+            risk_class TEXT,
+            flags INTEGER,
+            count INTEGER,
+            bmi_sum REAL,
+            risk_sum REAL,
+            PRIMARY KEY (mode, month, age_band, bmi_band, glucose_band, risk_class, flags)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Predictions of stored records re-scored with another model version
+    # (rescore.py), and per-version checkpoints so a rescore can resume
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_versions (
+            table_name TEXT,
+            model_version TEXT,
+            record_id INTEGER,
+            prediction REAL,
+            risk_percentage REAL,
+            risk_class TEXT,
+            status TEXT,
+            scored_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, model_version, record_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_runs (
+            table_name TEXT,
+            model_version TEXT,
+            last_id INTEGER DEFAULT 0,
+            rows_scored INTEGER DEFAULT 0,
+            started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME,
+            finished_at DATETIME,
+            PRIMARY KEY (table_name, model_version)
         )
     ''')
+    for table_name in PREDICTION_TABLES.values():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table_name}_delete_versions
+            AFTER DELETE ON {table_name} BEGIN
+                DELETE FROM prediction_versions
+                WHERE table_name = '{table_name}' AND record_id = OLD.id;
+            END
+        ''')
+    
+    # Incremental model updates from confirmed outcomes (model_updates.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS model_updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            mode TEXT,
+            version TEXT,
+            parent_version TEXT,
+            new_trees INTEGER,
+            replaced_trees INTEGER,
+            total_trees INTEGER,
+            training_rows INTEGER,
+            holdout_rows INTEGER,
+            confirmed_until DATETIME,
+            parent_accuracy REAL,
+            accuracy REAL,
+            parent_auc REAL,
+            auc REAL,
+            parent_log_loss REAL,
+            log_loss REAL,
+            fit_seconds REAL,
+            published INTEGER
+        )
+    ''')
+    
+    # Background job queue and cron schedules (jobs.py, worker.py). Times are
+    # UTC, like CURRENT_TIMESTAMP; the queue lives in DB_PATH only.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT,
+            args TEXT,
+            priority INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'queued',
+            schedule TEXT,
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 3,
+            run_after DATETIME DEFAULT CURRENT_TIMESTAMP,
+            lease_owner TEXT,
+            lease_expires DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME,
+            duration_seconds REAL,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready
+        ON jobs (priority DESC, run_after, id) WHERE status = 'queued'
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_leases
+        ON jobs (lease_expires) WHERE status = 'running'
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_schedules (
+            name TEXT PRIMARY KEY,
+            task TEXT,
+            args TEXT,
+            cron TEXT,
+            priority INTEGER DEFAULT 0,
+            enabled INTEGER DEFAULT 1,
+            next_run DATETIME,
+            last_enqueued DATETIME
+        )
+    ''')
+    
+    # Columns added after the first release
+    added = {}
+    added['clinical'] = _add_missing_columns(cursor, 'clinical_predictions', {
+        'model_version': 'TEXT', 'patient_id': 'TEXT',
+        'status_code': 'INTEGER', 'status_tenths': 'INTEGER',
+        'confirmed_outcome': 'REAL', 'hba1c': 'REAL', 'confirmed_at': 'DATETIME',
+        'assessment_id': 'TEXT', 'idempotency_key': 'TEXT', 'status_class': 'INTEGER'
+    })
+    added['lifestyle'] = _add_missing_columns(cursor, 'lifestyle_predictions', {
+        'model_version': 'TEXT', 'patient_id': 'TEXT',
+        'status_code': 'INTEGER', 'status_tenths': 'INTEGER', 'flags': 'INTEGER',
+        'confirmed_outcome': 'REAL', 'hba1c': 'REAL', 'confirmed_at': 'DATETIME',
+        'assessment_id': 'TEXT', 'idempotency_key': 'TEXT', 'status_class': 'INTEGER'
+    })
+    for mode, table_name in PREDICTION_TABLES.items():
+        if 'status_class' in added[mode]:
+            search.backfill_status_classes(cursor, table_name)
+    _create_record_views(cursor)
+    
+    # Per-patient history lookups
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_clinical_patient_time
+        ON clinical_predictions (patient_id, timestamp)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lifestyle_patient_time
+        ON lifestyle_predictions (patient_id, timestamp)
+    ''')
+    
+    # Both halves of a combined assessment
+    for mode, table_name in PREDICTION_TABLES.items():
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{mode}_assessment
+            ON {table_name} (assessment_id) WHERE assessment_id IS NOT NULL
+        ''')
+    
+    # One row per form submission: a repeated submission is a no-op insert
+    for mode, table_name in PREDICTION_TABLES.items():
+        cursor.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{mode}_idempotency
+            ON {table_name} (idempotency_key) WHERE idempotency_key IS NOT NULL
+        ''')
+    
+    # Confirmed outcomes, in confirmation order, for incremental model updates
+    for mode, table_name in PREDICTION_TABLES.items():
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{mode}_confirmed
+            ON {table_name} (confirmed_at) WHERE confirmed_outcome IS NOT NULL
+        ''')
+    
+    # Full-text and numeric indexes for the admin record search
+    search.create_search_indexes(cursor)
+    
+    # Backfill drift histograms once for databases that predate them
+    for mode, table_name in PREDICTION_TABLES.items():
+        cursor.execute('SELECT 1 FROM feature_histograms WHERE mode = ? LIMIT 1', (mode,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'SELECT 1 FROM {table_name} LIMIT 1')
+            if cursor.fetchone() is not None:
+                drift.rebuild_histograms(cursor, mode, RECORD_VIEWS[mode])
     
+    # Backfill the cohort cube once for databases that predate it
+    for mode, table_name in PREDICTION_TABLES.items():
+        cursor.execute('SELECT 1 FROM cohort_cube WHERE mode = ? LIMIT 1', (mode,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'SELECT 1 FROM {table_name} LIMIT 1')
+            if cursor.fetchone() is not None:
+                cube.rebuild(cursor, mode, RECORD_VIEWS[mode], LIFESTYLE_FLAGS)
+    
+    # Sketches from before sketch_progress were updated on every insert, so
+    # they cover every stored row; without any, catch_up() folds all rows
+    for table_name in PREDICTION_TABLES.values():
+        cursor.execute('SELECT 1 FROM sketch_progress WHERE table_name = ?', (table_name,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'''
+                INSERT INTO sketch_progress (table_name, last_id)
+                SELECT ?, (SELECT COALESCE(MAX(id), 0) FROM {table_name})
+                WHERE EXISTS (SELECT 1 FROM column_sketches WHERE table_name = ?)
+            ''', (table_name, table_name))
+    
+    # Convert rows written in the full layout once compact storage is on. The
+    # partial index holds only unconverted rows, so the check is instant.
+    converted = 0
+    for mode, table_name in PREDICTION_TABLES.items():
+        if COMPACT_STORAGE:
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_{mode}_uncompacted
+                ON {table_name} (id) WHERE status_code IS NULL
+            ''')
+            converted += _compact_rows(cursor, mode)
+        else:
+            cursor.execute(f'DROP INDEX IF EXISTS idx_{mode}_uncompacted')
+    
+    cursor.execute(f'PRAGMA user_version = {_schema_stamp()}')
     conn.commit()
+    if converted:
+        # Give the freed space back to the file system
+        conn.execute('VACUUM')
     conn.close()
-    print("Database initialized successfully!")
+
+
+def _create_record_views(cursor):
+    """(Re)create the views that decode compact rows into the original columns."""
+    decoded = {
+        'status': f"COALESCE(t.status, {logic.status_sql('t.status_code', 't.status_tenths')})",
+        'risk_class': 'COALESCE(t.risk_class, CASE t.prediction '
+                      + ' '.join(f"WHEN {value} THEN '{label}'" for value, label in RISK_CLASSES.items())
+                      + ' END)',
+    }
+    for bit, column in enumerate(LIFESTYLE_FLAGS):
+        decoded[column] = f'COALESCE(t.{column}, (t.flags >> {bit}) & 1)'
+    
+    for mode, table_name in PREDICTION_TABLES.items():
+        cursor.execute(f'PRAGMA table_info({table_name})')
+        columns = [row[1] for row in cursor.fetchall() if row[1] not in _ENCODING_COLUMNS]
+        select = ', '.join(f'{decoded[c]} AS {c}' if c in decoded else f't.{c}' for c in columns)
+        cursor.execute(f'DROP VIEW IF EXISTS {RECORD_VIEWS[mode]}')
+        cursor.execute(f'CREATE VIEW {RECORD_VIEWS[mode]} AS SELECT {select} FROM {table_name} t')
+
+
+def _encode_status(status):
+    """(status text, code, tenths) to store; unknown text is kept as is with code 0."""
+    code, tenths = logic.encode_status(status)
+    if code is None:
+        return status, 0, None
+    return None, code, tenths
+
+
+def _pack_flags(values):
+    """Bit-pack the 0/1 lifestyle answers, or None if any is not 0/1."""
+    if any(value not in (0, 1) for value in values):
+        return None
+    return sum(int(value) << bit for bit, value in enumerate(values))
+
+
+def _compact_rows(cursor, mode):
+    """Convert full-layout rows of one table to the compact layout. Returns rows converted."""
+    table_name = PREDICTION_TABLES[mode]
+    if mode == 'lifestyle':
+        packed = ' | '.join(f'({column} << {bit})' for bit, column in enumerate(LIFESTYLE_FLAGS))
+        cursor.execute(f'''
+            UPDATE {table_name}
+            SET flags = {packed},
+                {', '.join(f'{column} = NULL' for column in LIFESTYLE_FLAGS)},
+                risk_class = CASE WHEN risk_class = CASE prediction
+                    {' '.join(f"WHEN {value} THEN '{label}'" for value, label in RISK_CLASSES.items())}
+                    END THEN NULL ELSE risk_class END
+            WHERE status_code IS NULL AND flags IS NULL
+              AND {' AND '.join(f'{column} IN (0, 1)' for column in LIFESTYLE_FLAGS)}
+        ''')
+    
+    converted = 0
+    while True:
+        cursor.execute(f'SELECT id, status FROM {table_name} WHERE status_code IS NULL LIMIT 5000')
+        rows = cursor.fetchall()
+        if not rows:
+            return converted
+        cursor.executemany(
+            f'UPDATE {table_name} SET status = ?, status_code = ?, status_tenths = ? WHERE id = ?',
+            [(*_encode_status(status), record_id) for record_id, status in rows]
+        )
+        converted += len(rows)
+
+
+def get_record_generations(path=None):
+    """{table_name: change generation} of the record tables ({} before the table exists)."""
+    conn = _connect(path)
+    try:
+        return dict(conn.execute('SELECT table_name, generation FROM record_changes').fetchall())
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+
+def mark_records_changed(path=None, previous=None):
+    """
+    Bump the change generation of both record tables (e.g. after a restore).
+    previous ({table_name: generation} read before the contents were
+    replaced) moves each generation past the old one too, so a restored
+    counter never lands on a value a cache already holds.
+    """
+    previous = previous or {}
+    conn = _connect(path)
+    conn.executemany(
+        'UPDATE record_changes SET generation = MAX(generation, ?) + 1 WHERE table_name = ?',
+        [(previous.get(table_name, 0), table_name) for table_name in PREDICTION_TABLES.values()]
+    )
+    conn.commit()
+    conn.close()
+
+
+def hash_patient_id(patient_ref):
+    """
+    Hash a patient identifier (e.g. a clinic number) so it is never stored in
+    clear. Raises RuntimeError when DIABETES_PATIENT_ID_SALT is not set.
+    """
+    normalized = str(patient_ref).strip().upper()
+    if not normalized:
+        return None
+    if not PATIENT_ID_SALT:
+        raise RuntimeError("DIABETES_PATIENT_ID_SALT is not set; refusing to hash patient identifiers "
+                           "with a public default salt")
+    return hmac.new(PATIENT_ID_SALT.encode(), normalized.encode(), hashlib.sha256).hexdigest()
+
+
+def submission_key(mode, session_key, submission):
+    """
+    Idempotency key for one form submission: the session's key plus its
+    submission number for the mode. The caller only moves to the next number
+    when the inputs change, so a double click or a replayed rerun saves a
+    single record however far apart the two requests arrive.
+    """
+    content = json.dumps([mode, session_key, int(submission)])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _after_insert(cursor, mode, row):
+    """Keep the incremental statistics in step with a new row (same transaction; sketches catch up later)."""
+    drift.record_observation(cursor, mode, row)
+    cube.record_row(cursor, mode, row, LIFESTYLE_FLAGS)
 
 
 def save_clinical_prediction(pregnancies, glucose, blood_pressure, skin_thickness, 
                              insulin, bmi, diabetes_pedigree, age, prediction, 
-                             risk_percentage, status):
-    """Save a clinical prediction record to the database."""
-    conn = sqlite3.connect(DB_PATH)
+                             risk_percentage, status, model_version=None, patient_id=None,
+                             site=None, assessment_id=None, idempotency_key=None):
+    """
+    Save a clinical prediction record to the database (or the site's shard).
+    Returns False if a record with the same idempotency key already exists.
+    """
+    conn = _connect(_route(site, patient_id))
     cursor = conn.cursor()
     
+    inserted = _insert_clinical(cursor, pregnancies, glucose, blood_pressure, skin_thickness, insulin,
+                                bmi, diabetes_pedigree, age, prediction, risk_percentage, status,
+                                model_version, patient_id, assessment_id, idempotency_key)
+    
+    conn.commit()
+    conn.close()
+    return inserted
+
+
+def _insert_clinical(cursor, pregnancies, glucose, blood_pressure, skin_thickness, insulin, bmi,
+                     diabetes_pedigree, age, prediction, risk_percentage, status, model_version=None,
+                     patient_id=None, assessment_id=None, idempotency_key=None):
+    """
+    Insert one clinical record and update the derived statistics (caller
+    commits). A duplicate idempotency key is a no-op; returns whether a row
+    was inserted.
+    """
+    status_text, status_code, status_tenths = (
+        _encode_status(status) if COMPACT_STORAGE else (status, None, None))
     cursor.execute('''
         INSERT INTO clinical_predictions 
         (pregnancies, glucose, blood_pressure, skin_thickness, insulin, bmi, 
-         diabetes_pedigree, age, prediction, risk_percentage, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+         diabetes_pedigree, age, prediction, risk_percentage, status, model_version,
+         patient_id, status_code, status_tenths, assessment_id, idempotency_key, status_class)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
     ''', (pregnancies, glucose, blood_pressure, skin_thickness, insulin, bmi, 
-          diabetes_pedigree, age, prediction, risk_percentage, status))
+          diabetes_pedigree, age, prediction, risk_percentage, status_text, model_version,
+          patient_id, status_code, status_tenths, assessment_id, idempotency_key,
+          search.status_class(status)))
+    if cursor.rowcount == 0:
+        return False
     
-    conn.commit()
-    conn.close()
+    _after_insert(cursor, 'clinical', {
+        'pregnancies': pregnancies, 'glucose': glucose, 'blood_pressure': blood_pressure,
+        'skin_thickness': skin_thickness, 'insulin': insulin, 'bmi': bmi,
+        'diabetes_pedigree': diabetes_pedigree, 'age': age, 'prediction': prediction,
+        'risk_percentage': risk_percentage
+    })
+    return True
 
 
 def save_lifestyle_prediction(high_bp, high_chol, bmi, smoker, physical_activity, 
                               fruits, vegetables, heavy_alcohol, general_health, 
-                              mental_health, prediction, risk_class, status):
-    """Save a lifestyle prediction record to the database."""
-    conn = sqlite3.connect(DB_PATH)
+                              mental_health, prediction, risk_class, status, model_version=None,
+                              patient_id=None, site=None, assessment_id=None, idempotency_key=None):
+    """
+    Save a lifestyle prediction record to the database (or the site's shard).
+    Returns False if a record with the same idempotency key already exists.
+    """
+    conn = _connect(_route(site, patient_id))
     cursor = conn.cursor()
     
+    inserted = _insert_lifestyle(cursor, high_bp, high_chol, bmi, smoker, physical_activity, fruits,
+                                 vegetables, heavy_alcohol, general_health, mental_health, prediction,
+                                 risk_class, status, model_version, patient_id, assessment_id,
+                                 idempotency_key)
+    
+    conn.commit()
+    conn.close()
+    return inserted
+
+
+def _insert_lifestyle(cursor, high_bp, high_chol, bmi, smoker, physical_activity, fruits,
+                      vegetables, heavy_alcohol, general_health, mental_health, prediction,
+                      risk_class, status, model_version=None, patient_id=None, assessment_id=None,
+                      idempotency_key=None):
+    """Insert one lifestyle record like _insert_clinical; returns whether a row was inserted."""
+    answers = [high_bp, high_chol, smoker, physical_activity, fruits, vegetables, heavy_alcohol]
+    flags = _pack_flags(answers) if COMPACT_STORAGE else None
+    stored_answers = [None] * len(answers) if flags is not None else answers
+    stored_risk_class = risk_class
+    if COMPACT_STORAGE and RISK_CLASSES.get(prediction) == risk_class:
+        stored_risk_class = None
+    status_text, status_code, status_tenths = (
+        _encode_status(status) if COMPACT_STORAGE else (status, None, None))
     cursor.execute('''
         INSERT INTO lifestyle_predictions 
-        (high_bp, high_chol, bmi, smoker, physical_activity, fruits, vegetables, 
-         heavy_alcohol, general_health, mental_health, prediction, risk_class, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (high_bp, high_chol, bmi, smoker, physical_activity, fruits, vegetables, 
-          heavy_alcohol, general_health, mental_health, prediction, risk_class, status))
+        (high_bp, high_chol, smoker, physical_activity, fruits, vegetables, heavy_alcohol,
+         bmi, general_health, mental_health, prediction, risk_class, status,
+         model_version, patient_id, status_code, status_tenths, flags, assessment_id,
+         idempotency_key, status_class)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+    ''', (*stored_answers, bmi, general_health, mental_health, prediction, stored_risk_class,
+          status_text, model_version, patient_id, status_code, status_tenths, flags, assessment_id,
+          idempotency_key, search.status_class(status)))
+    if cursor.rowcount == 0:
+        return False
+    
+    _after_insert(cursor, 'lifestyle', {
+        'high_bp': high_bp, 'high_chol': high_chol, 'bmi': bmi, 'smoker': smoker,
+        'physical_activity': physical_activity, 'fruits': fruits, 'vegetables': vegetables,
+        'heavy_alcohol': heavy_alcohol, 'general_health': general_health,
+        'mental_health': mental_health, 'prediction': prediction, 'risk_class': risk_class
+    })
+    return True
+
+
+def save_combined_assessment(clinical, lifestyle, patient_id=None, site=None, idempotency_key=None):
+    """
+    Save a combined assessment: the clinical and lifestyle records (dicts of
+    the save_*_prediction arguments) in one transaction, linked by an
+    assessment ID. Returns (assessment_id, inserted). With an idempotency key
+    the ID is derived from it, so a repeated submission saves nothing and
+    returns the ID of the first one with inserted False.
+    """
+    import uuid
+    assessment_id = idempotency_key[:32] if idempotency_key else uuid.uuid4().hex
+    conn = _connect(_route(site, patient_id))
+    cursor = conn.cursor()
+    try:
+        inserted = _insert_clinical(cursor, **clinical, patient_id=patient_id,
+                                    assessment_id=assessment_id, idempotency_key=idempotency_key)
+        inserted |= _insert_lifestyle(cursor, **lifestyle, patient_id=patient_id,
+                                      assessment_id=assessment_id, idempotency_key=idempotency_key)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return assessment_id, inserted
+
+
+def get_assessment(assessment_id):
+    """(clinical records, lifestyle records) saved under one combined assessment ID."""
+    return tuple(
+        _read_frames(f'SELECT * FROM {RECORD_VIEWS[mode]} WHERE assessment_id = ?', (assessment_id,))
+        for mode in ('clinical', 'lifestyle')
+    )
+
+
+def save_shadow_prediction(mode, live_version, shadow_version, live_prediction,
+                           shadow_prediction, live_probability, shadow_probability,
+                           max_abs_delta, latency_ms):
+    """Save one live vs. candidate model comparison."""
+    conn = _connect()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT INTO shadow_predictions 
+        (mode, live_version, shadow_version, live_prediction, shadow_prediction, agree,
+         live_probability, shadow_probability, probability_delta, max_abs_delta, latency_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (mode, live_version, shadow_version, live_prediction, shadow_prediction,
+          int(live_prediction == shadow_prediction), live_probability, shadow_probability,
+          shadow_probability - live_probability, max_abs_delta, latency_ms))
     
     conn.commit()
     conn.close()
 
 
-def get_last_clinical_records(limit=5):
-    """Get the last N clinical prediction records."""
-    conn = sqlite3.connect(DB_PATH)
-    query = f'''
-        SELECT * FROM clinical_predictions 
-        ORDER BY timestamp DESC 
-        LIMIT {limit}
+def get_shadow_summary():
+    """Get agreement and probability-delta summary per mode and model pair."""
+    import pandas as pd
+    conn = _connect()
+    query = '''
+        SELECT mode, live_version, shadow_version,
+               COUNT(*) AS comparisons,
+               ROUND(100.0 * AVG(agree), 2) AS agreement_pct,
+               ROUND(AVG(ABS(probability_delta)), 4) AS mean_abs_delta,
+               ROUND(MAX(max_abs_delta), 4) AS worst_delta,
+               ROUND(AVG(latency_ms), 2) AS avg_latency_ms,
+               MAX(timestamp) AS last_seen
+        FROM shadow_predictions
+        GROUP BY mode, live_version, shadow_version
+        ORDER BY last_seen DESC
     '''
     df = pd.read_sql_query(query, conn)
     conn.close()
     return df
 
 
+def get_rescore_summary():
+    """Progress and outcome of each rescoring run (see rescore.py), per table and model version."""
+    query = '''
+        SELECT r.table_name, r.model_version, r.rows_scored, r.last_id,
+               COUNT(v.record_id) AS stored,
+               ROUND(AVG(v.prediction), 3) AS mean_prediction,
+               SUM(v.prediction != COALESCE(c.prediction, l.prediction)) AS changed_predictions,
+               r.started_at, r.updated_at, r.finished_at
+        FROM rescore_runs r
+        LEFT JOIN prediction_versions v
+            ON v.table_name = r.table_name AND v.model_version = r.model_version
+        LEFT JOIN clinical_predictions c
+            ON r.table_name = 'clinical_predictions' AND c.id = v.record_id
+        LEFT JOIN lifestyle_predictions l
+            ON r.table_name = 'lifestyle_predictions' AND l.id = v.record_id
+        GROUP BY r.table_name, r.model_version
+    '''
+    return _read_frames(query, sort_by='updated_at')
+
+
+def get_job_schedules():
+    """Cron schedules of the background worker with their next run (UTC)."""
+    import pandas as pd
+    conn = _connect()
+    df = pd.read_sql_query('SELECT * FROM job_schedules ORDER BY next_run', conn)
+    conn.close()
+    return df
+
+
+def get_job_summary():
+    """Per task: queued/running/failed jobs and the duration of recent successful runs."""
+    import pandas as pd
+    conn = _connect()
+    df = pd.read_sql_query('''
+        SELECT task,
+               SUM(status = 'queued') AS queued,
+               SUM(status = 'running') AS running,
+               SUM(status = 'done') AS done,
+               SUM(status = 'failed') AS failed,
+               ROUND(AVG(CASE WHEN status = 'done' THEN duration_seconds END), 2) AS mean_seconds,
+               ROUND(MAX(CASE WHEN status = 'done' THEN duration_seconds END), 2) AS max_seconds,
+               MAX(finished_at) AS last_finished
+        FROM jobs GROUP BY task ORDER BY task
+    ''', conn)
+    conn.close()
+    return df
+
+
+def get_recent_jobs(limit=50, status=None):
+    """The most recently created jobs, newest first."""
+    import pandas as pd
+    conn = _connect()
+    where, params = ('WHERE status = ?', (status, limit)) if status else ('', (limit,))
+    df = pd.read_sql_query(f'''
+        SELECT id, task, args, priority, status, schedule, attempts, max_attempts, run_after,
+               lease_owner, started_at, finished_at, duration_seconds, result, error
+        FROM jobs {where} ORDER BY id DESC LIMIT ?
+    ''', conn, params=params)
+    conn.close()
+    return df
+
+
+def get_last_clinical_records(limit=5):
+    """Get the last N clinical prediction records."""
+    query = '''
+        SELECT * FROM clinical_records 
+        ORDER BY timestamp DESC 
+        LIMIT ?
+    '''
+    return _read_frames(query, (int(limit),), sort_by='timestamp', limit=int(limit))
+
+
 def get_last_lifestyle_records(limit=5):
     """Get the last N lifestyle prediction records."""
-    conn = sqlite3.connect(DB_PATH)
-    query = f'''
-        SELECT * FROM lifestyle_predictions 
+    query = '''
+        SELECT * FROM lifestyle_records 
         ORDER BY timestamp DESC 
-        LIMIT {limit}
+        LIMIT ?
     '''
-    df = pd.read_sql_query(query, conn)
+    return _read_frames(query, (int(limit),), sort_by='timestamp', limit=int(limit))
+
+
+def get_patient_history(mode, patient_id, limit=None, start=None, end=None):
+    """
+    Get one patient's assessments for a mode ('clinical' or 'lifestyle'),
+    newest first. Optionally limit to the last N and/or a timestamp range
+    ('YYYY-MM-DD[ HH:MM:SS]', inclusive). Served by the (patient_id, timestamp) index.
+    """
+    query = f'SELECT * FROM {RECORD_VIEWS[mode]} WHERE patient_id = ?'
+    params = [patient_id]
+    if start is not None:
+        query += ' AND timestamp >= ?'
+        params.append(str(start))
+    if end is not None:
+        query += ' AND timestamp <= ?'
+        params.append(str(end))
+    query += ' ORDER BY timestamp DESC, id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    
+    return _read_frames(query, params, sort_by='timestamp', limit=limit)
+
+
+def search_records(mode, record_id=None, id_range=None, text=None, filters=None, limit=None):
+    """
+    Search clinical or lifestyle records by exact ID, ID range (low, high),
+    free text over status/risk, and column filters ({column: (min, max)} or
+    {column: value}). All predicates are answered from indexes.
+    """
+    conn = _connect()
+    query, params = search.build_search_query(conn.cursor(), mode, record_id, id_range,
+                                              text, filters, limit)
     conn.close()
-    return df
+    return _read_frames(query, params, sort_by='timestamp', limit=limit)
+
+
+def get_records_page(mode, page=1, page_size=50):
+    """
+    Get one page of records, newest first, across all shards. Each shard
+    returns at most page * page_size rows and the pages are merged.
+    """
+    page, page_size = max(int(page), 1), int(page_size)
+    query = f'SELECT * FROM {RECORD_VIEWS[mode]} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?'
+    if len(_shard_paths()) == 1:
+        return _read_frames(query, (page_size, (page - 1) * page_size))
+    merged = _read_frames(query, (page * page_size, 0), sort_by='timestamp')
+    return merged.iloc[(page - 1) * page_size:page * page_size].reset_index(drop=True)
 
 
 def get_all_clinical_records():
     """Get all clinical prediction records."""
-    conn = sqlite3.connect(DB_PATH)
-    query = 'SELECT * FROM clinical_predictions ORDER BY timestamp DESC'
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    query = 'SELECT * FROM clinical_records ORDER BY timestamp DESC'
+    return _read_frames(query, sort_by='timestamp')
 
 
 def get_all_lifestyle_records():
     """Get all lifestyle prediction records."""
-    conn = sqlite3.connect(DB_PATH)
-    query = 'SELECT * FROM lifestyle_predictions ORDER BY timestamp DESC'
-    df = pd.read_sql_query(query, conn)
+    query = 'SELECT * FROM lifestyle_records ORDER BY timestamp DESC'
+    return _read_frames(query, sort_by='timestamp')
+
+
+# --- TYPED READS ---
+# Compact dtypes for read_records. Columns not listed keep pandas' inference.
+RECORD_DTYPES = {
+    'clinical': {
+        'id': 'int64', 'timestamp': 'datetime64[ns]', 'pregnancies': 'int8',
+        'glucose': 'float32', 'blood_pressure': 'float32', 'skin_thickness': 'float32',
+        'insulin': 'float32', 'bmi': 'float32', 'diabetes_pedigree': 'float32', 'age': 'int16',
+        'prediction': 'int8', 'risk_percentage': 'float32', 'status': 'category',
+        'model_version': 'category', 'patient_id': 'category',
+        'confirmed_outcome': 'float32', 'hba1c': 'float32', 'confirmed_at': 'datetime64[ns]',
+        'assessment_id': 'category',
+    },
+    'lifestyle': {
+        'id': 'int64', 'timestamp': 'datetime64[ns]', 'high_bp': 'int8', 'high_chol': 'int8',
+        'bmi': 'float32', 'smoker': 'int8', 'physical_activity': 'int8', 'fruits': 'int8',
+        'vegetables': 'int8', 'heavy_alcohol': 'int8', 'general_health': 'int8',
+        'mental_health': 'int8', 'prediction': 'float32', 'risk_class': 'category',
+        'status': 'category', 'model_version': 'category', 'patient_id': 'category',
+        'confirmed_outcome': 'float32', 'hba1c': 'float32', 'confirmed_at': 'datetime64[ns]',
+        'assessment_id': 'category',
+    },
+}
+
+
+class _TypedColumn:
+    """Preallocated output column filled chunk by chunk."""
+
+    def __init__(self, dtype, size):
+        import numpy as np
+        self.dtype = dtype
+        self.mask = None
+        if dtype == 'category':
+            self.codes = np.full(size, -1, dtype=np.int32)
+            self.categories = {}
+        elif dtype is None:
+            self.values = np.empty(size, dtype=object)
+        else:
+            self.values = np.empty(size, dtype=dtype)
+            if np.dtype(dtype).kind in 'iu':
+                self.mask = np.zeros(size, dtype=bool)
+
+    def fill(self, start, values):
+        import numpy as np
+        import pandas as pd
+        end = start + len(values)
+        if self.dtype == 'category':
+            lookup = self.categories
+            self.codes[start:end] = [-1 if v is None else lookup.setdefault(v, len(lookup)) for v in values]
+        elif self.dtype == 'datetime64[ns]':
+            self.values[start:end] = pd.to_datetime(pd.Series(values), format='ISO8601').to_numpy()
+        elif self.mask is not None:
+            try:
+                self.values[start:end] = values
+            except TypeError:
+                # NULLs in an integer column: fill with 0 and mask them
+                self.mask[start:end] = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+                self.values[start:end] = [0 if v is None else v for v in values]
+        else:
+            # numpy turns None into NaN for float columns
+            self.values[start:end] = values
+
+    def finish(self, size):
+        import numpy as np
+        import pandas as pd
+        if self.dtype == 'category':
+            codes = self.codes[:size].astype(np.min_scalar_type(-max(len(self.categories), 1)))
+            return pd.Categorical.from_codes(codes, categories=list(self.categories))
+        values = self.values[:size]
+        if self.mask is not None and self.mask[:size].any():
+            return pd.arrays.IntegerArray(values, self.mask[:size])
+        return values
+
+
+def concat_typed(frames):
+    """Concatenate typed frames, keeping categoricals categorical."""
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+    frames = [f for f in frames if f is not None]
+    if len(frames) == 1:
+        return frames[0]
+    categorical = [c for c in frames[0].columns if isinstance(frames[0][c].dtype, pd.CategoricalDtype)]
+    df = pd.concat(frames, ignore_index=True)
+    for column in categorical:
+        df[column] = union_categoricals([f[column] for f in frames], ignore_order=True)
+    return df
+
+
+def _read_typed(path, mode, columns=None, after_id=None, chunk_size=20000, upto_id=None):
+    """
+    Typed read of one database file (see read_records). Only rows with
+    after_id < id <= upto_id are read; upto_id defaults to the largest id at
+    the start of the read.
+    """
+    import pandas as pd
+    view = RECORD_VIEWS[mode]
+    conn = _connect(path)
+    cursor = conn.cursor()
+    if upto_id is None:
+        cursor.execute(f'SELECT MAX(id) FROM {PREDICTION_TABLES[mode]}')
+        upto_id = cursor.fetchone()[0] or 0
+    # The COUNT and the SELECT run as separate statements; ids only grow, so
+    # bounding both by upto_id keeps rows committed in between out of both
+    where, params = 'WHERE id <= ?', [int(upto_id)]
+    if after_id is not None:
+        where += ' AND id > ?'
+        params.append(int(after_id))
+    if columns is None:
+        cursor.execute(f'SELECT * FROM {view} LIMIT 0')
+        columns = [d[0] for d in cursor.description]
+    cursor.execute(f'SELECT COUNT(*) FROM {view} {where}', params)
+    total = cursor.fetchone()[0]
+    
+    dtypes = RECORD_DTYPES[mode]
+    output = {c: _TypedColumn(dtypes.get(c), total) for c in columns}
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {view} {where} ORDER BY id DESC", params)
+    filled = 0
+    while filled < total:
+        # A delete in between can only make the SELECT return fewer rows
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for column, values in zip(columns, zip(*rows)):
+            output[column].fill(filled, values)
+        filled += len(rows)
     conn.close()
+    return pd.DataFrame({c: output[c].finish(filled) for c in columns}, copy=False)
+
+
+def read_records(mode, columns=None, after_id=None, chunk_size=20000):
+    """
+    Read records, newest first, with only the given columns (all by default)
+    and compact dtypes (RECORD_DTYPES): categoricals for text labels, int8 for
+    flags, float32 for measurements and parsed timestamps. Rows are fetched in
+    chunks into preallocated arrays, so peak memory stays near the size of the
+    returned frame. after_id limits the read to rows with a larger id.
+    """
+    import pandas as pd
+    
+    def read(site, path):
+        df = _read_typed(path, mode, columns, after_id, chunk_size)
+        if site is not None:
+            df.insert(min(1, len(df.columns)), 'site', pd.Categorical([site] * len(df)))
+        return df
+    
+    frames = _fan_out(read)
+    if len(frames) == 1:
+        return frames[0]
+    df = concat_typed(frames)
+    if 'timestamp' in df.columns:
+        df = df.sort_values('timestamp', ascending=False, kind='mergesort', ignore_index=True)
     return df
 
 
 def get_statistics():
-    """Get overall statistics from the database."""
-    conn = sqlite3.connect(DB_PATH)
+    """Get overall statistics, summed over all shards."""
+    totals = {}
+    for shard_stats in _fan_out(lambda site, path: _shard_statistics(path)):
+        for key, value in shard_stats.items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _shard_statistics(path):
+    """Counters for one database file."""
+    conn = _connect(path)
     cursor = conn.cursor()
     
     # Clinical stats
@@ -171,25 +1197,256 @@ def get_statistics():
     }
 
 
-def delete_record(table_name, record_id):
-    """Delete a specific record from the database."""
-    conn = sqlite3.connect(DB_PATH)
+def delete_record(table_name, record_id, site=None):
+    """Delete a specific record from the database (from the given site's shard when sharded)."""
+    if SHARDS and site not in SHARDS:
+        raise ValueError("A site is required to delete a record from a sharded database")
+    conn = _connect(shard_path(site) if SHARDS else DB_PATH)
     cursor = conn.cursor()
     
     if table_name in ['clinical_predictions', 'lifestyle_predictions']:
-        cursor.execute(f'DELETE FROM {table_name} WHERE id = ?', (record_id,))
-        conn.commit()
+        mode = 'clinical' if table_name == 'clinical_predictions' else 'lifestyle'
+        # Read the decoded row first so its counts can be taken back out
+        cursor.execute(f'SELECT * FROM {RECORD_VIEWS[mode]} WHERE id = ?', (record_id,))
+        found = cursor.fetchone()
+        if found is not None:
+            row = dict(zip([column[0] for column in cursor.description], found))
+            cursor.execute(f'DELETE FROM {table_name} WHERE id = ?', (record_id,))
+            drift.remove_observation(cursor, mode, row)
+            cube.forget_row(cursor, mode, row, LIFESTYLE_FLAGS)
+            # A quantile sketch cannot subtract a value; rebuilt by the
+            # update_sketches job
+            sketches.mark_deleted(cursor, table_name, record_id)
+            conn.commit()
     
     conn.close()
 
 
+def outcome_from_hba1c(mode, hba1c):
+    """Confirmed outcome for an HbA1c result, in the mode's prediction classes."""
+    if hba1c >= HBA1C_DIABETIC:
+        return 1.0 if mode == 'clinical' else 2.0
+    if hba1c >= HBA1C_PREDIABETIC and mode == 'lifestyle':
+        return 1.0
+    return 0.0
+
+
+def confirm_outcome(table_name, record_id, hba1c, outcome=None, site=None):
+    """
+    Record a clinician-confirmed HbA1c result (%) for an assessment. The
+    outcome is derived from the HbA1c cut-offs unless given. Returns the
+    stored outcome, or None if the record does not exist.
+    """
+    if table_name not in PREDICTION_TABLES.values():
+        raise ValueError(f"Unknown prediction table: {table_name}")
+    if SHARDS and site not in SHARDS:
+        raise ValueError("A site is required to confirm a record in a sharded database")
+    mode = 'clinical' if table_name == 'clinical_predictions' else 'lifestyle'
+    if outcome is None:
+        outcome = outcome_from_hba1c(mode, hba1c)
+    conn = _connect(shard_path(site) if SHARDS else DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        UPDATE {table_name}
+        SET confirmed_outcome = ?, hba1c = ?, confirmed_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (float(outcome), float(hba1c), record_id))
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return float(outcome) if updated else None
+
+
+def get_confirmed_records(mode, since=None):
+    """Records with a confirmed outcome (optionally confirmed after `since`), oldest confirmation first."""
+    where, params = 'WHERE confirmed_outcome IS NOT NULL', ()
+    if since is not None:
+        where, params = where + ' AND confirmed_at > ?', (since,)
+    df = _read_frames(f'SELECT * FROM {RECORD_VIEWS[mode]} {where} ORDER BY confirmed_at', params)
+    return df.sort_values('confirmed_at', kind='mergesort', ignore_index=True)
+
+
+def get_model_updates(mode=None):
+    """History of incremental model updates with their held-out evaluation, newest first."""
+    import pandas as pd
+    conn = _connect()
+    where, params = ('WHERE mode = ?', (mode,)) if mode else ('', ())
+    df = pd.read_sql_query(f'SELECT * FROM model_updates {where} ORDER BY id DESC', conn, params=params)
+    conn.close()
+    return df
+
+
 def clear_all_records():
-    """Clear all records from both tables (use with caution!)."""
-    conn = sqlite3.connect(DB_PATH)
+    """Clear all records from both tables on every shard (use with caution!)."""
+    import backup
+    # Keep a restorable copy of what is about to be deleted
+    backup.snapshot('preclear')
+    _fan_out(lambda site, path: _clear_database(path))
+
+
+def _clear_database(path):
+    """Empty the record tables and derived state of one database file."""
+    conn = _connect(path)
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM clinical_predictions')
     cursor.execute('DELETE FROM lifestyle_predictions')
+    cursor.execute('DELETE FROM feature_histograms')
+    cursor.execute('DELETE FROM drift_alerts')
+    cursor.execute('DELETE FROM column_sketches')
+    cursor.execute('DELETE FROM sketch_progress')
+    cursor.execute('DELETE FROM rescore_runs')
+    cursor.execute('DELETE FROM cohort_cube')
     
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+
+def get_query_report():
+    """Get the query profiler report (empty unless profiling is enabled)."""
+    import pandas as pd
+    report = query_profiler.get_report()
+    columns = ['statement', 'calls', 'total_ms', 'avg_ms', 'max_ms', 'rows',
+               'slow_calls', 'full_scan', 'plan']
+    df = pd.DataFrame(report, columns=columns)
+    if not df.empty:
+        df['plan'] = df['plan'].apply(' | '.join)
+    return df
+
+
+def get_drift_scores(mode=None):
+    """Get PSI/KS drift scores per feature against the training reference."""
+    import pandas as pd
+    modes = [mode] if mode else list(drift.FEATURE_BINS)
+    
+    def load(site, path):
+        conn = _connect(path)
+        histograms = {m: drift.load_live_histograms(conn.cursor(), m) for m in modes}
+        conn.close()
+        return histograms
+    
+    # Histogram counts add up across shards
+    per_shard = _fan_out(load)
+    scores = []
+    for m in modes:
+        live = per_shard[0][m]
+        for other in per_shard[1:]:
+            live = {f: [a + b for a, b in zip(live[f], other[m][f])] for f in live}
+        scores.extend(drift.compute_drift(None, m, live))
+    return pd.DataFrame(scores, columns=['mode', 'feature', 'samples', 'psi', 'ks', 'status'])
+
+
+def get_drift_alerts(include_resolved=False):
+    """Get drift alerts, newest first."""
+    query = 'SELECT * FROM drift_alerts'
+    if not include_resolved:
+        query += ' WHERE resolved_at IS NULL'
+    return _read_frames(query + ' ORDER BY timestamp DESC', sort_by='timestamp')
+
+
+def recompute_drift():
+    """Rebuild the histograms from stored rows and re-evaluate alerts."""
+    def recompute(site, path):
+        conn = _connect(path)
+        cursor = conn.cursor()
+        for mode in PREDICTION_TABLES:
+            drift.rebuild_histograms(cursor, mode, RECORD_VIEWS[mode])
+            drift.check_alerts(cursor, mode)
+        conn.commit()
+        conn.close()
+    
+    _fan_out(recompute)
+
+
+def update_sketches():
+    """Fold newly inserted records into the stored summary sketches. Returns {table: rows folded}."""
+    def update(site, path):
+        conn = _connect(path)
+        cursor = conn.cursor()
+        folded = {table_name: sketches.catch_up(cursor, table_name) for table_name in PREDICTION_TABLES.values()}
+        conn.commit()
+        conn.close()
+        return folded
+    
+    totals = dict.fromkeys(PREDICTION_TABLES.values(), 0)
+    for folded in _fan_out(update):
+        for table_name, count in folded.items():
+            totals[table_name] += count
+    return totals
+
+
+def get_column_sketch(table_name, column_name, segment=None):
+    """Get the merged streaming sketch for a column (optionally one segment), across shards."""
+    def load(site, path):
+        conn = _connect(path)
+        sketch = sketches.load_merged(conn.cursor(), table_name, column_name, segment)
+        conn.close()
+        return sketch
+    
+    merged, *others = _fan_out(load)
+    for sketch in others:
+        merged.merge(sketch)
+    return merged
+
+
+def get_column_summary(table_name):
+    """Get count/mean/std/min/max and percentiles for every sketched column."""
+    import pandas as pd
+    rows = []
+    for column_name in sketches.SKETCH_COLUMNS[table_name]:
+        sketch = get_column_sketch(table_name, column_name)
+        percentiles = sketch.percentiles()
+        rows.append({
+            'column': column_name, 'count': sketch.count, 'mean': round(sketch.mean, 2),
+            'std': round(sketch.std, 2), 'min': sketch.min,
+            'p10': percentiles[10], 'p25': percentiles[25], 'median': percentiles[50],
+            'p75': percentiles[75], 'p90': percentiles[90], 'max': sketch.max
+        })
+    return pd.DataFrame(rows)
+
+
+def query_cube(mode, dimensions=(), filters=None):
+    """
+    Roll the cohort cube up to any subset of dimensions (see cube.py), e.g.
+    query_cube('clinical', ['age_band', 'bmi_band'], {'month': '2025-06'})
+    or query_cube('lifestyle', ['risk_class']) for flag prevalence per class.
+    Returns records, mean_bmi and mean_risk (clinical) or <flag>_pct
+    (lifestyle) per cell, summed across shards.
+    """
+    import pandas as pd
+    dimensions = list(dimensions)
+    sql, params = cube.query_sql(mode, dimensions, filters, LIFESTYLE_FLAGS)
+
+    def read(site, path):
+        conn = _connect(path)
+        df = pd.read_sql_query(sql, conn, params=params)
+        conn.close()
+        return df
+    
+    frames = _fan_out(read)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if len(frames) > 1 and dimensions:
+        df = df.groupby(dimensions, as_index=False, sort=True).sum()
+    elif len(frames) > 1:
+        df = df.sum().to_frame().T
+    df = df[df['records'] > 0].reset_index(drop=True)
+    df['records'] = df['records'].astype('int64')
+    # Bands in their natural order rather than alphabetically ('<30' before '30-39')
+    for name in dimensions:
+        if name in cube.BANDS:
+            labels = cube.BANDS[name][2]
+            categories = ([''] if (df[name] == '').any() else []) + labels
+            df[name] = pd.Categorical(df[name], categories=categories, ordered=True)
+    if dimensions:
+        df = df.sort_values(dimensions, kind='mergesort', ignore_index=True)
+    
+    records = df['records']
+    df['mean_bmi'] = (df.pop('bmi_sum') / records).round(2)
+    risk_sum = df.pop('risk_sum')
+    if mode == 'clinical':
+        df['mean_risk'] = (risk_sum / records).round(2)
+    else:
+        for name in LIFESTYLE_FLAGS:
+            df[f'{name}_pct'] = (100 * df.pop(f'{name}_count') / records).round(1)
+    df['share_pct'] = (100 * records / records.sum()).round(1)
+    return df
@@ -0,0 +1,155 @@
+"""
+One-off cleanup of duplicate records saved before idempotent submissions.
+
+A record is a duplicate when an earlier record of the same patient (or of no
+patient) has identical stored inputs, prediction, status and model version
+and was saved at most WINDOW seconds before it: the double clicks and
+replayed reruns that the idempotency key now turns into no-ops. The earliest
+copy is kept; records with a confirmed outcome are never deleted.
+
+Records are scanned in id order, BATCH_SIZE at a time (keyset: WHERE id >
+last), each batch in one short read; the earlier copy is found through the
+(patient_id, timestamp) index. Nothing is deleted until the whole file has
+been scanned, so every record is judged against the same rows wherever the
+batch boundaries fall (a copy of a copy is a duplicate even when the middle
+one is in the previous batch), and a dry run counts exactly what a real run
+deletes. The duplicates are then deleted BATCH_SIZE at a time, each batch in
+one short transaction, so live writes are only held up for one batch. Once a
+file has lost rows, its drift histograms, summary sketches and cohort cube
+are recounted once.
+
+    python dedupe.py [clinical|lifestyle|all] [--window 600] [--batch-size 5000] [--dry-run]
+"""
+import argparse
+
+import cube
+import database as db
+import drift
+import sketches
+
+BATCH_SIZE = 5000
+
+# Stored columns that must match for two records to be the same submission
+CONTENT_COLUMNS = {
+    'clinical': ['pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin', 'bmi',
+                 'diabetes_pedigree', 'age', 'prediction', 'risk_percentage', 'status',
+                 'status_code', 'status_tenths', 'model_version'],
+    'lifestyle': ['high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity', 'fruits',
+                  'vegetables', 'heavy_alcohol', 'general_health', 'mental_health', 'flags',
+                  'prediction', 'risk_class', 'status', 'status_code', 'status_tenths',
+                  'model_version'],
+}
+
+
+def duplicates_sql(mode, window):
+    """SQL selecting the ids of duplicate records with first_id < id <= last_id."""
+    table_name = db.PREDICTION_TABLES[mode]
+    same = ' AND '.join(f'e.{column} IS t.{column}' for column in CONTENT_COLUMNS[mode])
+    return f'''
+        SELECT t.id FROM {table_name} t
+        WHERE t.id > ? AND t.id <= ? AND t.confirmed_outcome IS NULL
+          AND EXISTS (
+              SELECT 1 FROM {table_name} e
+              WHERE e.patient_id IS t.patient_id
+                AND e.timestamp BETWEEN datetime(t.timestamp, '-{int(window)} seconds') AND t.timestamp
+                AND e.id < t.id
+                AND {same}
+          )
+    '''
+
+
+def _next_batch(path, table_name, after_id, batch_size):
+    """Last id of the next batch after after_id, or None when there is none."""
+    conn = db._connect(path)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT MAX(id) FROM (SELECT id FROM {table_name} WHERE id > ? ORDER BY id LIMIT ?)
+    ''', (after_id, batch_size))
+    last_id = cursor.fetchone()[0]
+    conn.close()
+    return last_id
+
+
+def _recount(path, mode):
+    """Rebuild the statistics that cannot subtract a deleted row."""
+    conn = db._connect(path)
+    cursor = conn.cursor()
+    drift.rebuild_histograms(cursor, mode, db.RECORD_VIEWS[mode])
+    sketches.rebuild(cursor, db.PREDICTION_TABLES[mode])
+    cube.rebuild(cursor, mode, db.RECORD_VIEWS[mode], db.LIFESTYLE_FLAGS)
+    conn.commit()
+    conn.close()
+
+
+def find_duplicates(path, mode, window=None, batch_size=BATCH_SIZE, progress=None):
+    """Ids of one file's duplicate records of a mode, scanned in keyset batches."""
+    window = window or db.IDEMPOTENCY_WINDOW
+    table_name = db.PREDICTION_TABLES[mode]
+    sql = duplicates_sql(mode, window)
+    found, after_id = [], 0
+    while True:
+        last_id = _next_batch(path, table_name, after_id, batch_size)
+        if last_id is None:
+            return found
+        conn = db._connect(path)
+        found.extend(record_id for (record_id,) in conn.execute(sql, (after_id, last_id)).fetchall())
+        conn.close()
+        after_id = last_id
+        if progress:
+            progress(path, mode, len(found), last_id)
+
+
+def dedupe_file(path, mode, window=None, batch_size=BATCH_SIZE, dry_run=False, progress=None):
+    """Delete (or with dry_run, count) one file's duplicate records of a mode. Returns the count."""
+    duplicate_ids = find_duplicates(path, mode, window, batch_size, progress)
+    if dry_run:
+        return len(duplicate_ids)
+
+    table_name = db.PREDICTION_TABLES[mode]
+    deleted = 0
+    for start in range(0, len(duplicate_ids), batch_size):
+        batch = duplicate_ids[start:start + batch_size]
+        conn = db._connect(path)
+        cursor = conn.cursor()
+        # An outcome confirmed since the scan keeps the record
+        cursor.execute(f'''
+            DELETE FROM {table_name}
+            WHERE id IN ({', '.join('?' * len(batch))}) AND confirmed_outcome IS NULL
+        ''', batch)
+        deleted += cursor.rowcount
+        conn.commit()
+        conn.close()
+
+    if deleted:
+        _recount(path, mode)
+    return deleted
+
+
+def dedupe(modes=('clinical', 'lifestyle'), window=None, batch_size=BATCH_SIZE, dry_run=False, progress=None):
+    """Dedupe every shard. Returns {mode: duplicates deleted (or found)}."""
+    totals = dict.fromkeys(modes, 0)
+    for _, path in db._shard_paths():
+        for mode in modes:
+            totals[mode] += dedupe_file(path, mode, window, batch_size, dry_run, progress)
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', default='all', choices=['clinical', 'lifestyle', 'all'])
+    parser.add_argument('--window', type=int, default=db.IDEMPOTENCY_WINDOW,
+                        help='seconds within which an identical record counts as a duplicate')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='count duplicates without deleting them')
+    args = parser.parse_args()
+
+    db.init_db()
+    modes = ('clinical', 'lifestyle') if args.mode == 'all' else (args.mode,)
+
+    def report(path, mode, found, last_id):
+        print(f"{path}: {found} duplicate {mode} records up to id {last_id}")
+
+    totals = dedupe(modes, args.window, args.batch_size, args.dry_run, report)
+    verb = 'Found' if args.dry_run else 'Deleted'
+    for mode, count in totals.items():
+        print(f"{verb} {count} duplicate {mode} records")
@@ -0,0 +1,254 @@
+"""
+Streaming input-drift monitoring.
+
+Every saved assessment adds one count per feature to a fixed-bin histogram in
+the feature_histograms table, inside the same transaction as the insert, so
+no history is ever rescanned. The live histograms are compared with reference
+histograms exported from the training data (models/reference_histograms.json)
+using the Population Stability Index and a binned Kolmogorov-Smirnov distance.
+
+When a feature's PSI crosses ALERT_PSI an alert row is written to drift_alerts
+(and logged); it is resolved once the score falls back below the threshold.
+
+Export the references once per training run:
+    python drift.py export clinical ../datasets/diabetes.csv
+    python drift.py export lifestyle ../datasets/diabetes_binary_health_indicators_BRFSS2015.csv
+"""
+import bisect
+import json
+import logging
+import math
+import os
+import sys
+
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'reference_histograms.json')
+
+# PSI above 0.1 is usually read as a moderate shift and above 0.2 as significant
+WARN_PSI = 0.1
+ALERT_PSI = 0.2
+# Minimum live sample size before scores are trusted, and how often to check
+MIN_SAMPLES = 50
+CHECK_EVERY = 25
+
+def _steps(start, stop, step):
+    return [start + i * step for i in range(int(round((stop - start) / step)) + 1)]
+
+# Bin edges per feature: value v falls in bin i when edges[i] <= v < edges[i + 1];
+# values outside the range are clamped into the first/last bin.
+FEATURE_BINS = {
+    'clinical': {
+        'pregnancies': _steps(0, 18, 1),
+        'glucose': _steps(0, 300, 20),
+        'blood_pressure': _steps(0, 150, 10),
+        'skin_thickness': _steps(0, 100, 10),
+        'insulin': _steps(0, 900, 50),
+        'bmi': _steps(0, 70, 5),
+        'diabetes_pedigree': _steps(0, 3.0, 0.25),
+        'age': _steps(20, 90, 5),
+    },
+    'lifestyle': {
+        'high_bp': [0, 1, 2],
+        'high_chol': [0, 1, 2],
+        'bmi': _steps(10, 60, 2.5),
+        'smoker': [0, 1, 2],
+        'physical_activity': [0, 1, 2],
+        'fruits': [0, 1, 2],
+        'vegetables': [0, 1, 2],
+        'heavy_alcohol': [0, 1, 2],
+        'general_health': _steps(1, 6, 1),
+        'mental_health': _steps(0, 32, 2),
+    },
+}
+
+# Training dataset column for each stored feature
+DATASET_COLUMNS = {
+    'clinical': {
+        'pregnancies': 'Pregnancies', 'glucose': 'Glucose', 'blood_pressure': 'BloodPressure',
+        'skin_thickness': 'SkinThickness', 'insulin': 'Insulin', 'bmi': 'BMI',
+        'diabetes_pedigree': 'DiabetesPedigreeFunction', 'age': 'Age',
+    },
+    'lifestyle': {
+        'high_bp': 'HighBP', 'high_chol': 'HighChol', 'bmi': 'BMI', 'smoker': 'Smoker',
+        'physical_activity': 'PhysActivity', 'fruits': 'Fruits', 'vegetables': 'Veggies',
+        'heavy_alcohol': 'HvyAlcoholConsump', 'general_health': 'GenHlth', 'mental_health': 'MentHlth',
+    },
+}
+
+logger = logging.getLogger('diabetes.drift')
+
+_reference_cache = {'mtime': None, 'data': {}}
+
+
+def bin_index(value, edges):
+    """Fixed-bin index for a value, clamped to the histogram range."""
+    index = bisect.bisect_right(edges, value) - 1
+    return min(max(index, 0), len(edges) - 2)
+
+
+def update_histograms(cursor, mode, row):
+    """Add one observation per feature. Runs inside the caller's transaction."""
+    cursor.executemany('''
+        INSERT INTO feature_histograms (mode, feature, bin, count) VALUES (?, ?, ?, 1)
+        ON CONFLICT(mode, feature, bin) DO UPDATE SET count = count + 1
+    ''', [(mode, feature, bin_index(row[feature], edges))
+          for feature, edges in FEATURE_BINS[mode].items() if row.get(feature) is not None])
+
+
+def remove_observation(cursor, mode, row):
+    """Take a deleted row back out of the histograms. Runs inside the caller's transaction."""
+    cursor.executemany('''
+        UPDATE feature_histograms SET count = count - 1
+        WHERE mode = ? AND feature = ? AND bin = ? AND count > 0
+    ''', [(mode, feature, bin_index(row[feature], edges))
+          for feature, edges in FEATURE_BINS[mode].items() if row.get(feature) is not None])
+
+
+def rebuild_histograms(cursor, mode, table_name):
+    """Recount a mode's histograms from the stored rows (backfill, dedupes, recompute job)."""
+    cursor.execute('DELETE FROM feature_histograms WHERE mode = ?', (mode,))
+    for feature, edges in FEATURE_BINS[mode].items():
+        counts = [0] * (len(edges) - 1)
+        cursor.execute(f'SELECT {feature} FROM {table_name} WHERE {feature} IS NOT NULL')
+        for (value,) in cursor.fetchall():
+            counts[bin_index(value, edges)] += 1
+        cursor.executemany(
+            'INSERT INTO feature_histograms (mode, feature, bin, count) VALUES (?, ?, ?, ?)',
+            [(mode, feature, i, c) for i, c in enumerate(counts) if c]
+        )
+
+
+def load_live_histograms(cursor, mode):
+    """{feature: [count per bin]} for the live population."""
+    histograms = {feature: [0] * (len(edges) - 1) for feature, edges in FEATURE_BINS[mode].items()}
+    cursor.execute('SELECT feature, bin, count FROM feature_histograms WHERE mode = ?', (mode,))
+    for feature, index, count in cursor.fetchall():
+        if feature in histograms and index < len(histograms[feature]):
+            histograms[feature][index] = count
+    return histograms
+
+
+def load_reference_histograms(mode):
+    """Reference counts exported at training time ({} if not exported yet)."""
+    try:
+        mtime = os.stat(REFERENCE_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if mtime != _reference_cache['mtime']:
+        with open(REFERENCE_PATH) as f:
+            _reference_cache['data'] = json.load(f)
+        _reference_cache['mtime'] = mtime
+    reference = _reference_cache['data'].get(mode, {})
+    # Ignore features whose bins no longer match the current edges
+    return {feature: entry['counts'] for feature, entry in reference.items()
+            if entry.get('edges') == FEATURE_BINS[mode].get(feature)}
+
+
+def export_reference_histograms(df, mode, path=None):
+    """Write reference histograms for a training DataFrame (dataset column names)."""
+    path = path or REFERENCE_PATH
+    data = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            data = json.load(f)
+    data[mode] = {}
+    for feature, edges in FEATURE_BINS[mode].items():
+        counts = [0] * (len(edges) - 1)
+        for value in df[DATASET_COLUMNS[mode][feature]].dropna():
+            counts[bin_index(value, edges)] += 1
+        data[mode][feature] = {'edges': edges, 'counts': counts}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return data[mode]
+
+
+def psi(expected_counts, actual_counts, epsilon=1e-4):
+    """Population Stability Index between two binned distributions."""
+    expected_total = sum(expected_counts) or 1
+    actual_total = sum(actual_counts) or 1
+    score = 0.0
+    for e, a in zip(expected_counts, actual_counts):
+        e_share = max(e / expected_total, epsilon)
+        a_share = max(a / actual_total, epsilon)
+        score += (a_share - e_share) * math.log(a_share / e_share)
+    return score
+
+
+def ks_distance(expected_counts, actual_counts):
+    """Largest gap between the two binned cumulative distributions."""
+    expected_total = sum(expected_counts) or 1
+    actual_total = sum(actual_counts) or 1
+    gap = expected_cdf = actual_cdf = 0.0
+    for e, a in zip(expected_counts, actual_counts):
+        expected_cdf += e / expected_total
+        actual_cdf += a / actual_total
+        gap = max(gap, abs(expected_cdf - actual_cdf))
+    return gap
+
+
+def compute_drift(cursor, mode, live=None):
+    """
+    PSI/KS per feature for a mode against its reference histograms. Pass
+    pre-loaded live histograms (e.g. summed over shards) instead of a cursor.
+    """
+    if live is None:
+        live = load_live_histograms(cursor, mode)
+    reference = load_reference_histograms(mode)
+    scores = []
+    for feature, counts in live.items():
+        samples = sum(counts)
+        ref = reference.get(feature)
+        if ref is None or samples < MIN_SAMPLES:
+            feature_psi = feature_ks = None
+            status = 'no reference' if ref is None else 'too few samples'
+        else:
+            feature_psi = psi(ref, counts)
+            feature_ks = ks_distance(ref, counts)
+            status = 'drift' if feature_psi >= ALERT_PSI else 'watch' if feature_psi >= WARN_PSI else 'stable'
+        scores.append({'mode': mode, 'feature': feature, 'samples': samples,
+                       'psi': feature_psi, 'ks': feature_ks, 'status': status})
+    return scores
+
+
+def check_alerts(cursor, mode):
+    """Open an alert for newly drifting features and resolve recovered ones."""
+    cursor.execute('SELECT feature FROM drift_alerts WHERE mode = ? AND resolved_at IS NULL', (mode,))
+    open_alerts = {row[0] for row in cursor.fetchall()}
+    fired = []
+    for score in compute_drift(cursor, mode):
+        feature, feature_psi = score['feature'], score['psi']
+        if feature_psi is None:
+            continue
+        if feature_psi >= ALERT_PSI and feature not in open_alerts:
+            cursor.execute('''
+                INSERT INTO drift_alerts (mode, feature, psi, ks, samples) VALUES (?, ?, ?, ?, ?)
+            ''', (mode, feature, feature_psi, score['ks'], score['samples']))
+            logger.warning("Input drift on %s.%s: PSI %.3f, KS %.3f (n=%d)",
+                           mode, feature, feature_psi, score['ks'], score['samples'])
+            fired.append(score)
+        elif feature_psi < ALERT_PSI and feature in open_alerts:
+            cursor.execute('''
+                UPDATE drift_alerts SET resolved_at = CURRENT_TIMESTAMP
+                WHERE mode = ? AND feature = ? AND resolved_at IS NULL
+            ''', (mode, feature))
+    return fired
+
+
+def record_observation(cursor, mode, row):
+    """Update the histograms for a new row and re-check alerts every CHECK_EVERY rows."""
+    update_histograms(cursor, mode, row)
+    first_feature = next(iter(FEATURE_BINS[mode]))
+    cursor.execute('SELECT SUM(count) FROM feature_histograms WHERE mode = ? AND feature = ?',
+                   (mode, first_feature))
+    total = cursor.fetchone()[0] or 0
+    if total >= MIN_SAMPLES and total % CHECK_EVERY == 0:
+        check_alerts(cursor, mode)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'export' or sys.argv[2] not in FEATURE_BINS:
+        print("Usage: python drift.py export <clinical|lifestyle> <training_csv>")
+        sys.exit(1)
+    import pandas as pd
+    exported = export_reference_histograms(pd.read_csv(sys.argv[3]), sys.argv[2])
+    print(f"Exported {len(exported)} reference histograms for {sys.argv[2]} to {REFERENCE_PATH}")
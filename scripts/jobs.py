@@ -0,0 +1,377 @@
+"""
+SQLite-backed job queue for maintenance and analytics work.
+
+Periodic or long work (backups, ANALYZE/VACUUM, drift recomputation, summary
+sketch updates, deduplication, rescoring) is queued here and run by worker.py
+in its own process, never inside a Streamlit rerun. Jobs live in the jobs
+table of DB_PATH:
+
+- enqueue() adds a job for a registered task (TASKS) with a priority and an
+  optional earliest start time.
+- claim() atomically takes the highest-priority ready job and leases it to a
+  worker for LEASE_SECONDS. Running workers extend their leases; a job whose
+  worker died is picked up again once its lease expires.
+- A failed job is retried with exponential backoff (RETRY_DELAY_SECONDS,
+  doubling) until it has run max_attempts times.
+
+Cron schedules (SCHEDULES, standard five-field expressions evaluated in UTC)
+are copied into job_schedules, where they can be disabled. enqueue_due()
+queues every schedule that is due and moves its next_run forward in the same
+transaction, so several workers never queue the same run twice.
+
+    python jobs.py enqueue <task> [--args '{"mode": "clinical"}'] [--priority 5]
+    python jobs.py list
+    python jobs.py schedules
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import database as db
+
+LEASE_SECONDS = int(os.environ.get('DIABETES_JOB_LEASE_SECONDS', '300'))
+RETRY_DELAY_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# --- TASKS ---
+# Each task takes keyword arguments from the job's args and returns a small
+# JSON-serializable summary. 'process' tasks are CPU-bound and run on the
+# worker's process pool; 'thread' tasks mostly wait on SQLite or the disk.
+def _analyze():
+    """Refresh the query planner statistics of every database file."""
+    def analyze(site, path):
+        conn = db._connect(path)
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        conn.close()
+    db._fan_out(analyze)
+    return {'files': len(db._shard_paths())}
+
+
+def _vacuum():
+    """Rebuild every database file to give freed pages back (holds the write lock while it runs)."""
+    def vacuum(site, path):
+        before = os.path.getsize(path)
+        conn = db._connect(path)
+        conn.execute('VACUUM')
+        conn.close()
+        return before - os.path.getsize(path)
+    return {'bytes_freed': sum(db._fan_out(vacuum))}
+
+
+def _backup():
+    import backup
+    return {'snapshots': len(backup.snapshot('scheduled', skip_unchanged=True))}
+
+
+def _prune_backups():
+    import backup
+    return {'removed': len(backup.prune()), 'kept_per_database': backup.KEEP,
+            'safety_kept_per_database': backup.KEEP_SAFETY}
+
+
+def _recompute_drift():
+    db.recompute_drift()
+    return {}
+
+
+def _update_sketches():
+    return db.update_sketches()
+
+
+def _dedupe():
+    import dedupe
+    return dedupe.dedupe()
+
+
+def _rescore(mode):
+    import rescore
+    version, scored = rescore.rescore(mode)
+    return {'mode': mode, 'version': version, 'scored': scored}
+
+
+def _model_update(mode, new_trees=None, replace=0):
+    import model_updates
+    result = model_updates.update_model(mode, new_trees or model_updates.NEW_TREES, replace)
+    return {'mode': mode, 'version': result['version'], 'training_rows': result['training_rows'],
+            'accuracy': result['updated']['accuracy']}
+
+
+TASKS = {
+    'analyze': (_analyze, 'thread'),
+    'vacuum': (_vacuum, 'thread'),
+    'backup': (_backup, 'thread'),
+    'prune_backups': (_prune_backups, 'thread'),
+    'recompute_drift': (_recompute_drift, 'thread'),
+    'update_sketches': (_update_sketches, 'thread'),
+    'dedupe': (_dedupe, 'thread'),
+    'rescore': (_rescore, 'process'),
+    'model_update': (_model_update, 'process'),
+}
+
+# (name, task, cron, args, priority)
+SCHEDULES = [
+    ('hourly-drift', 'recompute_drift', '0 * * * *', {}, 0),
+    ('sketches', 'update_sketches', '*/5 * * * *', {}, 0),
+    ('nightly-backup', 'backup', '0 2 * * *', {}, 10),
+    ('nightly-prune-backups', 'prune_backups', '30 2 * * *', {}, 0),
+    ('nightly-analyze', 'analyze', '0 3 * * *', {}, 0),
+    ('nightly-dedupe', 'dedupe', '30 3 * * *', {}, 0),
+    ('weekly-vacuum', 'vacuum', '0 4 * * 0', {}, -10),
+]
+
+
+def run_task(task, args):
+    """Run a registered task (also the entry point in pool worker processes)."""
+    func, _ = TASKS[task]
+    return func(**args)
+
+
+# --- CRON ---
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def _cron_values(field, low, high):
+    values = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        if spec == '*':
+            start, stop = low, high
+        elif '-' in spec:
+            start, stop = (int(value) for value in spec.split('-'))
+        else:
+            start = int(spec)
+            stop = high if step else start
+        if start < low or stop > high or start > stop:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, stop + 1, int(step) if step else 1))
+    return values
+
+
+def parse_cron(expression):
+    """(minutes, hours, days, months, weekdays) sets of a five-field cron expression (weekday 0 = Sunday)."""
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"Expected five cron fields: {expression!r}")
+    parsed = [_cron_values(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)]
+    # Like cron, a restricted day of month OR day of week matches
+    parsed.append((fields[2] != '*', fields[4] != '*'))
+    return parsed
+
+
+def next_run(expression, after):
+    """The first minute strictly after `after` (a datetime) that matches the expression."""
+    minutes, hours, days, months, weekdays, (days_set, weekdays_set) = parse_cron(expression)
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = moment + timedelta(days=366 * 5)
+    while moment < limit:
+        day_match = moment.day in days
+        weekday_match = (moment.weekday() + 1) % 7 in weekdays
+        if days_set and weekdays_set:
+            date_ok = day_match or weekday_match
+        else:
+            date_ok = day_match and weekday_match
+        if moment.month not in months or not date_ok:
+            moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+        elif moment.hour not in hours:
+            moment = (moment + timedelta(hours=1)).replace(minute=0)
+        elif moment.minute not in minutes:
+            moment += timedelta(minutes=1)
+        else:
+            return moment
+    raise ValueError(f"Cron expression never matches: {expression!r}")
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# --- QUEUE ---
+def enqueue(task, args=None, priority=0, delay_seconds=0, max_attempts=MAX_ATTEMPTS, schedule=None, cursor=None):
+    """Queue a job for a registered task. Returns the job id."""
+    if task not in TASKS:
+        raise ValueError(f"Unknown task: {task}")
+    conn = None
+    if cursor is None:
+        conn = db._connect()
+        cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO jobs (task, args, priority, schedule, max_attempts, run_after)
+        VALUES (?, ?, ?, ?, ?, datetime('now', ?))
+    ''', (task, json.dumps(args or {}), priority, schedule, max_attempts, f'{int(delay_seconds):+d} seconds'))
+    job_id = cursor.lastrowid
+    if conn is not None:
+        conn.commit()
+        conn.close()
+    return job_id
+
+
+def claim(worker_id, tasks=None, lease_seconds=LEASE_SECONDS):
+    """
+    Lease the next ready job (highest priority, then oldest) to a worker,
+    optionally only among the given tasks. Returns a job dict or None.
+    """
+    conn = db._connect()
+    cursor = conn.cursor()
+    # Jobs whose worker died and that have no attempts left fail for good;
+    # the others become ready again
+    cursor.execute('''
+        UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                        error = 'lease expired', lease_owner = NULL,
+                        finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END
+        WHERE status = 'running' AND lease_expires < CURRENT_TIMESTAMP
+    ''')
+    task_filter, params = '', []
+    if tasks is not None:
+        if not tasks:
+            conn.commit()
+            conn.close()
+            return None
+        task_filter = f"AND task IN ({', '.join('?' * len(tasks))})"
+        params = list(tasks)
+    cursor.execute(f'''
+        UPDATE jobs
+        SET status = 'running', lease_owner = ?, lease_expires = datetime('now', ?),
+            attempts = attempts + 1, started_at = CURRENT_TIMESTAMP, error = NULL
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP {task_filter}
+            ORDER BY priority DESC, run_after, id LIMIT 1
+        )
+        RETURNING id, task, args, priority, attempts, max_attempts, schedule
+    ''', [worker_id, f'{int(lease_seconds):+d} seconds'] + params)
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    if row is None:
+        return None
+    job = dict(zip(['id', 'task', 'args', 'priority', 'attempts', 'max_attempts', 'schedule'], row))
+    job['args'] = json.loads(job['args'] or '{}')
+    return job
+
+
+def extend_leases(worker_id, job_ids, lease_seconds=LEASE_SECONDS):
+    """Heartbeat: push back the lease of a worker's running jobs."""
+    if not job_ids:
+        return
+    conn = db._connect()
+    conn.execute(f'''
+        UPDATE jobs SET lease_expires = datetime('now', ?)
+        WHERE status = 'running' AND lease_owner = ? AND id IN ({', '.join('?' * len(job_ids))})
+    ''', [f'{int(lease_seconds):+d} seconds', worker_id] + list(job_ids))
+    conn.commit()
+    conn.close()
+
+
+def complete(job_id, worker_id, result, duration_seconds):
+    """Mark a leased job done. Returns False if the worker had lost the lease."""
+    conn = db._connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP, duration_seconds = ?,
+                        result = ?, lease_owner = NULL, lease_expires = NULL
+        WHERE id = ? AND status = 'running' AND lease_owner = ?
+    ''', (round(duration_seconds, 3), json.dumps(result, default=str), job_id, worker_id))
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return bool(updated)
+
+
+def fail(job_id, worker_id, error, duration_seconds):
+    """
+    Record a failed attempt: the job is queued again after a backoff delay,
+    or failed for good once it has used its attempts.
+    """
+    conn = db._connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+            run_after = datetime('now', '+' || (? << (attempts - 1)) || ' seconds'),
+            finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+            duration_seconds = ?, error = ?, lease_owner = NULL, lease_expires = NULL
+        WHERE id = ? AND status = 'running' AND lease_owner = ?
+    ''', (RETRY_DELAY_SECONDS, round(duration_seconds, 3), str(error)[:2000], job_id, worker_id))
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return bool(updated)
+
+
+# --- SCHEDULES ---
+def sync_schedules(schedules=None):
+    """Add or update the configured schedules (the enabled flag is left as set in the table)."""
+    schedules = SCHEDULES if schedules is None else schedules
+    now = _utcnow()
+    conn = db._connect()
+    cursor = conn.cursor()
+    for name, task, cron, args, priority in schedules:
+        if task not in TASKS:
+            raise ValueError(f"Schedule {name} has an unknown task: {task}")
+        first_run = next_run(cron, now).strftime(_TIME_FORMAT)
+        cursor.execute('''
+            INSERT INTO job_schedules (name, task, args, cron, priority, next_run)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                task = excluded.task, args = excluded.args, priority = excluded.priority,
+                next_run = CASE WHEN cron = excluded.cron THEN next_run ELSE excluded.next_run END,
+                cron = excluded.cron
+        ''', (name, task, json.dumps(args), cron, priority, first_run))
+    conn.commit()
+    conn.close()
+
+
+def enqueue_due():
+    """Queue a job for every enabled schedule that is due. Returns the new job ids."""
+    now = _utcnow()
+    conn = db._connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT name, task, args, cron, priority, next_run FROM job_schedules
+        WHERE enabled = 1 AND next_run <= ?
+    ''', (now.strftime(_TIME_FORMAT),))
+    job_ids = []
+    for name, task, args, cron, priority, due in cursor.fetchall():
+        # Compare-and-set on next_run: only one worker queues each run. A
+        # schedule that was missed for a while runs once, not once per miss.
+        cursor.execute('''
+            UPDATE job_schedules SET next_run = ?, last_enqueued = CURRENT_TIMESTAMP
+            WHERE name = ? AND next_run = ?
+        ''', (next_run(cron, now).strftime(_TIME_FORMAT), name, due))
+        if cursor.rowcount:
+            job_ids.append(enqueue(task, json.loads(args or '{}'), priority, schedule=name, cursor=cursor))
+        conn.commit()
+    conn.close()
+    return job_ids
+
+
+def set_schedule_enabled(name, enabled):
+    conn = db._connect()
+    conn.execute('UPDATE job_schedules SET enabled = ? WHERE name = ?', (int(enabled), name))
+    conn.commit()
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['enqueue', 'list', 'schedules'])
+    parser.add_argument('task', nargs='?', choices=sorted(TASKS))
+    parser.add_argument('--args', default='{}', help='task arguments as a JSON object')
+    parser.add_argument('--priority', type=int, default=0)
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.command == 'enqueue':
+        if not args.task:
+            parser.error('enqueue needs a task')
+        print(f"Queued job {enqueue(args.task, json.loads(args.args), args.priority)} ({args.task})")
+    elif args.command == 'list':
+        print(db.get_recent_jobs().to_string(index=False))
+    else:
+        sync_schedules()
+        print(db.get_job_schedules().to_string(index=False))
@@ -1,7 +1,102 @@
-def get_clinical_advice(prediction, input_data, probability):
+import re
+
+# Status lines by code. Records can store the code plus the percentage (in
+# tenths) instead of the rendered text; render_status rebuilds the exact string.
+STATUS_TEMPLATES = {
+    1: "DIABETIC (High Risk - {value:.1f}% probability)",
+    2: "⚠️ DIABETIC (High Glucose Override)",
+    3: "⚠️ PRE-DIABETIC (Elevated Glucose)",
+    4: "✅ NON-DIABETIC (Low Risk - {value:.1f}% confidence)",
+    11: " DIABETIC (High Risk - {value:.1f}% Match)",
+    12: " PRE-DIABETIC (Moderate Risk - {value:.1f}% Match)",
+    13: "✅ HEALTHY (Low Risk - {value:.1f}% Match)",
+}
+
+_STATUS_PATTERNS = {
+    code: re.compile(re.escape(template).replace(re.escape('{value:.1f}'), r'(-?\d+\.\d)') + '$')
+    for code, template in STATUS_TEMPLATES.items()
+}
+
+
+def render_status(code, value=None):
+    """Status line for a code and its percentage."""
+    return STATUS_TEMPLATES[code].format(value=value)
+
+
+def encode_status(status):
+    """
+    (code, tenths) for a rendered status line, e.g. 873 for 87.3%; tenths is
+    None when the line has no percentage. Unknown text gives (None, None).
+    """
+    for code, pattern in _STATUS_PATTERNS.items():
+        match = pattern.match(status or '')
+        if match:
+            return code, round(float(match.group(1)) * 10) if match.groups() else None
+    return None, None
+
+
+def status_sql(code_column, tenths_column):
+    """SQL expression that renders a status line from its stored code."""
+    cases = []
+    for code, template in STATUS_TEMPLATES.items():
+        if '{value:.1f}' in template:
+            prefix, suffix = template.split('{value:.1f}')
+            text = f"'{prefix}' || printf('%.1f', {tenths_column} / 10.0) || '{suffix}'"
+        else:
+            text = f"'{template}'"
+        cases.append(f'WHEN {code} THEN {text}')
+    return f"CASE {code_column} {' '.join(cases)} END"
+
+
+# Model input labels, in the order the models were trained on
+CLINICAL_FEATURE_LABELS = ['Pregnancies', 'Glucose', 'Blood Pressure', 'Skin Thickness', 'Insulin',
+                           'BMI', 'Diabetes Pedigree', 'Age']
+LIFESTYLE_FEATURE_LABELS = ['High Blood Pressure', 'High Cholesterol', 'BMI', 'Smoking', 'Physical Activity',
+                            'Fruit Intake', 'Vegetable Intake', 'Heavy Alcohol Use', 'General Health',
+                            'Mental Health']
+
+# How many of the model's top risk-raising features are listed
+TOP_MODEL_FACTORS = 3
+
+
+def _rank_reasons(reasons, contributions, labels):
+    """
+    Turn (feature_index, text) reasons into the explanation lines.
+
+    With contributions, the reasons the model counted towards the risk come
+    first, largest contribution first, joined by the top TOP_MODEL_FACTORS
+    risk-raising features no reason covers. Reasons with no positive
+    contribution are kept last and relabelled instead of showing a negative
+    impact. Without contributions the hand-written order is kept.
+    """
+    if contributions is None:
+        return [text for _, text in reasons]
+
+    def impact(feature_index):
+        indexes = feature_index if isinstance(feature_index, tuple) else (feature_index,)
+        return round(max(float(contributions[i]) for i in indexes) * 100, 1)
+
+    covered = set()
+    for feature_index, _ in reasons:
+        covered.update(feature_index if isinstance(feature_index, tuple) else (feature_index,))
+
+    raising = [(impact(idx), f"{text} (Model impact: +{impact(idx):.1f}% risk)")
+               for idx, text in reasons if impact(idx) > 0]
+    top = sorted(range(len(labels)), key=lambda i: contributions[i], reverse=True)[:TOP_MODEL_FACTORS]
+    raising += [(impact(i), f"Model factor - {labels[i]}: your value raised the predicted risk by {impact(i):.1f}%.")
+                for i in top if i not in covered and impact(i) > 0]
+    not_raising = [f"{text} (Not a risk driver in this assessment.)"
+                   for idx, text in reasons if impact(idx) <= 0]
+    return [line for _, line in sorted(raising, key=lambda r: r[0], reverse=True)] + not_raising
+
+
+def get_clinical_advice(prediction, input_data, probability, contributions=None):
     """
     input_data order: Pregnancies, Glucose, BloodPressure, SkinThickness, 
     Insulin, BMI, Pedigree, Age
+    contributions (optional): per-feature contribution to the diabetic
+    probability from attributions.py, in the same order; used to rank the
+    reasons and add the model's top risk factors.
     """
     glucose = input_data[1]
     bp = input_data[2]
@@ -13,25 +108,27 @@ def get_clinical_advice(prediction, input_data, probability):
 
     # 1. Logic for Explanations (Why)
     if glucose > 140:
-        reasons.append(f"High Glucose ({glucose} mg/dL): Your blood sugar is elevated, which is the primary indicator of diabetes.")
+        reasons.append((1, f"High Glucose ({glucose} mg/dL): Your blood sugar is elevated, which is the primary indicator of diabetes."))
     elif glucose > 100:
-        reasons.append(f"Elevated Glucose ({glucose} mg/dL): Your blood sugar is slightly above normal range.")
+        reasons.append((1, f"Elevated Glucose ({glucose} mg/dL): Your blood sugar is slightly above normal range."))
     
     if bmi > 30:
-        reasons.append(f"High BMI ({bmi}): Excess weight can make your body's cells more resistant to insulin.")
+        reasons.append((5, f"High BMI ({bmi}): Excess weight can make your body's cells more resistant to insulin."))
     elif bmi > 25:
-        reasons.append(f"Elevated BMI ({bmi}): Being overweight increases diabetes risk.")
+        reasons.append((5, f"Elevated BMI ({bmi}): Being overweight increases diabetes risk."))
     
     if bp > 80:
-        reasons.append(f"High Blood Pressure ({bp} mmHg): Hypertension often coexists with diabetes and increases cardiovascular risk.")
+        reasons.append((2, f"High Blood Pressure ({bp} mmHg): Hypertension often coexists with diabetes and increases cardiovascular risk."))
     
     if age > 45:
-        reasons.append("Age Factor: Risk naturally increases as you get older, requiring more frequent monitoring.")
+        reasons.append((7, "Age Factor: Risk naturally increases as you get older, requiring more frequent monitoring."))
+
+    reasons = _rank_reasons(reasons, contributions, CLINICAL_FEATURE_LABELS)
 
     # 2. Logic for Recommendations (What to do)
     if prediction == 1:
         # HIGH RISK - DIABETIC
-        status = f"DIABETIC (High Risk - {probability:.1f}% probability)"
+        status = render_status(1, probability)
         tips = [
             "Immediate Action: Consult an endocrinologist for a formal diagnostic test (HbA1c).",
             "Nutrition: Adopt a 'Diabetes Plate Method'—half non-starchy vegetables, one-quarter protein, one-quarter starch.",
@@ -45,11 +142,11 @@ def get_clinical_advice(prediction, input_data, probability):
             reasons.append("Your clinical markers indicate a high probability of diabetes based on the model analysis.")
     else:
         if glucose >= 126:
-            status = "⚠️ DIABETIC (High Glucose Override)"
+            status = render_status(2)
         elif glucose >= 100:
-            status = "⚠️ PRE-DIABETIC (Elevated Glucose)"
+            status = render_status(3)
         else:
-            status = f"✅ NON-DIABETIC (Low Risk - {100 - probability:.1f}% confidence)"
+            status = render_status(4, 100 - probability)
         if not reasons:
             reasons.append("Your clinical markers are currently within the healthy reference range.")
         # SMART OVERRIDE: Warning for high glucose even if AI is optimistic
@@ -78,10 +175,12 @@ def get_clinical_advice(prediction, input_data, probability):
     return status, reasons, tips
 
 
-def get_lifestyle_advice(prediction, input_data, probabilities):
+def get_lifestyle_advice(prediction, input_data, probabilities, contributions=None):
     """
     input_data order: HighBP, HighChol, BMI, Smoker, PhysActivity, 
     Fruits, Veggies, HvyAlcohol, GenHlth, MentHlth
+    contributions (optional): per-feature contribution to the pre-diabetic or
+    diabetic probability from attributions.py, in the same order.
     """
     high_bp = input_data[0]
     high_chol = input_data[1]
@@ -98,35 +197,37 @@ def get_lifestyle_advice(prediction, input_data, probabilities):
 
     # 1. Logic for Explanations
     if high_bp == 1:
-        reasons.append("❗ Hypertension: Your history of high blood pressure significantly raises your metabolic risk.")
+        reasons.append((0, "❗ Hypertension: Your history of high blood pressure significantly raises your metabolic risk."))
     
     if high_chol == 1:
-        reasons.append(" High Cholesterol: Elevated lipids can interfere with metabolic health.")
+        reasons.append((1, " High Cholesterol: Elevated lipids can interfere with metabolic health."))
     
     if bmi > 30:
-        reasons.append(f" BMI ({bmi}): Obesity is a leading driver of Type 2 Diabetes.")
+        reasons.append((2, f" BMI ({bmi}): Obesity is a leading driver of Type 2 Diabetes."))
     elif bmi > 25:
-        reasons.append(f" BMI ({bmi}): Being overweight increases your risk of developing diabetes.")
+        reasons.append((2, f" BMI ({bmi}): Being overweight increases your risk of developing diabetes."))
     
     if smoker == 1:
-        reasons.append(" Smoking: Nicotine can increase blood sugar levels and lead to insulin resistance.")
+        reasons.append((3, " Smoking: Nicotine can increase blood sugar levels and lead to insulin resistance."))
     
     if alcohol == 1:
-        reasons.append(" Alcohol Consumption: Heavy drinking can cause chronic inflammation of the pancreas.")
+        reasons.append((7, " Alcohol Consumption: Heavy drinking can cause chronic inflammation of the pancreas."))
     
     if phys_act == 0:
-        reasons.append(" Physical Inactivity: Lack of exercise increases diabetes risk.")
+        reasons.append((4, " Physical Inactivity: Lack of exercise increases diabetes risk."))
     
     if fruits == 0 or veggies == 0:
-        reasons.append(" Poor Diet: Limited fruit/vegetable intake affects metabolic health.")
+        reasons.append(((5, 6), " Poor Diet: Limited fruit/vegetable intake affects metabolic health."))
     
     if gen_health >= 4:
-        reasons.append(" General Health: Self-reported poor health correlates with higher diabetes risk.")
+        reasons.append((8, " General Health: Self-reported poor health correlates with higher diabetes risk."))
+
+    reasons = _rank_reasons(reasons, contributions, LIFESTYLE_FEATURE_LABELS)
 
     # 2. Logic for Recommendations
     if prediction == 2.0:
         # DIABETIC
-        status = f" DIABETIC (High Risk - {probabilities[2]:.1f}% Match)"
+        status = render_status(11, probabilities[2])
         tips = [
             " Medical Consultation: You should seek professional medical advice for a diagnostic screening.",
             " Lifestyle Change: If you smoke, consider a cessation program to improve insulin sensitivity.",
@@ -141,7 +242,7 @@ def get_lifestyle_advice(prediction, input_data, probabilities):
             
     elif prediction == 1.0:
         # PRE-DIABETIC
-        status = f" PRE-DIABETIC (Moderate Risk - {probabilities[1]:.1f}% Match)"
+        status = render_status(12, probabilities[1])
         tips = [
             " Warning: This stage is often reversible with immediate lifestyle changes!",
             " Movement: Increase physical activity. Strength training twice a week can improve glucose uptake.",
@@ -156,7 +257,7 @@ def get_lifestyle_advice(prediction, input_data, probabilities):
             
     else:
         # HEALTHY
-        status = f"✅ HEALTHY (Low Risk - {probabilities[0]:.1f}% Match)"
+        status = render_status(13, probabilities[0])
         if not reasons:
             reasons.append("Your lifestyle choices suggest a low current risk for diabetes.")
         # NEW SMART LOGIC: Check for risk factors even if result is Healthy
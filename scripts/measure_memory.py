@@ -0,0 +1,116 @@
+"""
+Memory use of the record read APIs on a synthetic database.
+
+Fills a temporary database with N rows per table, then for each mode compares
+get_all_*_records() (SELECT * through read_sql_query) with read_records()
+(typed, chunked) for all columns and for a typical chart projection. Reports
+the size of the returned frame and the peak allocated while building it.
+
+Usage:
+    python measure_memory.py [--rows 1000000] [--keep path.db]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import database as db
+import logic
+
+PROJECTIONS = {
+    'clinical': ['timestamp', 'age', 'prediction'],
+    'lifestyle': ['timestamp', 'bmi', 'risk_class'],
+}
+
+
+def fill_database(path, rows, seed=7):
+    """Write `rows` synthetic records per table straight into a fresh database."""
+    db.DB_PATH = path
+    db.init_db()
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    batch = 50000
+    for start in range(0, rows, batch):
+        clinical, lifestyle = [], []
+        for _ in range(min(batch, rows - start)):
+            risk = rng.uniform(0, 100)
+            prediction = int(risk > 50)
+            clinical.append((
+                rng.randint(0, 12), rng.uniform(60, 250), rng.uniform(50, 110), rng.uniform(0, 60),
+                rng.uniform(0, 500), rng.uniform(16, 55), rng.uniform(0.05, 2.4), rng.randint(21, 85),
+                prediction, risk,
+                logic.render_status(1, risk) if prediction else logic.render_status(4, 100 - risk),
+                'a1b2c3d4e5f6'
+            ))
+            level = rng.choice([0.0, 1.0, 2.0])
+            lifestyle.append((
+                *[rng.randint(0, 1) for _ in range(2)], rng.uniform(15, 50),
+                *[rng.randint(0, 1) for _ in range(5)], rng.randint(1, 5), rng.randint(0, 30),
+                level, db.RISK_CLASSES[level], logic.render_status(13 - int(level), risk), 'f6e5d4c3b2a1'
+            ))
+        conn.executemany('''
+            INSERT INTO clinical_predictions (pregnancies, glucose, blood_pressure, skin_thickness,
+                insulin, bmi, diabetes_pedigree, age, prediction, risk_percentage, status, model_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', clinical)
+        conn.executemany('''
+            INSERT INTO lifestyle_predictions (high_bp, high_chol, bmi, smoker, physical_activity,
+                fruits, vegetables, heavy_alcohol, general_health, mental_health, prediction,
+                risk_class, status, model_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', lifestyle)
+        conn.commit()
+    conn.close()
+
+
+def measure(label, load):
+    """(label, frame MB, peak MB, seconds) for one loader."""
+    # Time without tracing (tracemalloc slows allocation-heavy code a lot)
+    started = time.perf_counter()
+    load()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    df = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = df.memory_usage(deep=True).sum()
+    return label, size / 1e6, peak / 1e6, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--keep', help="Database file to create and keep (default: a temporary file)")
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(), 'memory.db')
+    if not os.path.exists(path):
+        print(f"Writing {args.rows:,} rows per table to {path}...")
+        fill_database(path, args.rows)
+    db.DB_PATH = path
+    import pandas  # imported up front so the first measurement does not include it
+
+    loaders = {
+        'clinical': db.get_all_clinical_records,
+        'lifestyle': db.get_all_lifestyle_records,
+    }
+    print(f"{'loader':<58}{'frame MB':>10}{'peak MB':>10}{'seconds':>10}")
+    for mode, select_all in loaders.items():
+        results = [
+            measure(f'{mode}: SELECT * (read_sql_query)', select_all),
+            measure(f'{mode}: read_records (all columns)', lambda: db.read_records(mode)),
+            measure(f'{mode}: read_records {PROJECTIONS[mode]}',
+                    lambda: db.read_records(mode, PROJECTIONS[mode])),
+        ]
+        for label, size, peak, elapsed in results:
+            print(f'{label:<58}{size:>10.1f}{peak:>10.1f}{elapsed:>10.2f}')
+
+    if not args.keep:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
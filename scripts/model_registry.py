@@ -0,0 +1,266 @@
+"""
+Versioned model registry.
+
+models/manifest.json lists, for every model key ('clinical', 'lifestyle', ...),
+the model and scaler files with their version and SHA-256 hashes:
+
+    {
+        "models": {
+            "clinical": {"name": "pima", "version": "1",
+                         "model": "pima_model.pkl", "scaler": "pima_scaler.pkl",
+                         "model_sha256": "...", "scaler_sha256": "..."},
+            ...
+        }
+    }
+
+Each key is loaded lazily on first use. A watcher thread polls the manifest and
+the loaded files; when they change the new version is loaded on the side and
+swapped in with a single assignment, so requests already holding the old entry
+finish with it. Entries not used for IDLE_TTL seconds are evicted.
+
+Without a manifest the original pickles in models/ are used and the version is
+the first 12 characters of the model file hash.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '..', 'models')
+MANIFEST_PATH = os.path.join(MODELS_DIR, 'manifest.json')
+
+# Seconds between manifest/file checks, and idle time before a model is evicted
+POLL_INTERVAL = float(os.environ.get('DIABETES_MODEL_POLL_SECONDS', '5'))
+IDLE_TTL = float(os.environ.get('DIABETES_MODEL_IDLE_TTL', '1800'))
+
+DEFAULT_MODELS = {
+    'clinical': {'name': 'pima', 'model': 'pima_model.pkl', 'scaler': 'pima_scaler.pkl'},
+    'lifestyle': {'name': 'cdc', 'model': 'cdc_model.pkl', 'scaler': 'cdc_scaler.pkl'},
+}
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _resolve(filename):
+    return filename if os.path.isabs(filename) else os.path.join(MODELS_DIR, filename)
+
+
+def read_manifest():
+    """Read the manifest, falling back to the default model files."""
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            return json.load(f).get('models', {})
+    return {key: dict(spec) for key, spec in DEFAULT_MODELS.items()}
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _dump_pickle_atomic(obj, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def publish_model(key, model, scaler, version, name=None):
+    """
+    Write a new model/scaler version to models/ and point the manifest at it.
+    Files are written under versioned names and the manifest is replaced
+    atomically, so running registries pick the new version up on their next poll.
+    """
+    models = read_manifest()
+    spec = dict(models.get(key) or DEFAULT_MODELS.get(key) or {})
+    name = name or spec.get('name', key)
+
+    model_file = f"{name}_{version}_model.pkl"
+    scaler_file = f"{name}_{version}_scaler.pkl"
+    _dump_pickle_atomic(model, _resolve(model_file))
+    _dump_pickle_atomic(scaler, _resolve(scaler_file))
+
+    models[key] = {
+        'name': name,
+        'version': str(version),
+        'model': model_file,
+        'scaler': scaler_file,
+        'model_sha256': file_sha256(_resolve(model_file)),
+        'scaler_sha256': file_sha256(_resolve(scaler_file)),
+    }
+    _write_json_atomic(MANIFEST_PATH, {'models': models})
+    return models[key]
+
+
+class ModelEntry:
+    """A loaded model/scaler pair. Entries are never mutated after a swap."""
+
+    def __init__(self, key, spec, model, scaler, model_sha256, signature):
+        self.key = key
+        self.name = spec.get('name', key)
+        self.version = str(spec.get('version') or model_sha256[:12])
+        self.model = model
+        self.scaler = scaler
+        self.spec = spec
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+    def __repr__(self):
+        return f"ModelEntry({self.key!r}, {self.name!r}, version={self.version!r})"
+
+
+class ModelRegistry:
+    """Lazily loads, hot-reloads and evicts the models listed in the manifest."""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, idle_ttl=IDLE_TTL):
+        self.poll_interval = poll_interval
+        self.idle_ttl = idle_ttl
+        self._specs = read_manifest()
+        self._manifest_mtime = self._get_manifest_mtime()
+        self._entries = {}
+        self._load_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    # --- Public API ---
+    def get(self, key):
+        """Return the current entry for a key, loading it on first use."""
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._load_lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._load(key, self._specs)
+                    self._entries[key] = entry
+        entry.last_used = time.time()
+        return entry
+
+    def has(self, key):
+        """True if the manifest lists this key."""
+        return key in self._specs
+
+    def loaded(self):
+        """Snapshot of the currently loaded entries."""
+        return dict(self._entries)
+
+    def evict(self, key):
+        self._entries.pop(key, None)
+
+    def start_watcher(self):
+        """Start the background thread that hot-reloads and evicts models."""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="model-registry-watcher", daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def check_for_updates(self):
+        """Reload the manifest and swap in any loaded model whose files changed."""
+        mtime = self._get_manifest_mtime()
+        if mtime != self._manifest_mtime:
+            try:
+                self._specs = read_manifest()
+                self._manifest_mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Model manifest not reloaded: {e}")
+                return
+
+        for key, entry in list(self._entries.items()):
+            spec = self._specs.get(key)
+            if spec is None:
+                self.evict(key)
+                continue
+            if spec == entry.spec and self._signature(spec) == entry.signature:
+                continue
+            try:
+                new_entry = self._load(key, self._specs)
+            except Exception as e:
+                # Keep serving the old version if the new files are incomplete
+                print(f"Model '{key}' not reloaded: {e}")
+                continue
+            new_entry.last_used = entry.last_used
+            self._entries[key] = new_entry
+            print(f"Model '{key}' updated: {entry.version} -> {new_entry.version}")
+
+    def evict_idle(self):
+        """Drop entries not used for idle_ttl seconds."""
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if now - entry.last_used > self.idle_ttl:
+                self.evict(key)
+
+    # --- Internals ---
+    def _get_manifest_mtime(self):
+        try:
+            return os.stat(MANIFEST_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _signature(spec):
+        """File identity used to notice pickles replaced in place."""
+        signature = []
+        for field in ('model', 'scaler'):
+            try:
+                st = os.stat(_resolve(spec[field]))
+                signature.append((st.st_mtime_ns, st.st_size))
+            except (KeyError, FileNotFoundError):
+                signature.append(None)
+        return tuple(signature)
+
+    def _load(self, key, specs):
+        if key not in specs:
+            raise KeyError(f"Model '{key}' is not in the manifest")
+        spec = specs[key]
+        signature = self._signature(spec)
+        model_path = _resolve(spec['model'])
+        scaler_path = _resolve(spec['scaler'])
+
+        model_sha256 = file_sha256(model_path)
+        for path, expected, actual in ((model_path, spec.get('model_sha256'), model_sha256),
+                                       (scaler_path, spec.get('scaler_sha256'), None)):
+            if expected:
+                actual = actual or file_sha256(path)
+                if actual != expected:
+                    raise ValueError(f"Hash mismatch for {os.path.basename(path)}")
+
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        with open(scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        return ModelEntry(key, spec, model, scaler, model_sha256, signature)
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_updates()
+                self.evict_idle()
+            except Exception as e:
+                print(f"Model registry watcher error: {e}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide registry with its watcher running."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry().start_watcher()
+        return _registry
@@ -0,0 +1,190 @@
+"""
+Incremental model updates from confirmed diagnoses.
+
+When a clinician confirms an assessment with an HbA1c result
+(database.confirm_outcome), the record gets a confirmed outcome. An update
+grows the current random forest with NEW_TREES extra trees fit only on the
+outcomes confirmed since the previous update (scikit-learn's warm_start), and
+can retire the REPLACE oldest trees so the forest keeps a bounded size and
+slowly shifts towards recent data. The cost depends on the number of newly
+confirmed records, not on the size of the original Pima/BRFSS training sets.
+
+Records whose id is a multiple of HOLDOUT_MODULUS are never trained on. Every
+update is evaluated on all of those that are confirmed, next to the model it
+was grown from, and published as a new registry version (<parent>-u<n>).
+The model_updates table keeps the lineage and the metrics.
+
+    python model_updates.py clinical [--new-trees 25] [--replace 0] [--dry-run]
+    python model_updates.py lifestyle
+    python model_updates.py history
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+
+import database as db
+import model_registry
+
+NEW_TREES = 25
+MIN_TRAINING_ROWS = 30
+HOLDOUT_MODULUS = 5
+
+FEATURES = {
+    'clinical': ['pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin',
+                 'bmi', 'diabetes_pedigree', 'age'],
+    'lifestyle': ['high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity', 'fruits',
+                  'vegetables', 'heavy_alcohol', 'general_health', 'mental_health'],
+}
+
+
+def split_holdout(df):
+    """(training rows, held-out rows) of confirmed records, by record id."""
+    holdout = df['id'] % HOLDOUT_MODULUS == 0
+    return df[~holdout], df[holdout]
+
+
+def evaluate(model, scaler, df, mode):
+    """Accuracy, ROC AUC (one-vs-rest for three classes) and log loss on confirmed rows."""
+    from sklearn.metrics import accuracy_score, log_loss, roc_auc_score
+    if df.empty:
+        return {'accuracy': None, 'auc': None, 'log_loss': None}
+    X = scaler.transform(df[FEATURES[mode]].to_numpy(dtype=np.float64))
+    y = df['confirmed_outcome'].to_numpy(dtype=np.float64)
+    probabilities = model.predict_proba(X)
+    predictions = model.classes_[probabilities.argmax(axis=1)]
+    metrics = {
+        'accuracy': float(accuracy_score(y, predictions)),
+        'log_loss': float(log_loss(y, probabilities, labels=model.classes_)),
+        'auc': None,
+    }
+    # AUC needs every class among the held-out outcomes
+    if len(np.unique(y)) == len(model.classes_):
+        if len(model.classes_) == 2:
+            metrics['auc'] = float(roc_auc_score(y, probabilities[:, 1]))
+        else:
+            metrics['auc'] = float(roc_auc_score(y, probabilities, multi_class='ovr', labels=model.classes_))
+    return metrics
+
+
+def grow_forest(model, X, y, new_trees=NEW_TREES, replace=0):
+    """
+    Copy of a fitted forest with `replace` oldest trees dropped and
+    `new_trees` trees fit on (X, y) added.
+    """
+    missing = set(model.classes_.tolist()) - set(np.unique(y).tolist())
+    if missing:
+        # Warm-started trees must share the forest's classes
+        raise ValueError(f"New confirmed outcomes have no examples of class(es) {sorted(missing)}")
+    if replace >= len(model.estimators_):
+        raise ValueError("Cannot replace every tree of the forest")
+    grown = copy.deepcopy(model)
+    grown.estimators_ = grown.estimators_[replace:]
+    grown.n_estimators = len(grown.estimators_) + new_trees
+    grown.warm_start = True
+    grown.fit(X, y.astype(model.classes_.dtype))
+    grown.warm_start = False
+    return grown
+
+
+def _next_version(parent_version):
+    base, _, number = parent_version.partition('-u')
+    return f"{base}-u{int(number) + 1 if number.isdigit() else 1}"
+
+
+def _last_confirmed_until(mode):
+    conn = db._connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT confirmed_until FROM model_updates
+        WHERE mode = ? AND published = 1 ORDER BY id DESC LIMIT 1
+    ''', (mode,))
+    found = cursor.fetchone()
+    conn.close()
+    return found[0] if found else None
+
+
+def _save_update(mode, result):
+    conn = db._connect()
+    conn.execute('''
+        INSERT INTO model_updates
+        (mode, version, parent_version, new_trees, replaced_trees, total_trees, training_rows,
+         holdout_rows, confirmed_until, parent_accuracy, accuracy, parent_auc, auc,
+         parent_log_loss, log_loss, fit_seconds, published)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (mode, result['version'], result['parent_version'], result['new_trees'],
+          result['replaced_trees'], result['total_trees'], result['training_rows'],
+          result['holdout_rows'], result['confirmed_until'],
+          result['parent']['accuracy'], result['updated']['accuracy'],
+          result['parent']['auc'], result['updated']['auc'],
+          result['parent']['log_loss'], result['updated']['log_loss'],
+          result['fit_seconds'], int(result['published'])))
+    conn.commit()
+    conn.close()
+
+
+def update_model(mode, new_trees=NEW_TREES, replace=0, min_rows=MIN_TRAINING_ROWS, publish=True):
+    """
+    Grow the current model with outcomes confirmed since the last published
+    update, evaluate it on the held-out confirmed records and (unless
+    publish is False) register it as a new version. Returns a result dict.
+    """
+    entry = model_registry.ModelRegistry().get(mode)
+    since = _last_confirmed_until(mode)
+    training, _ = split_holdout(db.get_confirmed_records(mode, since))
+    _, holdout = split_holdout(db.get_confirmed_records(mode))
+    if len(training) < min_rows:
+        raise ValueError(f"Only {len(training)} newly confirmed {mode} records; need at least {min_rows}")
+
+    X = entry.scaler.transform(training[FEATURES[mode]].to_numpy(dtype=np.float64))
+    y = training['confirmed_outcome'].to_numpy(dtype=np.float64)
+    started = time.perf_counter()
+    model = grow_forest(entry.model, X, y, new_trees, replace)
+    fit_seconds = time.perf_counter() - started
+
+    result = {
+        'version': _next_version(entry.version),
+        'parent_version': entry.version,
+        'new_trees': new_trees,
+        'replaced_trees': replace,
+        'total_trees': len(model.estimators_),
+        'training_rows': len(training),
+        'holdout_rows': len(holdout),
+        'confirmed_until': str(training['confirmed_at'].max()),
+        'parent': evaluate(entry.model, entry.scaler, holdout, mode),
+        'updated': evaluate(model, entry.scaler, holdout, mode),
+        'fit_seconds': round(fit_seconds, 3),
+        'published': publish,
+    }
+    if publish:
+        model_registry.publish_model(mode, model, entry.scaler, result['version'], entry.name)
+    _save_update(mode, result)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['clinical', 'lifestyle', 'history'])
+    parser.add_argument('--new-trees', type=int, default=NEW_TREES)
+    parser.add_argument('--replace', type=int, default=0, help='oldest trees to retire')
+    parser.add_argument('--min-rows', type=int, default=MIN_TRAINING_ROWS)
+    parser.add_argument('--dry-run', action='store_true', help='evaluate without publishing')
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.command == 'history':
+        print(db.get_model_updates().to_string(index=False))
+    else:
+        result = update_model(args.command, args.new_trees, args.replace, args.min_rows,
+                              publish=not args.dry_run)
+
+        def fmt(value):
+            return '-' if value is None else f'{value:.3f}'
+
+        print(f"{args.command}: {result['parent_version']} -> {result['version']} "
+              f"({result['training_rows']} new confirmed rows, {result['total_trees']} trees, "
+              f"fit {result['fit_seconds']}s){'' if result['published'] else ' [not published]'}")
+        print(f"held-out ({result['holdout_rows']} rows)   parent    updated")
+        for metric in ('accuracy', 'auc', 'log_loss'):
+            print(f"  {metric:<28}{fmt(result['parent'][metric]):>8}  {fmt(result['updated'][metric]):>8}")
@@ -0,0 +1,112 @@
+"""
+Start-up profile for the two Streamlit entry points.
+
+Renders the real app.py and admin.py once each, in a fresh interpreter, with
+Streamlit's AppTest: once from a copy of the baseline revision (before
+deferred loading) and once from the current working tree. Each copy lives in
+a temporary directory with its own database file, so nothing in the
+repository is touched. The admin panel stops at its password prompt, which is
+what a first visit renders.
+
+Reported per entry point: the streamlit import (paid by both versions alike),
+the first script run, and which heavy packages that run imported.
+
+The baseline app.py loads ../models/*.pkl at start-up; pass --models when the
+repository's models/ directory is not next to scripts/.
+
+Usage:
+    python profile_startup.py [--repeat 3] [--baseline <git rev>] [--models DIR]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPTS_DIR)
+
+ENTRY_POINTS = ['app.py', 'admin.py']
+HEAVY_PACKAGES = ['pandas', 'numpy', 'plotly', 'sklearn', 'scipy', 'pickle']
+
+# Runs inside the fresh interpreter, in the copied scripts directory
+_MEASURE = '''
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+streamlit_ms = (time.perf_counter() - started) * 1000
+from streamlit.testing.v1 import AppTest
+before = set(sys.modules)
+at = AppTest.from_file({entry!r}, default_timeout=300)
+started = time.perf_counter()
+at.run()
+run_ms = (time.perf_counter() - started) * 1000
+loaded = sorted({{name.split('.')[0] for name in set(sys.modules) - before}} & set({heavy!r}))
+print(json.dumps({{'streamlit_ms': streamlit_ms, 'run_ms': run_ms, 'loaded': loaded,
+                  'errors': [e.value.message if hasattr(e.value, 'message') else str(e.value)
+                             for e in at.exception]}}))
+'''
+
+
+def export_tree(revision, target, models_dir):
+    """Copy scripts/ (from a git revision, or the working tree when revision is None) into target."""
+    if revision is None:
+        shutil.copytree(SCRIPTS_DIR, os.path.join(target, 'scripts'),
+                        ignore=shutil.ignore_patterns('__pycache__', '*.db'))
+    else:
+        archive = subprocess.run(['git', 'archive', revision, 'scripts'], cwd=REPO_DIR,
+                                 capture_output=True, check=True).stdout
+        subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+    if os.path.isdir(models_dir):
+        os.symlink(os.path.abspath(models_dir), os.path.join(target, 'models'))
+    return os.path.join(target, 'scripts')
+
+
+def measure_entry_point(scripts_dir, entry):
+    """One cold render of an entry point. Returns the measurement dict."""
+    env = dict(os.environ, DIABETES_WARMUP='0', DIABETES_BACKUP_INTERVAL='0')
+    result = subprocess.run(
+        [sys.executable, '-c', _MEASURE.format(entry=entry, heavy=HEAVY_PACKAGES)],
+        cwd=scripts_dir, capture_output=True, text=True, env=env
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (best is kept)')
+    parser.add_argument('--baseline', default=None, help='git revision to compare with (default: the root commit)')
+    parser.add_argument('--models', default=os.path.join(REPO_DIR, 'models'))
+    args = parser.parse_args()
+
+    baseline = args.baseline or subprocess.run(
+        ['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=REPO_DIR,
+        capture_output=True, text=True, check=True).stdout.split()[0]
+
+    with tempfile.TemporaryDirectory() as before_dir, tempfile.TemporaryDirectory() as after_dir:
+        trees = {
+            f'before ({baseline[:10]})': export_tree(baseline, before_dir, args.models),
+            'after (working tree)': export_tree(None, after_dir, args.models),
+        }
+        for entry in ENTRY_POINTS:
+            print(f"\n=== {entry} ===")
+            totals = {}
+            for phase, scripts_dir in trees.items():
+                runs = [measure_entry_point(scripts_dir, entry) for _ in range(args.repeat)]
+                best = min(runs, key=lambda r: r['run_ms'])
+                totals[phase] = best['streamlit_ms'] + best['run_ms']
+                print(f"{phase:<26} {totals[phase]:8.1f} ms  (streamlit import {best['streamlit_ms']:.1f} ms, "
+                      f"first run {best['run_ms']:.1f} ms)")
+                print(f"{'':<26} heavy imports: {', '.join(best['loaded']) or 'none'}")
+                if best['errors']:
+                    print(f"{'':<26} errors: {'; '.join(best['errors'])}")
+            before, after = totals.values()
+            print(f"{'saved':<26} {before - after:8.1f} ms ({(before - after) / before * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Opt-in SQL profiler for database.py.
+
+When enabled, every statement run through a profiled connection records its
+duration and row count. The first time a statement shape is seen (literals
+replaced by '?') its EXPLAIN QUERY PLAN is captured so full table scans can be
+flagged. Statements slower than the threshold go to a rotating log file.
+
+Enable with the environment variable DIABETES_QUERY_PROFILE=1, or call
+enable() before the first query.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Default settings (overridable through the environment or enable())
+SLOW_QUERY_MS = float(os.environ.get('DIABETES_SLOW_QUERY_MS', '100'))
+LOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'logs', 'slow_queries.log')
+
+_enabled = os.environ.get('DIABETES_QUERY_PROFILE', '') == '1'
+_lock = threading.Lock()
+_stats = {}
+_logger = None
+
+# Statements that have no useful query plan
+_NO_PLAN_PREFIXES = ('CREATE', 'DROP', 'ALTER', 'PRAGMA', 'BEGIN', 'COMMIT',
+                     'ROLLBACK', 'VACUUM', 'ANALYZE', 'EXPLAIN', 'SAVEPOINT',
+                     'RELEASE')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+_TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?\w+$')
+
+
+def enable(threshold_ms=None, log_path=None):
+    """Turn profiling on for connections opened from now on."""
+    global _enabled, SLOW_QUERY_MS, LOG_PATH, _logger
+    if threshold_ms is not None:
+        SLOW_QUERY_MS = float(threshold_ms)
+    if log_path is not None and log_path != LOG_PATH:
+        LOG_PATH = log_path
+        _logger = None
+    _enabled = True
+
+
+def disable():
+    """Turn profiling off. Collected statistics are kept until reset()."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Forget all collected statistics and captured plans."""
+    with _lock:
+        _stats.clear()
+
+
+def normalize(sql):
+    """Reduce a statement to its shape: literals become '?', whitespace collapsed."""
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        logger = logging.getLogger('diabetes.slow_queries')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(LOG_PATH, maxBytes=1_000_000, backupCount=5)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def _capture_plan(conn, sql, params):
+    """Run EXPLAIN QUERY PLAN on a plain cursor so it is not profiled itself."""
+    if sql.lstrip().upper().startswith(_NO_PLAN_PREFIXES):
+        return []
+    try:
+        cursor = sqlite3.Cursor(conn)
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = [row[-1] for row in cursor.fetchall()]
+        cursor.close()
+        return plan
+    except sqlite3.Error:
+        return []
+
+
+def _is_full_scan(plan):
+    return any(_TABLE_SCAN.match(detail) for detail in plan)
+
+
+def _seen(shape):
+    with _lock:
+        return shape in _stats
+
+
+def _record(shape, sql, elapsed_ms, rows, plan=None):
+    with _lock:
+        entry = _stats.get(shape)
+        if entry is None:
+            plan = plan or []
+            entry = _stats[shape] = {
+                'statement': shape,
+                'calls': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'rows': 0,
+                'slow_calls': 0,
+                'plan': plan,
+                'full_scan': _is_full_scan(plan),
+            }
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['rows'] += rows
+        slow = elapsed_ms >= SLOW_QUERY_MS
+        if slow:
+            entry['slow_calls'] += 1
+        full_scan = entry['full_scan']
+
+    if slow:
+        _get_logger().info(
+            '%.2f ms | %d rows | %s| %s',
+            elapsed_ms, rows, 'FULL SCAN ' if full_scan else '', sql.strip().replace('\n', ' ')
+        )
+
+
+def get_report():
+    """Return collected statistics, most expensive statement shapes first."""
+    with _lock:
+        rows = [dict(entry, plan=list(entry['plan'])) for entry in _stats.values()]
+    for row in rows:
+        row['avg_ms'] = row['total_ms'] / row['calls'] if row['calls'] else 0.0
+    return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times execute() and the fetches that follow it."""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._pending = None
+        connection._track(self)
+
+    def _start(self, sql, params):
+        self._finish()
+        shape = normalize(sql)
+        plan = None if _seen(shape) else _capture_plan(self.connection, sql, params)
+        self._pending = {'shape': shape, 'sql': sql, 'ms': 0.0, 'rows': 0, 'plan': plan}
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        rows = pending['rows']
+        if rows == 0 and self.rowcount > 0:
+            rows = self.rowcount
+        _record(pending['shape'], pending['sql'], pending['ms'], rows, pending['plan'])
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if self._pending is not None:
+                self._pending['ms'] += (time.perf_counter() - start) * 1000
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, ())
+        self._timed(super().executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is not None and self._pending is not None:
+            self._pending['rows'] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        if self._pending is not None:
+            self._pending['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending['rows'] += len(rows)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors are ProfiledCursor instances."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = []
+
+    def _track(self, cursor):
+        # Keep cursors alive until their statement is recorded; drop finished ones
+        self._cursors = [c for c in self._cursors if c._pending is not None]
+        self._cursors.append(cursor)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor._finish()
+        self._cursors = []
+        super().close()
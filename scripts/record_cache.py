@@ -0,0 +1,130 @@
+"""
+Process-wide, incrementally refreshed cache of the prediction records.
+
+Rows are append-only apart from rare deletes, so after the first full load a
+refresh only reads rows with id > the last id seen. Deletes, updates and
+restores bump a generation counter (the record_changes table, maintained by
+triggers); when it moves, or the table shrank, the cache reloads in full.
+A refresh therefore costs one indexed lookup plus the new rows.
+
+Rows are read with database.read_records' compact dtypes (categorical labels,
+int8 flags, float32 measurements, parsed timestamps). New rows are kept as
+chunks and concatenated only when something changed. Callers get a shallow
+copy: with copy-on-write, modifying it never touches the cached data.
+
+    df = record_cache.get_records('clinical')
+"""
+import threading
+
+import database as db
+
+
+class _ShardCache:
+    """Cached rows of one record table in one database file, newest first."""
+
+    def __init__(self, mode, site, path):
+        self.mode = mode
+        self.site = site
+        self.path = path
+        self.generation = None
+        self.last_id = 0
+        self.chunks = []
+
+    def refresh(self):
+        """Load new rows (or everything after a delete). Returns True if anything changed."""
+        conn = db._connect(self.path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT generation FROM record_changes WHERE table_name = ?',
+                       (db.PREDICTION_TABLES[self.mode],))
+        generation = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MAX(id) FROM {db.PREDICTION_TABLES[self.mode]}')
+        max_id = cursor.fetchone()[0] or 0
+        conn.close()
+
+        changed = False
+        if generation != self.generation or max_id < self.last_id:
+            self.generation, self.last_id, self.chunks = generation, 0, []
+            changed = True
+        if max_id > self.last_id:
+            # Read exactly up to the id checked above: rows committed since
+            # are picked up by the next refresh, and none is skipped
+            new_rows = db._read_typed(self.path, self.mode, after_id=self.last_id, upto_id=max_id)
+            self.last_id = max_id
+            if len(new_rows):
+                self.chunks.insert(0, new_rows)
+                changed = True
+        return changed
+
+    def frame(self):
+        import pandas as pd
+        if not self.chunks:
+            return None
+        df = db.concat_typed(self.chunks)
+        # Keep a single chunk so the next concat only copies once
+        self.chunks = [df]
+        if self.site is not None:
+            df = df.copy(deep=False)
+            df.insert(1, 'site', pd.Categorical([self.site] * len(df)))
+        return df
+
+
+class RecordCache:
+    """Newest-first records of one mode across all shards."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._shards = {}
+        self._frame = None
+
+    def get(self):
+        """Refresh and return the records, newest first, as a read-only (copy-on-write) frame."""
+        with self._lock:
+            shard_paths = db._shard_paths()
+            if set(self._shards) != set(shard_paths):
+                self._shards = {(site, path): _ShardCache(self.mode, site, path)
+                                for site, path in shard_paths}
+                self._frame = None
+            changed = [shard.refresh() for shard in self._shards.values()]
+            if self._frame is None or any(changed):
+                frames = [shard.frame() for shard in self._shards.values()]
+                frames = [f for f in frames if f is not None]
+                if not frames:
+                    self._frame = _empty_frame(self.mode)
+                elif len(frames) == 1:
+                    self._frame = frames[0]
+                else:
+                    merged = db.concat_typed(frames)
+                    self._frame = merged.sort_values(['timestamp', 'id'], ascending=False,
+                                                     kind='mergesort', ignore_index=True)
+            return self._frame.copy(deep=False)
+
+    def clear(self):
+        with self._lock:
+            self._shards = {}
+            self._frame = None
+
+
+def _empty_frame(mode):
+    import pandas as pd
+    df = db._read_typed(db.DB_PATH, mode)
+    if db.SHARDS:
+        df.insert(1, 'site', pd.Categorical([]))
+    return df
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(mode):
+    """The process-wide cache for 'clinical' or 'lifestyle' records."""
+    with _caches_lock:
+        if mode not in _caches:
+            _caches[mode] = RecordCache(mode)
+        return _caches[mode]
+
+
+def get_records(mode):
+    """All records of a mode, newest first (incrementally refreshed)."""
+    return get_cache(mode).get()
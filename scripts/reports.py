@@ -0,0 +1,296 @@
+"""
+Bulk printable assessment reports.
+
+Selects the assessments of one mode in a date range (optionally one risk
+class) and renders one report per assessment: status, the reasons and tips
+from logic.py, and the patient's recent history. Reports are HTML by default;
+PDF needs the optional weasyprint package.
+
+Records are read in id order in batches of BATCH_SIZE, and the histories of
+a whole batch come from one windowed query instead of one per patient.
+Batches are rendered in a process pool from templates compiled once at
+import, and each report is written to the zip archive as soon as its batch
+comes back. At most two batches per worker are in flight, so memory stays
+bounded however many reports are generated.
+
+    python reports.py clinical --start 2025-01-01 --end 2025-06-30 --risk-class Diabetic
+    python reports.py lifestyle --out outreach.zip --workers 8 --format pdf
+"""
+import argparse
+import html
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from string import Template
+
+import database as db
+import logic
+
+BATCH_SIZE = 500
+HISTORY_LIMIT = 10
+
+# Columns shown in the measurements table and the history table
+REPORT_FIELDS = {
+    'clinical': [('glucose', 'Glucose (mg/dL)'), ('blood_pressure', 'Blood Pressure (mmHg)'),
+                 ('bmi', 'BMI'), ('age', 'Age'), ('insulin', 'Insulin (mu U/ml)'),
+                 ('skin_thickness', 'Skin Thickness (mm)'), ('pregnancies', 'Pregnancies'),
+                 ('diabetes_pedigree', 'Diabetes Pedigree'), ('risk_percentage', 'Risk (%)')],
+    'lifestyle': [('bmi', 'BMI'), ('high_bp', 'High Blood Pressure'), ('high_chol', 'High Cholesterol'),
+                  ('smoker', 'Smoker'), ('physical_activity', 'Physically Active'),
+                  ('fruits', 'Daily Fruit'), ('vegetables', 'Daily Vegetables'),
+                  ('heavy_alcohol', 'Heavy Alcohol Use'), ('general_health', 'General Health (1-5)'),
+                  ('mental_health', 'Poor Mental Health Days'), ('risk_class', 'Risk Class')],
+}
+HISTORY_FIELDS = {
+    'clinical': ['glucose', 'bmi', 'risk_percentage'],
+    'lifestyle': ['bmi', 'risk_class'],
+}
+YES_NO_FIELDS = {'high_bp', 'high_chol', 'smoker', 'physical_activity', 'fruits', 'vegetables', 'heavy_alcohol'}
+
+# Risk class filter -> prediction values
+RISK_CLASS_PREDICTIONS = {
+    'clinical': {'Diabetic': 1, 'Non-Diabetic': 0},
+    'lifestyle': {label: value for value, label in db.RISK_CLASSES.items()},
+}
+
+# --- TEMPLATES (compiled once per process) ---
+REPORT_TEMPLATE = Template('''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>$title</title>
+<style>
+  body { font-family: Arial, sans-serif; margin: 32px; color: #222; }
+  h1 { font-size: 22px; margin-bottom: 4px; }
+  .meta { color: #666; font-size: 12px; margin-bottom: 16px; }
+  .status { padding: 12px 16px; border-radius: 8px; font-size: 18px; font-weight: bold; background: $status_color; }
+  table { border-collapse: collapse; width: 100%; margin: 8px 0 16px; font-size: 13px; }
+  th, td { border: 1px solid #ddd; padding: 6px 8px; text-align: left; }
+  th { background: #f4f4f4; }
+  .footer { color: #888; font-size: 11px; margin-top: 24px; }
+</style></head>
+<body>
+<h1>$title</h1>
+<div class="meta">Assessment #$record_id &middot; $timestamp &middot; Model $model_version$site</div>
+<div class="status">$status</div>
+<h2>Measurements</h2>
+<table>$measurements</table>
+<h2>Why this result?</h2>
+<ul>$reasons</ul>
+<h2>Recommendations</h2>
+<ul>$tips</ul>
+<h2>Assessment History</h2>
+$history
+<div class="footer">Generated $generated. This screening is not a diagnosis; please consult a healthcare provider.</div>
+</body></html>
+''')
+MEASUREMENT_ROW = Template('<tr><th>$label</th><td>$value</td></tr>')
+LIST_ITEM = Template('<li>$text</li>')
+HISTORY_TABLE = Template('<table><tr><th>Date</th>$headers<th>Status</th></tr>$rows</table>')
+HISTORY_ROW = Template('<tr><td>$timestamp</td>$cells<td>$status</td></tr>')
+CELL = Template('<td>$value</td>')
+
+# Status banner colour by prediction
+STATUS_COLORS = {
+    'clinical': {1: '#fde2e4', 0: '#e3f6e8'},
+    'lifestyle': {2.0: '#fde2e4', 1.0: '#fff3cd', 0.0: '#e3f6e8'},
+}
+
+
+def _format(field, value):
+    if value is None or value != value:
+        return '-'
+    if field in YES_NO_FIELDS:
+        return 'Yes' if value else 'No'
+    if isinstance(value, float):
+        return f'{value:.2f}'.rstrip('0').rstrip('.')
+    return html.escape(str(value))
+
+
+def _advice(mode, record):
+    """(reasons, tips) for a stored record; the stored status is kept as is."""
+    if mode == 'clinical':
+        features = [record[c] for c in ('pregnancies', 'glucose', 'blood_pressure', 'skin_thickness',
+                                       'insulin', 'bmi', 'diabetes_pedigree', 'age')]
+        _, reasons, tips = logic.get_clinical_advice(record['prediction'], features, record['risk_percentage'])
+    else:
+        features = [record[c] for c in ('high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity',
+                                       'fruits', 'vegetables', 'heavy_alcohol', 'general_health',
+                                       'mental_health')]
+        # Class probabilities only feed the status line, which is stored
+        _, reasons, tips = logic.get_lifestyle_advice(record['prediction'], features, [0.0, 0.0, 0.0])
+    return reasons, tips
+
+
+def render_report(mode, record, history):
+    """HTML report for one record (a dict of its columns) and its patient's history rows."""
+    status = record['status'] or ''
+    color = STATUS_COLORS[mode].get(record['prediction'], '#f4f4f4')
+    reasons, tips = _advice(mode, record)
+    if history:
+        history_html = HISTORY_TABLE.substitute(
+            headers=''.join(f'<th>{dict(REPORT_FIELDS[mode])[f]}</th>' for f in HISTORY_FIELDS[mode]),
+            rows=''.join(HISTORY_ROW.substitute(
+                timestamp=html.escape(str(row['timestamp'])),
+                cells=''.join(CELL.substitute(value=_format(f, row[f])) for f in HISTORY_FIELDS[mode]),
+                status=html.escape(row['status'] or '')
+            ) for row in history)
+        )
+    else:
+        history_html = '<p>No other assessments on record for this patient.</p>'
+    return REPORT_TEMPLATE.substitute(
+        title=f"{mode.title()} Diabetes Risk Assessment",
+        record_id=record['id'],
+        timestamp=html.escape(str(record['timestamp'])),
+        model_version=html.escape(str(record.get('model_version') or 'unknown')),
+        site=f" &middot; Site {html.escape(record['site'])}" if record.get('site') else '',
+        status=html.escape(status),
+        status_color=color,
+        measurements=''.join(MEASUREMENT_ROW.substitute(label=label, value=_format(field, record[field]))
+                             for field, label in REPORT_FIELDS[mode]),
+        reasons=''.join(LIST_ITEM.substitute(text=html.escape(r)) for r in reasons),
+        tips=''.join(LIST_ITEM.substitute(text=html.escape(t)) for t in tips),
+        history=history_html,
+        generated=datetime.now().strftime('%Y-%m-%d %H:%M'),
+    )
+
+
+def _to_pdf(document):
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        raise RuntimeError("PDF reports need the weasyprint package (pip install weasyprint)")
+    return HTML(string=document).write_pdf()
+
+
+def render_batch(mode, records, histories, fmt='html'):
+    """[(file name, bytes)] for a batch of records. Runs in the worker processes."""
+    output = []
+    for record in records:
+        history = [row for row in histories.get(record['patient_id'], []) if row['id'] != record['id']]
+        document = render_report(mode, record, history)
+        name = f"{mode}_{record.get('site') + '_' if record.get('site') else ''}{record['id']}"
+        if fmt == 'pdf':
+            output.append((f'{name}.pdf', _to_pdf(document)))
+        else:
+            output.append((f'{name}.html', document.encode('utf-8')))
+    return output
+
+
+# --- QUERIES ---
+def _where(mode, start, end, risk_class):
+    where, params = ['id > ?'], []
+    if start:
+        where.append('timestamp >= ?')
+        params.append(str(start))
+    if end:
+        # Inclusive end date
+        where.append("timestamp < date(?, '+1 day')")
+        params.append(str(end))
+    if risk_class:
+        if risk_class not in RISK_CLASS_PREDICTIONS[mode]:
+            raise ValueError(f"Unknown {mode} risk class: {risk_class}")
+        where.append('prediction = ?')
+        params.append(RISK_CLASS_PREDICTIONS[mode][risk_class])
+    return ' AND '.join(where), params
+
+
+def select_batches(path, mode, start=None, end=None, risk_class=None, batch_size=BATCH_SIZE):
+    """Yield lists of record dicts from one database file, in id order."""
+    where, params = _where(mode, start, end, risk_class)
+    after_id = 0
+    while True:
+        conn = db._connect(path)
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM {db.RECORD_VIEWS[mode]} WHERE {where} ORDER BY id LIMIT ?',
+                       (after_id, *params, batch_size))
+        columns = [d[0] for d in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        conn.close()
+        if not rows:
+            return
+        after_id = rows[-1]['id']
+        yield rows
+
+
+def load_histories(path, mode, patient_ids, limit=HISTORY_LIMIT):
+    """{patient_id: newest-first history rows} for a batch of patients, in one query."""
+    patient_ids = sorted({p for p in patient_ids if p})
+    if not patient_ids:
+        return {}
+    columns = ', '.join(['id', 'timestamp', 'status', 'patient_id'] + HISTORY_FIELDS[mode])
+    conn = db._connect(path)
+    cursor = conn.cursor()
+    # One query per batch; the window keeps each patient's newest rows
+    # (limit + 1 so the record itself can be dropped)
+    cursor.execute(f'''
+        SELECT {columns} FROM (
+            SELECT {columns}, ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY timestamp DESC, id DESC) AS n
+            FROM {db.RECORD_VIEWS[mode]}
+            WHERE patient_id IN ({', '.join('?' * len(patient_ids))})
+        ) WHERE n <= ?
+        ORDER BY patient_id, timestamp DESC, id DESC
+    ''', (*patient_ids, limit + 1))
+    names = [d[0] for d in cursor.description]
+    histories = {}
+    for row in cursor.fetchall():
+        row = dict(zip(names, row))
+        histories.setdefault(row['patient_id'], []).append(row)
+    conn.close()
+    return histories
+
+
+# --- JOB ---
+def generate_reports(mode, out_path, start=None, end=None, risk_class=None, workers=4, fmt='html',
+                     batch_size=BATCH_SIZE, progress=None):
+    """Render every matching record's report into a zip archive. Returns the number of reports."""
+    written = 0
+
+    def batches():
+        for site, path in db._shard_paths():
+            for records in select_batches(path, mode, start, end, risk_class, batch_size):
+                histories = load_histories(path, mode, [r['patient_id'] for r in records])
+                if site is not None:
+                    for record in records:
+                        record['site'] = site
+                yield records, histories
+
+    with zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        def store(reports):
+            nonlocal written
+            for name, data in reports:
+                archive.writestr(name, data)
+            written += len(reports)
+            if progress:
+                progress(written)
+
+        if workers <= 1:
+            for records, histories in batches():
+                store(render_batch(mode, records, histories, fmt))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for records, histories in batches():
+                    pending.append(pool.submit(render_batch, mode, records, histories, fmt))
+                    if len(pending) >= 2 * workers:
+                        store(pending.popleft().result())
+                while pending:
+                    store(pending.popleft().result())
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['clinical', 'lifestyle'])
+    parser.add_argument('--start', help='first assessment date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last assessment date (YYYY-MM-DD, inclusive)')
+    parser.add_argument('--risk-class', help="e.g. Diabetic, Pre-diabetic, Healthy, Non-Diabetic")
+    parser.add_argument('--out', help='zip archive to write (default: <mode>_reports_<date>.zip)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--format', choices=['html', 'pdf'], default='html')
+    args = parser.parse_args()
+
+    db.init_db()
+    out_path = args.out or f"{args.mode}_reports_{datetime.now().strftime('%Y%m%d')}.zip"
+    count = generate_reports(args.mode, out_path, args.start, args.end, args.risk_class,
+                             args.workers, args.format,
+                             progress=lambda n: print(f"\r{n} reports", end='', flush=True))
+    print(f"\nWrote {count} reports to {out_path}")
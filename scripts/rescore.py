@@ -0,0 +1,227 @@
+"""
+Rescore stored records with the current model.
+
+After a model is retrained, the prediction, risk and status stored with older
+records still come from the model that was live when they were saved. This
+job re-scores the stored feature columns with the model currently in the
+registry and writes the results to the prediction_versions side table, keyed
+by table, model version and record id. The original rows are never modified.
+
+Records are read in id order, CHUNK_SIZE at a time (keyset: WHERE id > last),
+each chunk is scored in one vectorized predict_proba call (optionally in a
+process pool), and the results plus the new checkpoint (rescore_runs.last_id)
+are committed together in one short transaction. No transaction stays open
+while scoring, so live writes are only held up for one batch insert. An
+interrupted run resumes from its checkpoint; re-running a finished one scores
+only the records saved since.
+
+    python rescore.py clinical [--workers 4] [--chunk-size 5000] [--restart]
+    python rescore.py lifestyle
+    python rescore.py status
+"""
+import argparse
+from collections import deque
+
+import database as db
+import logic
+
+CHUNK_SIZE = 5000
+
+# Model input columns, in the order the models were trained on
+FEATURES = {
+    'clinical': ['pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin',
+                 'bmi', 'diabetes_pedigree', 'age'],
+    'lifestyle': ['high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity', 'fruits',
+                  'vegetables', 'heavy_alcohol', 'general_health', 'mental_health'],
+}
+
+
+def load_entry(mode):
+    """The registry's current model entry for a mode (without the watcher thread)."""
+    import model_registry
+    return model_registry.ModelRegistry().get(mode)
+
+
+def score_chunk(mode, entry, ids, raw):
+    """
+    Score one chunk of raw feature rows. Returns (record_id, prediction,
+    risk_percentage, risk_class, status) tuples; rows with missing features
+    are skipped.
+    """
+    import numpy as np
+    complete = ~np.isnan(raw).any(axis=1)
+    ids, raw = ids[complete], raw[complete]
+    if not len(ids):
+        return []
+    probabilities = entry.model.predict_proba(entry.scaler.transform(raw))
+    predictions = entry.model.classes_[probabilities.argmax(axis=1)]
+
+    rows = []
+    for record_id, features, prediction, probs in zip(ids.tolist(), raw, predictions, probabilities):
+        if mode == 'clinical':
+            risk_percent = round(probs[1] * 100, 2)
+            status, _, _ = logic.get_clinical_advice(int(prediction), features, risk_percent)
+            rows.append((record_id, float(prediction), float(risk_percent), None, status))
+        else:
+            prediction = float(prediction)
+            status, _, _ = logic.get_lifestyle_advice(prediction, features, [round(p * 100, 2) for p in probs])
+            rows.append((record_id, prediction, None, db.RISK_CLASSES[prediction], status))
+    return rows
+
+
+# --- PROCESS POOL ---
+_worker = {}
+
+
+def _init_worker(mode, version):
+    entry = load_entry(mode)
+    if entry.version != version:
+        raise RuntimeError(f"Worker loaded {mode} model {entry.version}, expected {version}")
+    _worker['mode'], _worker['entry'] = mode, entry
+
+
+def _score_in_worker(ids, raw):
+    return score_chunk(_worker['mode'], _worker['entry'], ids, raw)
+
+
+# --- CHECKPOINTS ---
+def _start_run(path, table_name, version, restart):
+    """Create or resume the run for one table and version. Returns the id to continue after."""
+    conn = db._connect(path)
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR IGNORE INTO rescore_runs (table_name, model_version) VALUES (?, ?)',
+                   (table_name, version))
+    if restart:
+        cursor.execute('DELETE FROM prediction_versions WHERE table_name = ? AND model_version = ?',
+                       (table_name, version))
+        cursor.execute('''
+            UPDATE rescore_runs SET last_id = 0, rows_scored = 0, started_at = CURRENT_TIMESTAMP
+            WHERE table_name = ? AND model_version = ?
+        ''', (table_name, version))
+    cursor.execute('''
+        UPDATE rescore_runs SET finished_at = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name = ? AND model_version = ?
+    ''', (table_name, version))
+    cursor.execute('SELECT last_id FROM rescore_runs WHERE table_name = ? AND model_version = ?',
+                   (table_name, version))
+    last_id = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return last_id
+
+
+def _read_chunks(path, mode, after_id, chunk_size):
+    """Yield (ids, raw features) chunks in id order, one short read per chunk."""
+    import numpy as np
+    columns = ', '.join(FEATURES[mode])
+    while True:
+        conn = db._connect(path)
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id, {columns} FROM {db.RECORD_VIEWS[mode]}
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, chunk_size))
+        rows = cursor.fetchall()
+        conn.close()
+        if not rows:
+            return
+        chunk = np.array(rows, dtype=np.float64)
+        ids = chunk[:, 0].astype(np.int64)
+        after_id = int(ids[-1])
+        yield ids, chunk[:, 1:]
+
+
+def _write_chunk(path, table_name, version, rows, last_id):
+    """Store one chunk's results and advance the checkpoint in the same transaction."""
+    conn = db._connect(path)
+    cursor = conn.cursor()
+    cursor.executemany(f'''
+        INSERT OR REPLACE INTO prediction_versions
+        (table_name, model_version, record_id, prediction, risk_percentage, risk_class, status)
+        VALUES ('{table_name}', ?, ?, ?, ?, ?, ?)
+    ''', [(version, *row) for row in rows])
+    cursor.execute('''
+        UPDATE rescore_runs
+        SET last_id = ?, rows_scored = rows_scored + ?, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name = ? AND model_version = ?
+    ''', (last_id, len(rows), table_name, version))
+    conn.commit()
+    conn.close()
+
+
+def _finish_run(path, table_name, version):
+    conn = db._connect(path)
+    conn.execute('''
+        UPDATE rescore_runs SET finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name = ? AND model_version = ?
+    ''', (table_name, version))
+    conn.commit()
+    conn.close()
+
+
+# --- JOB ---
+def rescore_file(path, mode, entry, workers=1, chunk_size=CHUNK_SIZE, restart=False, progress=None):
+    """Rescore one database file. Returns the number of records scored."""
+    from concurrent.futures import ProcessPoolExecutor
+    table_name = db.PREDICTION_TABLES[mode]
+    after_id = _start_run(path, table_name, entry.version, restart)
+    scored = 0
+
+    def write(rows, last_id):
+        nonlocal scored
+        _write_chunk(path, table_name, entry.version, rows, last_id)
+        scored += len(rows)
+        if progress:
+            progress(path, scored, last_id)
+
+    if workers <= 1:
+        for ids, raw in _read_chunks(path, mode, after_id, chunk_size):
+            write(score_chunk(mode, entry, ids, raw), int(ids[-1]))
+    else:
+        # A few chunks in flight per worker; results are written in id order
+        # so the checkpoint only ever moves past fully stored chunks
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(mode, entry.version)) as pool:
+            pending = deque()
+            for ids, raw in _read_chunks(path, mode, after_id, chunk_size):
+                pending.append((pool.submit(_score_in_worker, ids, raw), int(ids[-1])))
+                if len(pending) >= 2 * workers:
+                    future, last_id = pending.popleft()
+                    write(future.result(), last_id)
+            while pending:
+                future, last_id = pending.popleft()
+                write(future.result(), last_id)
+
+    _finish_run(path, table_name, entry.version)
+    return scored
+
+
+def rescore(mode, workers=1, chunk_size=CHUNK_SIZE, restart=False, progress=None):
+    """Rescore every shard's records of a mode with the current model. Returns (version, records scored)."""
+    entry = load_entry(mode)
+    scored = 0
+    for _, path in db._shard_paths():
+        scored += rescore_file(path, mode, entry, workers, chunk_size, restart, progress)
+    return entry.version, scored
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['clinical', 'lifestyle', 'status'])
+    parser.add_argument('--workers', type=int, default=1, help='scoring processes (1 scores in-process)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true', help='discard this version\'s results and start over')
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.command == 'status':
+        print(db.get_rescore_summary().to_string(index=False))
+    else:
+        def report(path, scored, last_id):
+            print(f"{path}: {scored} records scored (checkpoint id {last_id})")
+
+        try:
+            version, scored = rescore(args.command, args.workers, args.chunk_size, args.restart, report)
+            print(f"Rescored {scored} {args.command} records with model version {version}")
+        except KeyboardInterrupt:
+            print("Interrupted; run the same command again to resume from the last checkpoint.")
@@ -0,0 +1,248 @@
+"""
+Indexed record search for the admin panel.
+
+Each prediction table has an FTS5 shadow table (clinical_search,
+lifestyle_search) over its status text and risk label, kept in sync by
+triggers, and B-tree indexes on the numeric columns admins filter on. A search
+combines any of: exact ID, ID range, free text and per-column ranges or
+equality into one parameterized query, so every predicate is answered from an
+index instead of scanning a DataFrame. Status words in the free text
+('diabetic', 'pre-diabetic', 'non-diabetic', 'healthy') select whole status
+classes through the indexed status_class column rather than the text index.
+
+If this SQLite build lacks FTS5 the text predicate falls back to LIKE.
+
+Rows may be stored in the compact layout (see database.COMPACT_STORAGE), so
+the status text is rendered from its code for the index and results are read
+from the decoding views.
+"""
+import re
+import sqlite3
+
+import logic
+
+SEARCH_TABLES = {
+    'clinical': {
+        'table': 'clinical_predictions',
+        'view': 'clinical_records',
+        'fts': 'clinical_search',
+        'risk': "CASE WHEN {row}.prediction = 1 THEN 'Diabetic' ELSE 'Non-Diabetic' END",
+        'indexed': ['glucose', 'bmi', 'age', 'risk_percentage', 'status_class'],
+    },
+    'lifestyle': {
+        'table': 'lifestyle_predictions',
+        'view': 'lifestyle_records',
+        'fts': 'lifestyle_search',
+        'risk': "CASE {row}.prediction WHEN 2.0 THEN 'Diabetic' WHEN 1.0 THEN 'Pre-diabetic' ELSE 'Healthy' END",
+        'indexed': ['bmi', 'prediction', 'general_health', 'status_class'],
+    },
+}
+
+# Columns that may be filtered on (ranges or equality)
+FILTER_COLUMNS = {
+    'clinical': {'pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin',
+                 'bmi', 'diabetes_pedigree', 'age', 'prediction', 'risk_percentage'},
+    'lifestyle': {'high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity', 'fruits',
+                  'vegetables', 'heavy_alcohol', 'general_health', 'mental_health',
+                  'prediction', 'risk_class'},
+}
+
+# Lifestyle risk labels are derived from the indexed prediction column
+RISK_CLASS_PREDICTIONS = {'diabetic': 2.0, 'pre-diabetic': 1.0, 'healthy': 0.0}
+
+# Status words are matched on the stored status_class, not the FTS index:
+# there 'NON-DIABETIC' and 'Pre-diabetic' also contain the token 'diabetic'.
+# Every row stores the class of its status template (NULL for other text) in
+# both storage layouts.
+STATUS_WORDS = re.compile(r'\b(?:(non|pre)[\s-]*)?diabetic\b|\bhealthy\b', re.IGNORECASE)
+STATUS_CLASSES = {'diabetic': 1, 'pre-diabetic': 2, 'non-diabetic': 3, 'healthy': 4}
+
+_fts5_available = None
+
+
+def fts5_available(cursor):
+    """True if this SQLite build can create FTS5 tables (checked once)."""
+    global _fts5_available
+    if _fts5_available is None:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)')
+            cursor.execute('DROP TABLE temp._fts5_probe')
+            _fts5_available = True
+        except sqlite3.OperationalError:
+            _fts5_available = False
+    return _fts5_available
+
+
+def _status_sql(row):
+    """Status text of a row in either storage layout."""
+    return f"COALESCE({row}.status, {logic.status_sql(f'{row}.status_code', f'{row}.status_tenths')})"
+
+
+def create_search_indexes(cursor):
+    """Create numeric indexes, FTS tables and sync triggers (idempotent)."""
+    for mode, spec in SEARCH_TABLES.items():
+        table, fts = spec['table'], spec['fts']
+        for column in spec['indexed']:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{mode}_{column} ON {table} ({column})')
+        # Risk class filters use the prediction index (risk_class may be NULL)
+        cursor.execute('DROP INDEX IF EXISTS idx_lifestyle_risk_class')
+
+        if not fts5_available(cursor):
+            continue
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        is_new = cursor.fetchone() is None
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(status, risk)')
+
+        new_risk, old_risk = spec['risk'].format(row='new'), spec['risk'].format(row='old')
+        new_status, old_status = _status_sql('new'), _status_sql('old')
+        # Triggers are recreated so databases from before compact storage pick
+        # up the status rendering
+        for trigger in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+        cursor.execute(f'''
+            CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, status, risk) VALUES (new.id, {new_status}, {new_risk});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {fts} WHERE rowid = old.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER {fts}_update AFTER UPDATE ON {table}
+            WHEN {new_status} IS NOT {old_status} OR {new_risk} IS NOT {old_risk} BEGIN
+                UPDATE {fts} SET status = {new_status}, risk = {new_risk} WHERE rowid = new.id;
+            END
+        ''')
+        if is_new:
+            cursor.execute(f'''
+                INSERT INTO {fts} (rowid, status, risk)
+                SELECT id, {_status_sql(table)}, {spec['risk'].format(row=table)} FROM {table}
+            ''')
+
+
+def _status_class(text):
+    """'diabetic', 'pre-diabetic', 'non-diabetic' or 'healthy' for a status word or template."""
+    match = STATUS_WORDS.search(text)
+    if match.group(1):
+        return f'{match.group(1).lower()}-diabetic'
+    return match.group(0).lower()
+
+
+# Status code (logic.STATUS_TEMPLATES) -> STATUS_CLASSES value
+_CODE_CLASSES = {code: STATUS_CLASSES[_status_class(template)]
+                 for code, template in logic.STATUS_TEMPLATES.items()}
+
+
+def status_class(status, code=None):
+    """Stored status_class of a status line (or of its code), None for other text."""
+    if code is None:
+        code, _ = logic.encode_status(status)
+    return _CODE_CLASSES.get(code)
+
+
+def backfill_status_classes(cursor, table_name, batch_size=5000):
+    """Set status_class on the rows stored before the column existed (either layout)."""
+    after_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT id, status, status_code FROM {table_name} WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        classes = [(status_class(status, code or None), record_id) for record_id, status, code in rows]
+        cursor.executemany(f'UPDATE {table_name} SET status_class = ? WHERE id = ?',
+                           [row for row in classes if row[0] is not None])
+        after_id = rows[-1][0]
+
+
+def split_status_words(text):
+    """(status classes, rest of the text) for a free-text search."""
+    return [_status_class(m.group(0)) for m in STATUS_WORDS.finditer(text)], STATUS_WORDS.sub(' ', text)
+
+
+def to_fts_query(text):
+    """Turn free text into a safe FTS5 query: every word is a quoted prefix term."""
+    words = re.findall(r'\w+', text)
+    return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+def build_search_query(cursor, mode, record_id=None, id_range=None, text=None,
+                       filters=None, limit=None):
+    """
+    Build (sql, params) for a record search. filters maps column -> (min, max)
+    for ranges (either end may be None) or column -> value for equality.
+    """
+    spec = SEARCH_TABLES[mode]
+    conditions, params = [], []
+
+    if record_id is not None:
+        conditions.append('t.id = ?')
+        params.append(int(record_id))
+    if id_range is not None:
+        low, high = id_range
+        if low is not None:
+            conditions.append('t.id >= ?')
+            params.append(int(low))
+        if high is not None:
+            conditions.append('t.id <= ?')
+            params.append(int(high))
+    if text and text.strip():
+        status_words, text = split_status_words(text)
+        for word in status_words:
+            conditions.append(f"t.id IN (SELECT id FROM {spec['table']} WHERE status_class = ?)")
+            params.append(STATUS_CLASSES[word])
+    if text and text.strip():
+        if fts5_available(cursor) and to_fts_query(text):
+            conditions.append(f"t.id IN (SELECT rowid FROM {spec['fts']} WHERE {spec['fts']} MATCH ?)")
+            params.append(to_fts_query(text))
+        else:
+            conditions.append(f"(t.status LIKE ? OR {spec['risk'].format(row='t')} LIKE ?)")
+            params.extend([f'%{text.strip()}%'] * 2)
+
+    for column, value in (filters or {}).items():
+        if column not in FILTER_COLUMNS[mode]:
+            raise ValueError(f"Cannot filter {mode} records on '{column}'")
+        if isinstance(value, (tuple, list)):
+            low, high = value
+            if low is not None:
+                conditions.append(f't.{column} >= ?')
+                params.append(low)
+            if high is not None:
+                conditions.append(f't.{column} <= ?')
+                params.append(high)
+        elif column == 'risk_class':
+            conditions.append('t.prediction = ?')
+            params.append(RISK_CLASS_PREDICTIONS.get(str(value).lower(), -1.0))
+        else:
+            conditions.append(f't.{column} = ?')
+            params.append(value)
+
+    sql = f"SELECT t.* FROM {spec['view']} t"
+    if conditions:
+        # '+t.id' stops SQLite from walking the whole table in rowid order to
+        # skip the sort; the filtered rows are few, so the indexes win
+        sql += ' WHERE ' + ' AND '.join(conditions) + ' ORDER BY +t.id DESC'
+    else:
+        sql += ' ORDER BY t.id DESC'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(int(limit))
+    return sql, params
+
+
+def parse_search_box(value):
+    """
+    Interpret the admin search box: '42' is an exact ID, '10-20' an ID range,
+    anything else free text. Returns (record_id, id_range, text).
+    """
+    value = (value or '').strip()
+    if value.isdigit():
+        return int(value), None, None
+    match = re.fullmatch(r'(\d*)\s*-\s*(\d*)', value)
+    if match and any(match.groups()):
+        low, high = match.groups()
+        return None, (int(low) if low else None, int(high) if high else None), None
+    return None, None, value or None
@@ -0,0 +1,96 @@
+"""
+Shadow scoring of candidate models.
+
+When the model manifest lists a candidate for a mode (key '<mode>_candidate',
+e.g. 'lifestyle_candidate'), each live prediction is also scored by the
+candidate on a small background thread pool and the comparison is stored in
+the shadow_predictions table. The live request never waits on the shadow
+result: when MAX_PENDING shadow jobs are already queued or running, new ones
+are dropped and counted instead of queued.
+
+Set DIABETES_SHADOW=0 to switch shadow scoring off.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+import model_registry
+
+ENABLED = os.environ.get('DIABETES_SHADOW', '1') == '1'
+MAX_WORKERS = int(os.environ.get('DIABETES_SHADOW_WORKERS', '2'))
+MAX_PENDING = int(os.environ.get('DIABETES_SHADOW_MAX_PENDING', '8'))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='shadow')
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_counter_lock = threading.Lock()
+_counters = {'submitted': 0, 'dropped': 0, 'failed': 0}
+
+
+def candidate_key(mode):
+    return f"{mode}_candidate"
+
+
+def _count(name):
+    with _counter_lock:
+        _counters[name] += 1
+
+
+def get_counters():
+    """Submitted/dropped/failed counts for this process."""
+    with _counter_lock:
+        return dict(_counters)
+
+
+def submit(mode, features, live_prediction, live_probabilities, live_version):
+    """
+    Queue a shadow comparison for one live prediction. Returns immediately;
+    False means there is no candidate or the pool was saturated.
+    """
+    if not ENABLED:
+        return False
+    registry = model_registry.get_registry()
+    if not registry.has(candidate_key(mode)):
+        return False
+    if not _slots.acquire(blocking=False):
+        _count('dropped')
+        return False
+
+    _count('submitted')
+    try:
+        future = _executor.submit(_score, registry, mode, features, live_prediction,
+                                  list(live_probabilities), live_version)
+    except RuntimeError:
+        _slots.release()
+        return False
+    future.add_done_callback(lambda _: _slots.release())
+    return True
+
+
+def _score(registry, mode, features, live_prediction, live_probabilities, live_version):
+    try:
+        start = time.perf_counter()
+        entry = registry.get(candidate_key(mode))
+        probabilities = entry.model.predict_proba(entry.scaler.transform(features))[0]
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        classes = list(entry.model.classes_)
+        shadow_prediction = classes[int(probabilities.argmax())]
+        live_index = classes.index(live_prediction)
+        deltas = [s - l for s, l in zip(probabilities, live_probabilities)]
+
+        db.save_shadow_prediction(
+            mode=mode,
+            live_version=live_version,
+            shadow_version=entry.version,
+            live_prediction=float(live_prediction),
+            shadow_prediction=float(shadow_prediction),
+            live_probability=float(live_probabilities[live_index]),
+            shadow_probability=float(probabilities[live_index]),
+            max_abs_delta=float(max(abs(d) for d in deltas)),
+            latency_ms=latency_ms
+        )
+    except Exception as e:
+        _count('failed')
+        print(f"Shadow scoring failed for {mode}: {e}")
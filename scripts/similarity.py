@@ -0,0 +1,237 @@
+"""
+"Similar patients" index over the clinical records.
+
+The eight clinical features of every stored record are standardized with the
+clinical model's scaler (pima_scaler) and put in a KD-tree, so the k nearest
+past assessments for a new one come back in about a millisecond.
+
+The tree is persisted next to the database (<db>_similarity.pkl) and loaded
+on first use. Records saved since the last build sit in a small buffer that
+is searched by brute force next to the tree. The tree is rebuilt in a
+background thread once the buffer grows past REBUILD_FRACTION of the tree,
+after deletes (the record_changes generation moved) or when the scaler changes.
+Queries never wait for a build: they use the old tree until the new one is
+swapped in, and before the first tree exists (no index file yet) every record
+sits in the buffer.
+
+With sharding on (see database.SHARDS) each shard has its own index and the
+results are merged by distance.
+"""
+import hashlib
+import os
+import pickle
+import threading
+
+import numpy as np
+
+import database as db
+
+FEATURES = ['pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin',
+            'bmi', 'diabetes_pedigree', 'age']
+
+REBUILD_FRACTION = 0.1
+MIN_REBUILD_BUFFER = 500
+LEAF_SIZE = 40
+
+
+def scaler_signature(scaler):
+    """Fingerprint of the standardization parameters an index was built with."""
+    digest = hashlib.sha256()
+    digest.update(np.asarray(scaler.mean_, dtype=np.float64).tobytes())
+    digest.update(np.asarray(scaler.scale_, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _index_path(db_path):
+    base, _ = os.path.splitext(db_path)
+    return f'{base}_similarity.pkl'
+
+
+class SimilarityIndex:
+    """KD-tree plus an append buffer over one database file's clinical records."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.path = _index_path(db_path)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._rebuilding = None
+        # Built state (swapped as a whole)
+        self.tree = None
+        self.tree_ids = np.empty(0, dtype=np.int64)
+        self.signature = None
+        self.generation = None
+        self.last_id = 0
+        # Rows saved since the tree was built
+        self.buffer_ids = []
+        self.buffer_vectors = []
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return
+        self.tree, self.tree_ids = state['tree'], state['ids']
+        self.signature, self.generation, self.last_id = state['signature'], state['generation'], state['last_id']
+
+    def _save(self):
+        state = {'tree': self.tree, 'ids': self.tree_ids, 'signature': self.signature,
+                 'generation': self.generation, 'last_id': self.last_id}
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + '.tmp', self.path)
+
+    def _read_rows(self, after_id=0):
+        """(generation, ids, raw feature matrix) for rows with id > after_id."""
+        conn = db._connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT generation FROM record_changes WHERE table_name = 'clinical_predictions'")
+        generation = cursor.fetchone()[0]
+        cursor.execute(f"SELECT id, {', '.join(FEATURES)} FROM clinical_predictions WHERE id > ? ORDER BY id",
+                       (after_id,))
+        rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, len(FEATURES) + 1)
+        conn.close()
+        return generation, rows[:, 0].astype(np.int64), rows[:, 1:]
+
+    def build(self, scaler):
+        """Build the tree from every stored record and persist it."""
+        from sklearn.neighbors import KDTree
+        generation, ids, raw = self._read_rows()
+        vectors = scaler.transform(raw) if len(raw) else raw
+        tree = KDTree(vectors, leaf_size=LEAF_SIZE) if len(vectors) else None
+        with self._lock:
+            # Keep buffered rows that arrived while building
+            last_id = int(ids[-1]) if len(ids) else 0
+            keep = [i for i, record_id in enumerate(self.buffer_ids) if record_id > last_id]
+            self.buffer_ids = [self.buffer_ids[i] for i in keep]
+            self.buffer_vectors = [self.buffer_vectors[i] for i in keep]
+            self.tree, self.tree_ids = tree, ids
+            self.signature, self.generation = scaler_signature(scaler), generation
+            self.last_id = max(last_id, self.last_id if keep else 0)
+            self._save()
+
+    def _rebuild_in_background(self, scaler):
+        if self._rebuilding is not None and self._rebuilding.is_alive():
+            return
+        self._rebuilding = threading.Thread(target=self.build, args=(scaler,),
+                                            name='similarity-rebuild', daemon=True)
+        self._rebuilding.start()
+
+    def refresh(self, scaler):
+        """Buffer new rows and start a rebuild when the tree is stale (or not built yet)."""
+        with self._refresh_lock:
+            generation, ids, raw = self._read_rows(self.last_id)
+            self._add_rows(scaler, generation, ids, raw)
+
+    def _add_rows(self, scaler, generation, ids, raw):
+        with self._lock:
+            if len(ids):
+                self.buffer_ids.extend(int(i) for i in ids)
+                self.buffer_vectors.extend(scaler.transform(raw))
+                self.last_id = int(ids[-1])
+            stale = (generation != self.generation
+                     or self.signature != scaler_signature(scaler)
+                     or len(self.buffer_ids) > max(MIN_REBUILD_BUFFER, REBUILD_FRACTION * len(self.tree_ids)))
+        if stale:
+            self._rebuild_in_background(scaler)
+
+    def query(self, vector, k):
+        """(ids, distances) of the k nearest records to one standardized vector."""
+        with self._lock:
+            tree, tree_ids = self.tree, self.tree_ids
+            buffer_ids = np.array(self.buffer_ids, dtype=np.int64)
+            buffer_vectors = np.array(self.buffer_vectors).reshape(-1, len(FEATURES))
+        ids, distances = [], []
+        if tree is not None:
+            dist, index = tree.query(vector.reshape(1, -1), k=min(k, len(tree_ids)))
+            ids.extend(tree_ids[index[0]])
+            distances.extend(dist[0])
+        if len(buffer_ids):
+            buffer_dist = np.sqrt(((buffer_vectors - vector) ** 2).sum(axis=1))
+            nearest = np.argsort(buffer_dist)[:k]
+            ids.extend(buffer_ids[nearest])
+            distances.extend(buffer_dist[nearest])
+        order = np.argsort(distances, kind='stable')[:k]
+        return np.asarray(ids, dtype=np.int64)[order], np.asarray(distances)[order]
+
+    def near_duplicates(self, scaler, max_distance):
+        """(id_a, id_b, distance) pairs of records closer than max_distance."""
+        from sklearn.neighbors import KDTree
+        generation, ids, raw = self._read_rows()
+        if len(ids) < 2:
+            return []
+        with self._lock:
+            tree = self.tree if len(self.tree_ids) == len(ids) and self.generation == generation else None
+        vectors = scaler.transform(raw)
+        if tree is None:
+            tree = KDTree(vectors, leaf_size=LEAF_SIZE)
+        # Three neighbors: with exact duplicates the row itself need not come first
+        dist, index = tree.query(vectors, k=min(3, len(ids)))
+        pairs = {}
+        for row in range(len(ids)):
+            others = [(n, d) for n, d in zip(index[row], dist[row]) if n != row]
+            neighbor, distance = others[0]
+            if distance <= max_distance:
+                a, b = sorted((int(ids[row]), int(ids[neighbor])))
+                pairs[(a, b)] = float(distance)
+        return [(a, b, d) for (a, b), d in sorted(pairs.items(), key=lambda item: item[1])]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_path, scaler):
+    """The process-wide index for one database file, refreshed with new rows."""
+    with _indexes_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = SimilarityIndex(db_path)
+        index = _indexes[db_path]
+    index.refresh(scaler)
+    return index
+
+
+def find_similar(features, scaler, k=5):
+    """
+    The k stored clinical records nearest to one assessment (raw feature
+    values in FEATURES order), with a 'distance' column in standardized units.
+    """
+    import pandas as pd
+    vector = scaler.transform(np.asarray(features, dtype=np.float64).reshape(1, -1))[0]
+
+    def search(site, path):
+        index = get_index(path, scaler)
+        # A few extra in case some neighbors were deleted since the last build
+        ids, distances = index.query(vector, k + 5)
+        if not len(ids):
+            return None
+        conn = db._connect(path)
+        placeholders = ', '.join('?' * len(ids))
+        df = pd.read_sql_query(f'SELECT * FROM clinical_records WHERE id IN ({placeholders})',
+                               conn, params=[int(i) for i in ids])
+        conn.close()
+        df['distance'] = df['id'].map(dict(zip(ids.tolist(), distances.tolist())))
+        if site is not None:
+            df.insert(1, 'site', site)
+        return df
+
+    frames = [f for f in db._fan_out(search) if f is not None]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values('distance', kind='mergesort', ignore_index=True).head(k)
+
+
+def find_near_duplicates(scaler, max_distance=0.05):
+    """Pairs of clinical records whose standardized features are within max_distance."""
+    import pandas as pd
+    frames = []
+    for site, path in db._shard_paths():
+        pairs = get_index(path, scaler).near_duplicates(scaler, max_distance)
+        df = pd.DataFrame(pairs, columns=['id_a', 'id_b', 'distance'])
+        if site is not None:
+            df.insert(0, 'site', site)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
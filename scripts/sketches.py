@@ -0,0 +1,287 @@
+"""
+Mergeable streaming sketches for the admin summary metrics.
+
+A ColumnSketch keeps, for one numeric column:
+- count / min / max / mean / variance (Welford accumulators, merged with Chan's formula)
+- a fixed-bin histogram
+- a KLL quantile sketch (percentiles with ~1-2% rank error at K=200)
+
+Sketches are stored per (table, column, segment) in the column_sketches table,
+where the segment is the prediction outcome. Segments merge into the overall
+sketch at read time, so reading a summary costs the same for 100 rows as for
+10 million.
+
+Inserts do not touch the sketches: a stored KLL state is a few kilobytes of
+JSON per column, too much to rewrite on every insert. sketch_progress holds
+the last record id folded in per table; catch_up() folds the newer rows in
+batches (the 'update_sketches' job), and reads fold whatever is still pending
+in memory, so summaries are always current. Deleting a row that is already
+folded in marks the table's sketches stale; the next catch_up() rebuilds them
+(until then they still count the deleted row).
+"""
+import json
+import math
+import random
+
+# Columns that are sketched, with their histogram bin edges
+SKETCH_COLUMNS = {
+    'clinical_predictions': {
+        'age': [i * 5 for i in range(25)],
+        'glucose': [i * 10 for i in range(31)],
+        'bmi': [i * 2.5 for i in range(29)],
+        'risk_percentage': [i * 5 for i in range(21)],
+    },
+    'lifestyle_predictions': {
+        'bmi': [10 + i * 2.5 for i in range(21)],
+        'mental_health': [i * 2 for i in range(16)],
+    },
+}
+
+# Segment label for a row, from its prediction
+SEGMENTS = {
+    'clinical_predictions': lambda prediction: 'Diabetic' if prediction == 1 else 'Non-Diabetic',
+    'lifestyle_predictions': lambda prediction: {2.0: 'Diabetic', 1.0: 'Pre-Diabetic'}.get(prediction, 'Healthy'),
+}
+
+KLL_K = 200
+
+
+class KLLSketch:
+    """Compact KLL quantile sketch (Karnin, Lang & Liberty)."""
+
+    def __init__(self, k=KLL_K, compactors=None):
+        self.k = k
+        self.compactors = compactors or [[]]
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _size(self):
+        return sum(len(c) for c in self.compactors)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        if self._size() >= self._max_size():
+            self._compress()
+
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            if len(self.compactors[level]) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                items = sorted(self.compactors[level])
+                # Keep one item back when odd so no weight is lost
+                leftover = [items.pop()] if len(items) % 2 else []
+                offset = random.randint(0, 1)
+                self.compactors[level + 1].extend(items[offset::2])
+                self.compactors[level] = leftover
+                if self._size() < self._max_size():
+                    break
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        while self._size() >= self._max_size():
+            self._compress()
+        return self
+
+    def quantiles(self, fractions):
+        weighted = sorted((value, 2 ** level)
+                          for level, items in enumerate(self.compactors) for value in items)
+        if not weighted:
+            return [None] * len(fractions)
+        total = sum(w for _, w in weighted)
+        results = []
+        for fraction in fractions:
+            target, cumulative = fraction * total, 0
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(weighted[-1][0])
+        return results
+
+
+class ColumnSketch:
+    """Moments, histogram and quantile sketch for one column."""
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = [0] * (len(self.edges) - 1)
+        self.kll = KLLSketch()
+
+    def update(self, value):
+        if value is None:
+            return
+        value = float(value)
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.histogram[self._bin(value)] += 1
+        self.kll.update(value)
+
+    def _bin(self, value):
+        for index in range(len(self.edges) - 2, -1, -1):
+            if value >= self.edges[index]:
+                return index
+        return 0
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.min, self.max, self.mean, self.m2 = other.min, other.max, other.mean, other.m2
+        else:
+            total = self.count + other.count
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.count * other.count / total
+            self.mean += delta * other.count / total
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.kll.merge(other.kll)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def percentiles(self, points=(10, 25, 50, 75, 90)):
+        return dict(zip(points, self.kll.quantiles([p / 100 for p in points])))
+
+    def to_json(self):
+        return json.dumps({
+            'edges': self.edges, 'count': self.count, 'min': self.min, 'max': self.max,
+            'mean': self.mean, 'm2': self.m2, 'histogram': self.histogram,
+            'kll_k': self.kll.k, 'kll': self.kll.compactors,
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        sketch = cls(data['edges'])
+        sketch.count, sketch.min, sketch.max = data['count'], data['min'], data['max']
+        sketch.mean, sketch.m2, sketch.histogram = data['mean'], data['m2'], data['histogram']
+        sketch.kll = KLLSketch(data['kll_k'], data['kll'])
+        return sketch
+
+
+# --- Persistence (runs on the caller's cursor/transaction) ---
+def load_sketches(cursor, table_name, column_name):
+    """{segment: ColumnSketch} for one column."""
+    cursor.execute('SELECT segment, state FROM column_sketches WHERE table_name = ? AND column_name = ?',
+                   (table_name, column_name))
+    return {segment: ColumnSketch.from_json(state) for segment, state in cursor.fetchall()}
+
+
+def load_merged(cursor, table_name, column_name, segment=None):
+    """Merged sketch for a column, across segments unless one is given, including pending rows."""
+    parts = load_sketches(cursor, table_name, column_name)
+    _fold(cursor, table_name, parts, _last_id(cursor, table_name), [column_name])
+    sketch = ColumnSketch(SKETCH_COLUMNS[table_name][column_name])
+    for name, part in parts.items():
+        if segment is None or name == segment:
+            sketch.merge(part)
+    return sketch
+
+
+def _last_id(cursor, table_name):
+    cursor.execute('SELECT last_id FROM sketch_progress WHERE table_name = ?', (table_name,))
+    found = cursor.fetchone()
+    return found[0] if found else 0
+
+
+def mark_deleted(cursor, table_name, record_id):
+    """Note a deleted record: sketches that already hold it are rebuilt by the next catch_up()."""
+    cursor.execute('UPDATE sketch_progress SET stale = 1 WHERE table_name = ? AND last_id >= ?',
+                   (table_name, record_id))
+
+
+def _store(cursor, table_name, column_name, segment, sketch):
+    cursor.execute('''
+        INSERT INTO column_sketches (table_name, column_name, segment, state) VALUES (?, ?, ?, ?)
+        ON CONFLICT(table_name, column_name, segment) DO UPDATE SET state = excluded.state
+    ''', (table_name, column_name, segment, sketch.to_json()))
+
+
+def _fold(cursor, table_name, sketches, after_id, columns, batch_size=5000):
+    """
+    Fold the rows after after_id into sketches ({segment: ColumnSketch} for
+    one column, {(column, segment): ColumnSketch} for several). Returns the
+    last id folded.
+    """
+    single = len(columns) == 1
+    while True:
+        cursor.execute(f'''
+            SELECT id, prediction, {', '.join(columns)} FROM {table_name}
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return after_id
+        for _, prediction, *values in rows:
+            segment = SEGMENTS[table_name](prediction)
+            for column_name, value in zip(columns, values):
+                key = segment if single else (column_name, segment)
+                if key not in sketches:
+                    sketches[key] = ColumnSketch(SKETCH_COLUMNS[table_name][column_name])
+                sketches[key].update(value)
+        after_id = rows[-1][0]
+
+
+def catch_up(cursor, table_name):
+    """
+    Fold the rows inserted since the last catch-up into the stored sketches
+    (all rows, when deletes made them stale). Returns how many.
+    """
+    cursor.execute('SELECT stale FROM sketch_progress WHERE table_name = ?', (table_name,))
+    found = cursor.fetchone()
+    if found and found[0]:
+        cursor.execute('DELETE FROM column_sketches WHERE table_name = ?', (table_name,))
+        cursor.execute('DELETE FROM sketch_progress WHERE table_name = ?', (table_name,))
+    after_id = _last_id(cursor, table_name)
+    cursor.execute(f'SELECT COUNT(*) FROM {table_name} WHERE id > ?', (after_id,))
+    pending = cursor.fetchone()[0]
+    if not pending:
+        return 0
+    columns = list(SKETCH_COLUMNS[table_name])
+    sketches = {}
+    for column_name in columns:
+        for segment, sketch in load_sketches(cursor, table_name, column_name).items():
+            sketches[(column_name, segment)] = sketch
+    last_id = _fold(cursor, table_name, sketches, after_id, columns)
+    for (column_name, segment), sketch in sketches.items():
+        _store(cursor, table_name, column_name, segment, sketch)
+    cursor.execute('''
+        INSERT INTO sketch_progress (table_name, last_id) VALUES (?, ?)
+        ON CONFLICT(table_name) DO UPDATE SET last_id = excluded.last_id
+    ''', (table_name, last_id))
+    return pending
+
+
+def rebuild(cursor, table_name):
+    """Recompute a table's sketches from its rows now (after dedupes)."""
+    cursor.execute('DELETE FROM column_sketches WHERE table_name = ?', (table_name,))
+    cursor.execute('DELETE FROM sketch_progress WHERE table_name = ?', (table_name,))
+    catch_up(cursor, table_name)
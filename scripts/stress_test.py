@@ -0,0 +1,265 @@
+"""
+Concurrent-session stress test of the SQLite write path.
+
+Simulates N patient sessions (score an assessment the way app.py does, then
+save_clinical_prediction / save_lifestyle_prediction) and M admin sessions
+(the queries admin.py runs on every page load) against a temporary database,
+with threads or processes. Reports throughput, latency percentiles,
+"database is locked" errors and how many operations needed retries or gave up.
+
+Each configuration (journal mode x busy timeout x worker kind) is run against
+a fresh copy of the same seeded database, so the results are comparable side
+by side:
+
+    python stress_test.py --patients 8 --admins 2 --duration 10
+    python stress_test.py --journal-mode delete wal --timeout 0.1 5 --workers thread process
+
+Scoring uses the models in models/ when they are there; without them the
+advice logic still runs on a random prediction so the write path is unchanged.
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Synthetic patients only; a real deployment sets its own salt
+os.environ.setdefault('DIABETES_PATIENT_ID_SALT', 'stress-test')
+
+import database as db
+import logic
+import record_cache
+
+# A busy lock can also surface while the FTS5 search table is being opened
+LOCKED_MESSAGES = ('database is locked', 'database table is locked', 'vtable constructor failed')
+
+
+def _admin_queries():
+    """(name, function) pairs for what one admin page load reads."""
+    return [
+        ('admin:statistics', db.get_statistics),
+        ('admin:clinical_records', lambda: record_cache.get_records('clinical')),
+        ('admin:lifestyle_records', lambda: record_cache.get_records('lifestyle')),
+        ('admin:column_summary', lambda: db.get_column_summary('clinical_predictions')),
+        ('admin:drift', db.get_drift_scores),
+        ('admin:search', lambda: db.search_records('lifestyle', text='diabetic', limit=100)),
+    ]
+
+
+# --- SCORING ---
+_registry = None
+
+
+def _load_models():
+    """The model registry if the model files exist, else None (per process)."""
+    global _registry
+    if _registry is None:
+        import model_registry
+        try:
+            registry = model_registry.get_registry()
+            registry.get('clinical')
+            registry.get('lifestyle')
+            _registry = registry
+        except FileNotFoundError:
+            _registry = False
+    return _registry or None
+
+
+def _clinical_assessment(rng):
+    import numpy as np
+    features = np.array([[rng.randint(0, 10), rng.uniform(70, 200), rng.uniform(55, 100),
+                          rng.uniform(10, 45), rng.uniform(15, 300), rng.uniform(18, 45),
+                          rng.uniform(0.1, 2.0), rng.randint(21, 80)]])
+    registry = _load_models()
+    if registry:
+        entry = registry.get('clinical')
+        scaled = entry.scaler.transform(features)
+        probability = entry.model.predict_proba(scaled)[0][1]
+        version = entry.version
+    else:
+        probability, version = rng.random(), None
+    prediction = int(probability >= 0.5)
+    risk_percent = round(probability * 100, 2)
+    status, _, _ = logic.get_clinical_advice(prediction, features[0], risk_percent)
+    return dict(pregnancies=int(features[0][0]), glucose=float(features[0][1]),
+                blood_pressure=float(features[0][2]), skin_thickness=float(features[0][3]),
+                insulin=float(features[0][4]), bmi=float(features[0][5]),
+                diabetes_pedigree=float(features[0][6]), age=int(features[0][7]),
+                prediction=prediction, risk_percentage=float(risk_percent), status=status,
+                model_version=version)
+
+
+def _lifestyle_assessment(rng):
+    import numpy as np
+    inputs = np.array([[rng.randint(0, 1), rng.randint(0, 1), rng.uniform(18, 45),
+                        *[rng.randint(0, 1) for _ in range(5)], rng.randint(1, 5), rng.randint(0, 30)]])
+    registry = _load_models()
+    if registry:
+        entry = registry.get('lifestyle')
+        scaled = entry.scaler.transform(inputs)
+        probabilities = entry.model.predict_proba(scaled)[0]
+        version = entry.version
+    else:
+        probabilities, version = np.random.default_rng(rng.getrandbits(32)).dirichlet([1, 1, 1]), None
+    prediction = float(np.argmax(probabilities))
+    risk_percents = [round(p * 100, 2) for p in probabilities]
+    status, _, _ = logic.get_lifestyle_advice(prediction, inputs[0], risk_percents)
+    values = inputs[0]
+    return dict(high_bp=int(values[0]), high_chol=int(values[1]), bmi=float(values[2]),
+                smoker=int(values[3]), physical_activity=int(values[4]), fruits=int(values[5]),
+                vegetables=int(values[6]), heavy_alcohol=int(values[7]),
+                general_health=int(values[8]), mental_health=int(values[9]),
+                prediction=prediction, risk_class=db.RISK_CLASSES[prediction], status=status,
+                model_version=version)
+
+
+# --- SESSIONS ---
+def _timed(name, func, retries, retry_wait):
+    """Run one operation, retrying on lock errors. Returns a sample dict."""
+    started = time.perf_counter()
+    locked = 0
+    for attempt in range(retries + 1):
+        try:
+            func()
+            return {'op': name, 'ms': (time.perf_counter() - started) * 1000,
+                    'locked': locked, 'failed': False}
+        except sqlite3.OperationalError as e:
+            if not str(e).startswith(LOCKED_MESSAGES):
+                raise
+            locked += 1
+            if attempt < retries:
+                # Exponential backoff with jitter so retries do not collide again
+                time.sleep(retry_wait * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return {'op': name, 'ms': (time.perf_counter() - started) * 1000, 'locked': locked, 'failed': True}
+
+
+def run_session(role, seed, db_path, config):
+    """One simulated session until config['stop_at']. Returns its samples."""
+    db.DB_PATH = db_path
+    db.BUSY_TIMEOUT = config['timeout']
+    rng = random.Random(seed)
+    samples = []
+    queries = _admin_queries()
+    while time.time() < config['stop_at']:
+        if role == 'patient':
+            if rng.random() < 0.5:
+                row = _clinical_assessment(rng)
+                name, save = 'patient:save_clinical', db.save_clinical_prediction
+            else:
+                row = _lifestyle_assessment(rng)
+                name, save = 'patient:save_lifestyle', db.save_lifestyle_prediction
+            row['patient_id'] = db.hash_patient_id(f'STRESS-{seed}-{rng.randint(1, 20)}')
+            samples.append(_timed(name, lambda: save(**row), config['retries'], config['retry_wait']))
+            time.sleep(config['think_time'] * rng.random())
+        else:
+            for name, query in queries:
+                samples.append(_timed(name, query, config['retries'], config['retry_wait']))
+            time.sleep(config['think_time'] * rng.random())
+    return samples
+
+
+# --- SETUP & REPORT ---
+def seed_database(path, rows):
+    """A fresh database with `rows` assessments per mode, so admin queries have data."""
+    db.DB_PATH = path
+    db.init_db()
+    rng = random.Random(0)
+    for i in range(rows):
+        db.save_clinical_prediction(**_clinical_assessment(rng), patient_id=db.hash_patient_id(f'SEED-{i % 50}'))
+        db.save_lifestyle_prediction(**_lifestyle_assessment(rng), patient_id=db.hash_patient_id(f'SEED-{i % 50}'))
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_configuration(template, journal_mode, timeout, workers, args):
+    """Run every session against a copy of the seeded database and summarize."""
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'stress.db')
+    shutil.copy(template, path)
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    conn.close()
+
+    config = {'timeout': timeout, 'retries': args.retries, 'retry_wait': args.retry_wait,
+              'think_time': args.think_time, 'stop_at': time.time() + args.duration}
+    sessions = ([('patient', i) for i in range(args.patients)]
+                + [('admin', 1000 + i) for i in range(args.admins)])
+    pool_class = ThreadPoolExecutor if workers == 'thread' else ProcessPoolExecutor
+    started = time.perf_counter()
+    with pool_class(max_workers=len(sessions)) as pool:
+        futures = [pool.submit(run_session, role, seed, path, config) for role, seed in sessions]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {}
+    for op in sorted({s['op'] for s in samples}):
+        op_samples = [s for s in samples if s['op'] == op]
+        latencies = sorted(s['ms'] for s in op_samples if not s['failed'])
+        summary[op] = {
+            'ops': len(op_samples),
+            'per_second': sum(not s['failed'] for s in op_samples) / elapsed,
+            'p50': _percentile(latencies, 0.5) if latencies else None,
+            'p95': _percentile(latencies, 0.95) if latencies else None,
+            'p99': _percentile(latencies, 0.99) if latencies else None,
+            'locked': sum(s['locked'] for s in op_samples),
+            'retried': sum(s['locked'] > 0 and not s['failed'] for s in op_samples),
+            'failed': sum(s['failed'] for s in op_samples),
+        }
+    return summary
+
+
+def print_summary(label, summary):
+    print(f"\n{label}")
+    print(f"{'operation':<28}{'ops':>7}{'ops/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'locked':>8}{'retried':>9}{'failed':>8}")
+
+    def ms(value):
+        return f'{value:.1f}' if value is not None else '-'
+
+    for op, row in summary.items():
+        print(f"{op:<28}{row['ops']:>7}{row['per_second']:>8.1f}{ms(row['p50']):>9}{ms(row['p95']):>9}"
+              f"{ms(row['p99']):>9}{row['locked']:>8}{row['retried']:>9}{row['failed']:>8}")
+    writes = [row for op, row in summary.items() if op.startswith('patient:')]
+    print(f"{'writes total':<28}{sum(r['ops'] for r in writes):>7}{sum(r['per_second'] for r in writes):>8.1f}"
+          f"{'':>27}{sum(r['locked'] for r in writes):>8}{sum(r['retried'] for r in writes):>9}"
+          f"{sum(r['failed'] for r in writes):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=8, help='concurrent patient sessions')
+    parser.add_argument('--admins', type=int, default=2, help='concurrent admin sessions')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per configuration')
+    parser.add_argument('--seed-rows', type=int, default=2000, help='records per mode before the run')
+    parser.add_argument('--journal-mode', nargs='+', default=['delete'], choices=['delete', 'wal', 'truncate'])
+    parser.add_argument('--timeout', nargs='+', type=float, default=[db.BUSY_TIMEOUT],
+                        help='busy timeout(s) in seconds')
+    parser.add_argument('--workers', nargs='+', default=['thread'], choices=['thread', 'process'])
+    parser.add_argument('--retries', type=int, default=3, help='retries after "database is locked"')
+    parser.add_argument('--retry-wait', type=float, default=0.05, help='first retry delay in seconds')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='max random pause between a session\'s operations, in seconds')
+    args = parser.parse_args()
+
+    template = os.path.join(tempfile.mkdtemp(), 'template.db')
+    print(f"Seeding {args.seed_rows} records per mode...")
+    seed_database(template, args.seed_rows)
+    if not _load_models():
+        print("Model files not found: scoring runs the advice logic on random predictions.")
+
+    for journal_mode, timeout, workers in itertools.product(args.journal_mode, args.timeout, args.workers):
+        summary = run_configuration(template, journal_mode, timeout, workers, args)
+        print_summary(f"journal_mode={journal_mode}  busy_timeout={timeout:g}s  workers={workers}  "
+                      f"({args.patients} patients, {args.admins} admins, {args.duration:g}s)", summary)
+    shutil.rmtree(os.path.dirname(template), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+What-if risk curves for an assessment result.
+
+Takes the patient's input vector, varies one or two features over a grid
+(GRID_STEPS values each, so a 50 x 50 heatmap is 2,500 rows) and scores the
+whole grid with one scaler.transform and one predict_proba call. The risk is
+the probability of the positive classes: diabetic for the clinical model,
+pre-diabetic or diabetic for the lifestyle model.
+"""
+import numpy as np
+
+GRID_STEPS = 50
+
+# Model input columns, in the order the models were trained on
+FEATURES = {
+    'clinical': ['pregnancies', 'glucose', 'blood_pressure', 'skin_thickness', 'insulin',
+                 'bmi', 'diabetes_pedigree', 'age'],
+    'lifestyle': ['high_bp', 'high_chol', 'bmi', 'smoker', 'physical_activity', 'fruits',
+                  'vegetables', 'heavy_alcohol', 'general_health', 'mental_health'],
+}
+
+# Feature -> (label, low, high, kind) for the features that can be varied;
+# kind is 'real', 'int' (rounded grid) or 'binary' (No/Yes)
+RANGES = {
+    'clinical': {
+        'glucose': ('Glucose (mg/dL)', 60, 250, 'real'),
+        'bmi': ('BMI', 16, 50, 'real'),
+        'blood_pressure': ('Blood Pressure (mmHg)', 40, 120, 'real'),
+        'insulin': ('Insulin (mu U/ml)', 0, 400, 'real'),
+        'age': ('Age', 18, 90, 'int'),
+        'diabetes_pedigree': ('Diabetes Pedigree', 0.05, 2.5, 'real'),
+        'pregnancies': ('Pregnancies', 0, 15, 'int'),
+        'skin_thickness': ('Skin Thickness (mm)', 0, 80, 'real'),
+    },
+    'lifestyle': {
+        'bmi': ('BMI', 16, 50, 'real'),
+        'general_health': ('General Health (1=Excellent, 5=Poor)', 1, 5, 'int'),
+        'mental_health': ("Mental health 'not good' days", 0, 30, 'int'),
+        'high_bp': ('High Blood Pressure', 0, 1, 'binary'),
+        'high_chol': ('High Cholesterol', 0, 1, 'binary'),
+        'smoker': ('Smoker', 0, 1, 'binary'),
+        'physical_activity': ('Physical Activity', 0, 1, 'binary'),
+        'fruits': ('Fruits Daily', 0, 1, 'binary'),
+        'vegetables': ('Vegetables Daily', 0, 1, 'binary'),
+        'heavy_alcohol': ('Heavy Drinker', 0, 1, 'binary'),
+    },
+}
+
+RISK_CLASSES = {'clinical': [1], 'lifestyle': [1.0, 2.0]}
+
+
+def grid_values(mode, feature, steps=GRID_STEPS):
+    """Values a feature is varied over."""
+    _, low, high, kind = RANGES[mode][feature]
+    if kind == 'binary':
+        return np.array([0.0, 1.0])
+    values = np.linspace(low, high, steps)
+    return np.unique(values.round()) if kind == 'int' else values
+
+
+def risk_grid(entry, mode, base, variations):
+    """
+    Risk (%) for the base input vector with the features in `variations`
+    ([(feature, values)], one or two) set to every combination of their
+    values. Returns an array of shape (len(values1),) or (len(values1), len(values2)).
+    """
+    axes = np.meshgrid(*[values for _, values in variations], indexing='ij')
+    X = np.repeat(np.asarray(base, dtype=np.float64).reshape(1, -1), axes[0].size, axis=0)
+    for (feature, _), axis in zip(variations, axes):
+        X[:, FEATURES[mode].index(feature)] = axis.ravel()
+    probabilities = entry.model.predict_proba(entry.scaler.transform(X))
+    positive = np.isin(entry.model.classes_, RISK_CLASSES[mode])
+    return (probabilities[:, positive].sum(axis=1) * 100).reshape(axes[0].shape)
+
+
+def figure(mode, base, variations, risk):
+    """Plotly risk curve (one feature) or heatmap (two), marking the patient's current values."""
+    import plotly.graph_objects as go
+    labels = [RANGES[mode][feature][0] for feature, _ in variations]
+    current = [base[FEATURES[mode].index(feature)] for feature, _ in variations]
+    fig = go.Figure()
+    if len(variations) == 1:
+        fig.add_trace(go.Scatter(x=variations[0][1], y=risk, mode='lines', name='Risk',
+                                 line=dict(color='#f5576c', width=3)))
+        fig.add_vline(x=current[0], line_dash='dash', annotation_text='You')
+        fig.update_layout(xaxis_title=labels[0], yaxis_title='Risk (%)', yaxis_range=[0, 100])
+    else:
+        # Rows of the grid are the first feature, so it goes on the y axis
+        fig.add_trace(go.Heatmap(x=variations[1][1], y=variations[0][1], z=risk, zmin=0, zmax=100,
+                                 colorscale='RdYlGn_r', colorbar=dict(title='Risk (%)')))
+        fig.add_trace(go.Scatter(x=[current[1]], y=[current[0]], mode='markers+text', text=['You'],
+                                 textposition='top center', marker=dict(color='black', size=10, symbol='x'),
+                                 showlegend=False))
+        fig.update_layout(xaxis_title=labels[1], yaxis_title=labels[0])
+    fig.update_layout(height=380, margin=dict(t=20, b=20))
+    return fig
@@ -0,0 +1,135 @@
+"""
+Background worker for the job queue (jobs.py).
+
+Run it as its own process next to the Streamlit apps:
+
+    python worker.py [--threads 2] [--processes 1] [--poll 2] [--once]
+
+Every poll it queues the cron schedules that are due, then claims ready jobs
+while it has free slots: 'thread' tasks run on a thread pool, CPU-bound
+'process' tasks on a process pool. A heartbeat thread extends the leases of
+running jobs every LEASE_SECONDS / 3, so a long VACUUM or rescore keeps its
+lease while a crashed worker's jobs are picked up again by another worker.
+Durations, results and errors are written back to the jobs table (shown in
+admin.py). SIGINT/SIGTERM stop claiming and wait for running jobs.
+--once drains the ready jobs and exits (for an external cron or a test).
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import database as db
+import jobs
+
+POLL_SECONDS = float(os.environ.get('DIABETES_WORKER_POLL_SECONDS', '2'))
+
+
+def _init_process(db_path):
+    # forkserver children start from a fresh interpreter, not the parent's state
+    db.DB_PATH = db_path
+
+
+def _heartbeat(worker_id, running, lock, stop_event, interval):
+    while not stop_event.wait(interval):
+        with lock:
+            job_ids = list(running)
+        try:
+            jobs.extend_leases(worker_id, job_ids)
+        except Exception as e:
+            print(f"Lease heartbeat failed: {e}")
+
+
+def run_worker(threads=2, processes=1, poll=POLL_SECONDS, once=False, stop_event=None, schedules=True):
+    """Run jobs until stop_event is set (or, with once, until no job is ready). Returns the jobs run."""
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    stop_event = stop_event or threading.Event()
+    pools = {'thread': ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job')}
+    slots = {'thread': threads}
+    if processes > 0:
+        # forkserver: forking after the heartbeat and pool threads have started
+        # can copy a held lock into the child and hang it
+        pools['process'] = ProcessPoolExecutor(max_workers=processes,
+                                               mp_context=multiprocessing.get_context('forkserver'),
+                                               initializer=_init_process, initargs=(db.DB_PATH,))
+        slots['process'] = processes
+    running, lock = {}, threading.Lock()
+    heartbeat_stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, name='job-heartbeat', daemon=True,
+                                 args=(worker_id, running, lock, heartbeat_stop, max(jobs.LEASE_SECONDS / 3, 1)))
+    heartbeat.start()
+    if schedules:
+        jobs.sync_schedules()
+    finished = 0
+
+    def collect():
+        nonlocal finished
+        with lock:
+            done = [(job_id, item) for job_id, item in running.items() if item[0].done()]
+            for job_id, _ in done:
+                del running[job_id]
+        for job_id, (future, job, started) in done:
+            duration = time.perf_counter() - started
+            try:
+                jobs.complete(job_id, worker_id, future.result(), duration)
+                print(f"Job {job_id} ({job['task']}) done in {duration:.1f}s")
+            except Exception as e:
+                jobs.fail(job_id, worker_id, f'{type(e).__name__}: {e}', duration)
+                print(f"Job {job_id} ({job['task']}) failed (attempt {job['attempts']}/{job['max_attempts']}): {e}")
+            finished += 1
+
+    try:
+        while not stop_event.is_set():
+            if schedules:
+                jobs.enqueue_due()
+            collect()
+            claimed = False
+            while True:
+                with lock:
+                    busy = {kind: 0 for kind in slots}
+                    for _, job, _ in running.values():
+                        busy[jobs.TASKS[job['task']][1]] += 1
+                free = [task for task, (_, kind) in jobs.TASKS.items()
+                        if kind in slots and busy[kind] < slots[kind]]
+                job = jobs.claim(worker_id, free) if free else None
+                if job is None:
+                    break
+                claimed = True
+                kind = jobs.TASKS[job['task']][1]
+                future = pools[kind].submit(jobs.run_task, job['task'], job['args'])
+                with lock:
+                    running[job['id']] = (future, job, time.perf_counter())
+            with lock:
+                idle = not running
+            if once and idle and not claimed:
+                break
+            stop_event.wait(poll if not once else 0.1)
+    finally:
+        # Let running jobs finish so their results are recorded
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+        collect()
+        heartbeat_stop.set()
+    return finished
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=2, help='slots for thread tasks')
+    parser.add_argument('--processes', type=int, default=1, help='slots for CPU-bound tasks (0 disables them)')
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between queue polls')
+    parser.add_argument('--once', action='store_true', help='run the ready jobs, then exit')
+    parser.add_argument('--no-schedules', action='store_true', help='only run queued jobs')
+    args = parser.parse_args()
+
+    db.init_db()
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    print(f"Worker started ({args.threads} threads, {args.processes} processes)")
+    count = run_worker(args.threads, args.processes, args.poll, args.once, stop, not args.no_schedules)
+    print(f"Worker stopped after {count} jobs")
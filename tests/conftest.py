@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+# Test patients only; deployments set their own salt
+os.environ.setdefault('DIABETES_PATIENT_ID_SALT', 'test-salt')
+
+import database as db
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A fresh, initialized records database for one test."""
+    path = str(tmp_path / 'records.db')
+    monkeypatch.setattr(db, 'DB_PATH', path)
+    db.init_db()
+    return path
+
+
+@pytest.fixture
+def write_before(monkeypatch):
+    """
+    write_before(marker, write) makes the next statement containing marker,
+    on any connection from db._connect, run write() first (once). write()
+    itself sees the original db._connect.
+    """
+    connect = db._connect
+    pending = []
+
+    class Cursor(sqlite3.Cursor):
+        def execute(self, sql, *args):
+            for item in [item for item in pending if item[0] in sql]:
+                pending.remove(item)
+                monkeypatch.setattr(db, '_connect', connect)
+                try:
+                    item[1]()
+                finally:
+                    monkeypatch.setattr(db, '_connect', injecting_connect)
+            return super().execute(sql, *args)
+
+    class Connection(sqlite3.Connection):
+        def cursor(self, factory=Cursor):
+            return super().cursor(factory)
+
+    def injecting_connect(path=None):
+        return sqlite3.connect(path or db.DB_PATH, timeout=db.BUSY_TIMEOUT, factory=Connection)
+
+    def arm(marker, write):
+        pending.append((marker, write))
+        monkeypatch.setattr(db, '_connect', injecting_connect)
+    return arm
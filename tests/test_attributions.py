@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import attributions
+
+
+@pytest.fixture(scope='module')
+def forest():
+    """A 300-tree forest like the lifestyle model: three classes, fully grown trees."""
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 2, (1000, 10)).astype(float)
+    X[:, 2] = rng.normal(28, 6, 1000)
+    y = np.clip((X[:, 0] + X[:, 1] + (X[:, 2] > 30)).round(), 0, 2).astype(float)
+    return RandomForestClassifier(300, random_state=0).fit(X, y), X[:50]
+
+
+@pytest.fixture(params=['leaf table', 'path matrix'])
+def explainer(request, forest, monkeypatch):
+    if request.param == 'path matrix':
+        monkeypatch.setattr(attributions, 'MAX_LEAF_TABLE_BYTES', 0)
+    explainer = attributions.ForestExplainer(forest[0])
+    assert explainer.uses_leaf_table == (request.param == 'leaf table')
+    return explainer
+
+
+def test_contributions_sum_to_probabilities(explainer, forest):
+    model, rows = forest
+    contributions = explainer.contributions(rows)
+    np.testing.assert_allclose(explainer.bias + contributions.sum(axis=1), model.predict_proba(rows), atol=1e-6)
+
+
+def test_single_row_walk_matches_batch(explainer, forest):
+    _, rows = forest
+    single = np.concatenate([explainer.contributions(row) for row in rows])
+    np.testing.assert_allclose(single, explainer.contributions(rows), atol=1e-9)
+
+
+def test_single_row_under_a_millisecond(explainer, forest):
+    _, rows = forest
+    timings = []
+    for row in rows:
+        started = time.perf_counter()
+        explainer.risk_contributions(row, [1.0, 2.0])
+        timings.append(time.perf_counter() - started)
+    assert np.median(timings) < 0.001, f'{np.median(timings) * 1000:.2f} ms per row'
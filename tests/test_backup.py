@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+import backup
+import database as db
+import logic
+import record_cache
+
+
+@pytest.fixture
+def backup_dir(db_path, tmp_path, monkeypatch):
+    path = str(tmp_path / 'backups')
+    monkeypatch.setattr(backup, 'BACKUP_DIR', path)
+    return path
+
+
+def _save(glucose):
+    db.save_clinical_prediction(1, glucose, 70.0, 20.0, 80.0, 25.0, 0.5, 40, 0, 10.0,
+                                logic.render_status(4, 90.0))
+
+
+def _ids():
+    conn = db._connect()
+    ids = [row[0] for row in conn.execute('SELECT id FROM clinical_predictions ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def _cached_ids():
+    return sorted(record_cache.get_records('clinical')['id'].tolist())
+
+
+def test_snapshot_and_restore(backup_dir):
+    for glucose in (90, 100, 110):
+        _save(glucose)
+    [snapshot_path] = backup.snapshot('manual')
+    _save(120)
+    db.delete_record('clinical_predictions', 1)
+    assert _ids() == [2, 3, 4]
+
+    assert backup.restore(os.path.basename(snapshot_path)) == db.DB_PATH
+    assert _ids() == [1, 2, 3]
+    # The replaced contents were kept as a safety snapshot
+    reasons = [b['reason'] for b in backup.list_backups()]
+    assert reasons == ['prerestore', 'manual']
+    backup.restore(backup.list_backups()[0]['file'])
+    assert _ids() == [2, 3, 4]
+
+
+def test_snapshot_names_are_unique(backup_dir):
+    _save(90)
+    written = [backup.snapshot('manual')[0] for _ in range(5)]
+    assert len(set(written)) == 5
+    assert [b['file'] for b in backup.list_backups()] == [os.path.basename(p) for p in reversed(written)]
+
+
+def test_scheduled_snapshot_skips_unchanged(backup_dir):
+    _save(90)
+    assert len(backup.snapshot('scheduled', skip_unchanged=True)) == 1
+    assert backup.snapshot('scheduled', skip_unchanged=True) == []
+    _save(100)
+    assert len(backup.snapshot('scheduled', skip_unchanged=True)) == 1
+
+
+def test_restore_oldest_retained_snapshot(backup_dir, monkeypatch):
+    monkeypatch.setattr(backup, 'KEEP', 3)
+    for glucose in (90, 100, 110):
+        _save(glucose)
+        backup.snapshot('manual')
+    oldest = backup.list_backups()[-1]['file']
+
+    backup.restore(oldest)
+    assert _ids() == [1]
+
+
+def test_safety_snapshots_are_kept_apart(backup_dir, monkeypatch):
+    monkeypatch.setattr(backup, 'KEEP', 2)
+    monkeypatch.setattr(backup, 'KEEP_SAFETY', 1)
+    _save(90)
+    backup.snapshot('preclear')
+    for _ in range(3):
+        backup.snapshot('manual')
+    reasons = [b['reason'] for b in backup.list_backups()]
+    assert sorted(reasons) == ['manual', 'manual', 'preclear']
+
+
+# --- ROW CACHE ---
+def test_record_cache_refreshes_after_delete_and_restore(backup_dir):
+    for glucose in (90, 100, 110, 120, 130):
+        _save(glucose)
+    [snapshot_path] = backup.snapshot('manual')
+    assert _cached_ids() == [1, 2, 3, 4, 5]
+
+    db.delete_record('clinical_predictions', 3)
+    assert _cached_ids() == [1, 2, 4, 5]
+
+    # The snapshot's generation is one below the live one the cache holds
+    live = db.get_record_generations()['clinical_predictions']
+    backup.restore(os.path.basename(snapshot_path))
+    assert db.get_record_generations()['clinical_predictions'] > live
+    assert _cached_ids() == [1, 2, 3, 4, 5]
+
+    _save(140)
+    assert _cached_ids() == [1, 2, 3, 4, 5, 6]
+
+
+def test_record_cache_keeps_rows_committed_during_a_refresh(db_path, write_before):
+    for glucose in (90, 100, 110):
+        _save(glucose)
+    assert _cached_ids() == [1, 2, 3]
+    _save(120)
+    # Another session saves while the refresh is reading the new rows
+    write_before('ORDER BY id DESC', lambda: _save(130))
+    assert _cached_ids() == [1, 2, 3, 4]
+    assert _cached_ids() == [1, 2, 3, 4, 5]
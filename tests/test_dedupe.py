@@ -0,0 +1,40 @@
+import pytest
+
+import database as db
+import dedupe
+import logic
+
+
+def _seed_at(offsets, glucose=150.0):
+    """One identical clinical record per offset (seconds after a fixed start)."""
+    conn = db._connect()
+    cursor = conn.cursor()
+    for offset in offsets:
+        db._insert_clinical(cursor, 2, glucose, 80.0, 25.0, 90.0, 31.2, 0.55, 48, 1, 87.3,
+                            logic.render_status(1, 87.3))
+        cursor.execute("UPDATE clinical_predictions SET timestamp = datetime('2026-01-01', ?) "
+                       "WHERE id = (SELECT MAX(id) FROM clinical_predictions)", (f'+{offset} seconds',))
+    conn.commit()
+    conn.close()
+
+
+def _ids():
+    conn = db._connect()
+    ids = [record_id for (record_id,) in conn.execute('SELECT id FROM clinical_predictions ORDER BY id')]
+    conn.close()
+    return ids
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 100])
+def test_duplicates_split_across_batches(db_path, batch_size):
+    # 1-2-3: each a copy of the one before (400 s apart, window 600), 3 is
+    # 800 s after 1; 4 is different; 5-6 a plain pair
+    _seed_at([0, 400, 800])
+    _seed_at([900], glucose=95.0)
+    _seed_at([5000, 5010])
+
+    assert dedupe.dedupe_file(db_path, 'clinical', 600, batch_size, dry_run=True) == 3
+    assert _ids() == [1, 2, 3, 4, 5, 6]
+    assert dedupe.dedupe_file(db_path, 'clinical', 600, batch_size) == 3
+    assert _ids() == [1, 4, 5]
+    assert dedupe.dedupe_file(db_path, 'clinical', 600, batch_size) == 0
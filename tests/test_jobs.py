@@ -0,0 +1,139 @@
+from datetime import datetime
+
+import pytest
+
+import database as db
+import jobs
+import worker
+
+
+def _job(job_id):
+    conn = db._connect()
+    row = conn.execute('''
+        SELECT status, attempts, lease_owner, error,
+               CAST(strftime('%s', run_after) - strftime('%s', 'now') AS INTEGER)
+        FROM jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+    conn.close()
+    return dict(zip(['status', 'attempts', 'lease_owner', 'error', 'delay'], row))
+
+
+# --- CRON ---
+def test_parse_cron_fields():
+    minutes, hours, days, months, weekdays, restricted = jobs.parse_cron('*/15 0-6/3 1,15 * 1-5')
+    assert minutes == {0, 15, 30, 45}
+    assert hours == {0, 3, 6}
+    assert days == {1, 15}
+    assert months == set(range(1, 13))
+    assert weekdays == {1, 2, 3, 4, 5}
+    assert restricted == (True, True)
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '0 24 * * *', '0 0 0 * *', '5-1 * * * *'])
+def test_parse_cron_rejects_bad_expressions(expression):
+    with pytest.raises(ValueError):
+        jobs.parse_cron(expression)
+
+
+@pytest.mark.parametrize('expression, after, expected', [
+    # Strictly after: the matching minute itself moves to the next day
+    ('0 2 * * *', datetime(2024, 1, 1, 2, 0), datetime(2024, 1, 2, 2, 0)),
+    ('0 2 * * *', datetime(2024, 1, 1, 1, 59, 30), datetime(2024, 1, 1, 2, 0)),
+    ('30 3 * * *', datetime(2024, 12, 31, 23, 59), datetime(2025, 1, 1, 3, 30)),
+    # 2024-01-01 is a Monday; weekday 0 is Sunday
+    ('0 4 * * 0', datetime(2024, 1, 1, 12, 0), datetime(2024, 1, 7, 4, 0)),
+    # Day of month OR day of week once both are restricted
+    ('0 0 13 * 5', datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 5, 0, 0)),
+    ('0 0 29 2 *', datetime(2024, 3, 1, 0, 0), datetime(2028, 2, 29, 0, 0)),
+])
+def test_next_run(expression, after, expected):
+    assert jobs.next_run(expression, after) == expected
+
+
+def test_next_run_never_matching():
+    with pytest.raises(ValueError):
+        jobs.next_run('0 0 31 2 *', datetime(2024, 1, 1))
+
+
+# --- QUEUE ---
+def test_claim_by_priority_and_task(db_path):
+    low = jobs.enqueue('analyze', priority=0)
+    high = jobs.enqueue('vacuum', priority=5)
+    jobs.enqueue('dedupe', priority=9, delay_seconds=3600)
+
+    assert jobs.claim('w1', ['analyze'])['id'] == low
+    job = jobs.claim('w1')
+    assert (job['id'], job['task'], job['attempts']) == (high, 'vacuum', 1)
+    # The delayed job is not ready yet, and an empty task list claims nothing
+    assert jobs.claim('w1') is None
+    assert jobs.claim('w1', []) is None
+    assert _job(high)['lease_owner'] == 'w1'
+
+
+def test_expired_lease_is_claimed_again(db_path):
+    job_id = jobs.enqueue('analyze')
+    jobs.claim('w1', lease_seconds=-1)
+
+    job = jobs.claim('w2')
+    assert (job['id'], job['attempts']) == (job_id, 2)
+    # The first worker lost the lease and cannot complete the job
+    assert not jobs.complete(job_id, 'w1', {}, 1.0)
+    assert jobs.complete(job_id, 'w2', {'ok': True}, 1.0)
+    assert _job(job_id)['status'] == 'done'
+
+
+def test_extended_lease_is_kept(db_path):
+    job_id = jobs.enqueue('analyze')
+    jobs.claim('w1', lease_seconds=-1)
+    jobs.extend_leases('w1', [job_id])
+
+    assert jobs.claim('w2') is None
+    assert _job(job_id)['lease_owner'] == 'w1'
+
+
+def test_expired_lease_without_attempts_left_fails(db_path):
+    job_id = jobs.enqueue('analyze', max_attempts=1)
+    jobs.claim('w1', lease_seconds=-1)
+
+    assert jobs.claim('w2') is None
+    assert (_job(job_id)['status'], _job(job_id)['error']) == ('failed', 'lease expired')
+
+
+def test_fail_backs_off_then_gives_up(db_path):
+    job_id = jobs.enqueue('analyze', max_attempts=2)
+    jobs.claim('w1')
+    assert jobs.fail(job_id, 'w1', 'boom', 0.5)
+    job = _job(job_id)
+    assert (job['status'], job['error']) == ('queued', 'boom')
+    assert jobs.RETRY_DELAY_SECONDS - 2 <= job['delay'] <= jobs.RETRY_DELAY_SECONDS
+    assert jobs.claim('w1') is None
+
+    # Make it ready again; the second failure doubles the delay and is final
+    conn = db._connect()
+    conn.execute("UPDATE jobs SET run_after = datetime('now', '-1 seconds')")
+    conn.commit()
+    conn.close()
+    assert jobs.claim('w1')['attempts'] == 2
+    assert not jobs.fail(job_id, 'w2', 'not the owner', 0.5)
+    assert jobs.fail(job_id, 'w1', 'boom again', 0.5)
+    assert _job(job_id)['status'] == 'failed'
+
+
+def test_enqueue_due_queues_each_run_once(db_path):
+    jobs.sync_schedules([('every-minute', 'analyze', '* * * * *', {}, 0)])
+    conn = db._connect()
+    conn.execute("UPDATE job_schedules SET next_run = '2000-01-01 00:00:00'")
+    conn.commit()
+    conn.close()
+
+    assert len(jobs.enqueue_due()) == 1
+    assert jobs.enqueue_due() == []
+
+
+def test_worker_runs_ready_jobs(db_path):
+    failing = jobs.enqueue('rescore', {'mode': 'no-such-mode'}, max_attempts=1)
+    done = jobs.enqueue('recompute_drift')
+
+    assert worker.run_worker(threads=1, processes=1, poll=0.1, once=True, schedules=False) == 2
+    assert _job(done)['status'] == 'done'
+    assert _job(failing)['status'] == 'failed'
@@ -0,0 +1,75 @@
+import pytest
+
+import database as db
+import search
+from test_storage import _seed
+
+
+def _statuses(mode, text):
+    conn = db._connect()
+    sql, params = search.build_search_query(conn.cursor(), mode, text=text)
+    statuses = [row[0] for row in conn.execute(f'SELECT status FROM ({sql})', params).fetchall()]
+    conn.close()
+    return sorted(statuses)
+
+
+# --- STATUS WORDS ---
+@pytest.mark.parametrize('compact', [False, True])
+def test_status_words_select_status_classes(db_path, monkeypatch, compact):
+    if compact:
+        monkeypatch.setattr(db, 'COMPACT_STORAGE', True)
+        db.init_db(force=True)
+    _seed()
+
+    assert _statuses('clinical', 'diabetic') == [
+        'DIABETIC (High Risk - 87.3% probability)', '⚠️ DIABETIC (High Glucose Override)']
+    assert _statuses('clinical', 'pre-diabetic') == ['⚠️ PRE-DIABETIC (Elevated Glucose)']
+    assert _statuses('clinical', 'non diabetic') == ['✅ NON-DIABETIC (Low Risk - 92.5% confidence)']
+    assert _statuses('lifestyle', 'healthy') == ['✅ HEALTHY (Low Risk - 90.1% Match)']
+    assert _statuses('lifestyle', 'Prediabetic') == [' PRE-DIABETIC (Moderate Risk - 48.0% Match)']
+    # Text that is not a status template has no class
+    assert _statuses('clinical', 'healthy') == []
+
+
+def test_status_classes_backfilled_on_upgrade(db_path):
+    _seed()
+    conn = db._connect()
+    conn.execute('UPDATE clinical_predictions SET status_class = NULL')
+    conn.execute('UPDATE lifestyle_predictions SET status_class = NULL')
+    conn.commit()
+    conn.close()
+
+    # A database from before the column: init_db backfills it when it adds it
+    conn = db._connect()
+    for table_name in db.PREDICTION_TABLES.values():
+        search.backfill_status_classes(conn.cursor(), table_name)
+    conn.commit()
+    conn.close()
+    assert len(_statuses('clinical', 'diabetic')) == 2
+    assert len(_statuses('lifestyle', 'healthy')) == 1
+
+
+# --- QUERY PLANS ---
+@pytest.mark.parametrize('mode,kwargs', [
+    ('clinical', {'text': 'diabetic'}),
+    ('lifestyle', {'text': 'pre-diabetic'}),
+    ('clinical', {'filters': {'glucose': (100, 150)}}),
+    ('lifestyle', {'filters': {'bmi': (25, 30)}}),
+    ('clinical', {'text': 'glucose'}),
+    ('clinical', {'text': 'diabetic glucose', 'filters': {'age': (40, None)}}),
+])
+@pytest.mark.parametrize('compact', [False, True])
+def test_searches_use_indexes(db_path, monkeypatch, mode, kwargs, compact):
+    if compact:
+        monkeypatch.setattr(db, 'COMPACT_STORAGE', True)
+        db.init_db(force=True)
+    _seed()
+
+    conn = db._connect()
+    sql, params = search.build_search_query(conn.cursor(), mode, limit=50, **kwargs)
+    plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+    conn.close()
+    # The FTS5 table is always reported as a virtual-table 'SCAN'; it is an index lookup
+    scans = [line for line in plan if line.startswith('SCAN') and 'VIRTUAL TABLE' not in line]
+    assert not scans, plan
+    assert any('USING' in line for line in plan), plan
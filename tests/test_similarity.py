@@ -0,0 +1,45 @@
+import threading
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+import database as db
+import logic
+import similarity
+
+
+def _seed(count):
+    rng = np.random.default_rng(0)
+    rows = np.column_stack([rng.integers(0, 10, count), rng.normal(120, 30, count), rng.normal(70, 10, count),
+                            rng.normal(25, 8, count), rng.normal(90, 40, count), rng.normal(30, 6, count),
+                            rng.uniform(0.1, 2, count), rng.integers(21, 80, count)])
+    for row in rows:
+        db.save_clinical_prediction(*row.tolist(), 0, 10.0, logic.render_status(4, 90.0))
+    return rows
+
+
+def test_first_query_answers_while_the_tree_builds(db_path, monkeypatch):
+    rows = _seed(200)
+    scaler = StandardScaler().fit(rows)
+    started, release = threading.Event(), threading.Event()
+    build = similarity.SimilarityIndex.build
+
+    def slow_build(self, scaler):
+        started.set()
+        release.wait(10)
+        build(self, scaler)
+    monkeypatch.setattr(similarity.SimilarityIndex, 'build', slow_build)
+
+    # No index file yet: the answer comes from the buffer, the tree is built in the background
+    similar = similarity.find_similar(rows[17], scaler, k=3)
+    assert started.wait(10)
+    assert similar['id'].iloc[0] == 18
+    assert similar['distance'].iloc[0] == 0
+
+    release.set()
+    index = similarity.get_index(db_path, scaler)
+    index._rebuilding.join(10)
+    assert len(index.tree_ids) == 200 and not index.buffer_ids
+    rebuilt = similarity.find_similar(rows[17], scaler, k=3)
+    assert rebuilt['id'].tolist() == similar['id'].tolist()
+    np.testing.assert_allclose(rebuilt['distance'], similar['distance'])
@@ -0,0 +1,223 @@
+import pytest
+
+import database as db
+import cube
+import drift
+import logic
+
+MODES = ('clinical', 'lifestyle')
+
+
+def _seed(patient_id=None):
+    """One record per status template, plus rows the compact layout cannot encode."""
+    for code, prediction, value in ((1, 1, 87.3), (2, 0, None), (3, 0, None), (4, 0, 92.5)):
+        db.save_clinical_prediction(2, 150.0, 80.0, 25.0, 90.0, 31.2, 0.55, 48, prediction, 87.3,
+                                    logic.render_status(code, value), 'v1', patient_id)
+    db.save_clinical_prediction(0, 90.0, 70.0, 20.0, 80.0, 22.0, 0.3, 30, 0, 5.0, 'Seeded record')
+    for code, prediction, value in ((11, 2.0, 71.4), (12, 1.0, 48.0), (13, 0.0, 90.1)):
+        db.save_lifestyle_prediction(1, 0, 29.5, 1, 0, 1, 0, 1, 4, 12, prediction, db.RISK_CLASSES[prediction],
+                                     logic.render_status(code, value), 'v1', patient_id)
+    db.save_lifestyle_prediction(0, 1, 24.0, 0, 1, 1, 1, 0, 2, 0, 0.0, 'Custom label', 'Seeded record')
+
+
+def _records(mode):
+    """Decoded rows of a mode, oldest first, as dicts."""
+    conn = db._connect()
+    cursor = conn.execute(f'SELECT * FROM {db.RECORD_VIEWS[mode]} ORDER BY id')
+    columns = [column[0] for column in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def _content(rows):
+    return [{k: v for k, v in row.items() if k not in ('id', 'timestamp')} for row in rows]
+
+
+def _scalar(sql):
+    conn = db._connect()
+    value = conn.execute(sql).fetchone()[0]
+    conn.close()
+    return value
+
+
+# --- COMPACT STORAGE ---
+def test_compact_migration_round_trip(db_path, monkeypatch):
+    _seed()
+    full = {mode: _records(mode) for mode in MODES}
+
+    # Full -> compact: init_db rewrites the stored rows, the views read the same
+    monkeypatch.setattr(db, 'COMPACT_STORAGE', True)
+    db.init_db(force=True)
+    assert {mode: _records(mode) for mode in MODES} == full
+    assert _scalar('PRAGMA user_version') == db.SCHEMA_VERSION + 1000
+    # Only the text no template matches is still stored as text
+    assert _scalar('SELECT COUNT(*) FROM clinical_predictions WHERE status IS NOT NULL') == 1
+    assert _scalar('SELECT COUNT(*) FROM lifestyle_predictions WHERE high_bp IS NOT NULL') == 0
+    assert _scalar('SELECT COUNT(*) FROM lifestyle_predictions WHERE risk_class IS NOT NULL') == 1
+
+    # New rows in the compact layout decode like the originals
+    _seed()
+    compact = {mode: _records(mode) for mode in MODES}
+    for mode in MODES:
+        half = len(full[mode])
+        assert _content(compact[mode][half:]) == _content(full[mode])
+
+    # Compact -> full: existing rows stay decodable, new rows are stored in full
+    monkeypatch.setattr(db, 'COMPACT_STORAGE', False)
+    db.init_db(force=True)
+    assert {mode: _records(mode) for mode in MODES} == compact
+    assert _scalar('PRAGMA user_version') == db.SCHEMA_VERSION
+    _seed()
+    for mode in MODES:
+        assert _content(_records(mode)[len(compact[mode]):]) == _content(full[mode])
+    assert _scalar('SELECT COUNT(*) FROM lifestyle_predictions WHERE high_bp IS NOT NULL') == 4
+
+
+def test_compact_migration_is_a_no_op_when_repeated(db_path, monkeypatch):
+    monkeypatch.setattr(db, 'COMPACT_STORAGE', True)
+    db.init_db(force=True)
+    _seed()
+    rows = {mode: _records(mode) for mode in MODES}
+    db.init_db(force=True)
+    assert {mode: _records(mode) for mode in MODES} == rows
+
+
+# --- IDEMPOTENT INSERTS ---
+def test_repeated_submission_saves_once(db_path):
+    key = db.submission_key('clinical', 'session-1', 1)
+    args = (2, 150.0, 80.0, 25.0, 90.0, 31.2, 0.55, 48, 1, 87.3, logic.render_status(1, 87.3))
+
+    assert db.save_clinical_prediction(*args, idempotency_key=key)
+    assert not db.save_clinical_prediction(*args, idempotency_key=key)
+    assert _scalar('SELECT COUNT(*) FROM clinical_predictions') == 1
+    # The incremental statistics counted the row once
+    conn = db._connect()
+    assert sum(drift.load_live_histograms(conn.cursor(), 'clinical')['glucose']) == 1
+    conn.close()
+
+    # Without a key, or with the next submission's key, every save is stored
+    assert db.save_clinical_prediction(*args)
+    assert db.save_clinical_prediction(*args, idempotency_key=db.submission_key('clinical', 'session-1', 2))
+    assert _scalar('SELECT COUNT(*) FROM clinical_predictions') == 3
+
+
+def test_submission_keys():
+    assert db.submission_key('clinical', 's1', 1) == db.submission_key('clinical', 's1', 1)
+    assert len({db.submission_key('clinical', 's1', 1), db.submission_key('clinical', 's1', 2),
+                db.submission_key('clinical', 's2', 1), db.submission_key('lifestyle', 's1', 1)}) == 4
+
+
+def test_repeated_combined_assessment_saves_once(db_path):
+    clinical = dict(pregnancies=2, glucose=150.0, blood_pressure=80.0, skin_thickness=25.0, insulin=90.0,
+                    bmi=31.2, diabetes_pedigree=0.55, age=48, prediction=1, risk_percentage=87.3,
+                    status=logic.render_status(1, 87.3), model_version='v1')
+    lifestyle = dict(high_bp=1, high_chol=0, bmi=31.2, smoker=1, physical_activity=0, fruits=1, vegetables=0,
+                     heavy_alcohol=0, general_health=4, mental_health=3, prediction=2.0, risk_class='Diabetic',
+                     status=logic.render_status(11, 71.4), model_version='v1')
+    key = db.submission_key('combined', 'session-1', 1)
+
+    assessment_id, inserted = db.save_combined_assessment(clinical, lifestyle, idempotency_key=key)
+    assert inserted
+    assert db.save_combined_assessment(clinical, lifestyle, idempotency_key=key) == (assessment_id, False)
+    clinical_rows, lifestyle_rows = db.get_assessment(assessment_id)
+    assert (len(clinical_rows), len(lifestyle_rows)) == (1, 1)
+
+
+# --- TYPED READS ---
+def _seed_one():
+    conn = db._connect()
+    cursor = conn.cursor()
+    db._insert_clinical(cursor, 1, 100.0, 70.0, 20.0, 80.0, 25.0, 0.5, 40, 0, 10.0,
+                        logic.render_status(4, 90.0))
+    conn.commit()
+    conn.close()
+
+
+def test_read_ignores_rows_committed_between_count_and_select(db_path, write_before):
+    for _ in range(5):
+        _seed_one()
+    write_before('ORDER BY id DESC', _seed_one)
+
+    df = db._read_typed(db_path, 'clinical')
+    assert df['id'].tolist() == [5, 4, 3, 2, 1]
+    assert db._read_typed(db_path, 'clinical', after_id=5)['id'].tolist() == [6]
+
+
+
+# --- SUMMARY SKETCHES ---
+def _seed_ages(ages):
+    for age in ages:
+        db.save_clinical_prediction(1, 100.0, 70.0, 20.0, 80.0, 25.0, 0.5, age, 0, 10.0,
+                                    logic.render_status(4, 90.0))
+
+
+def test_sketches_catch_up_off_the_insert_path(db_path):
+    _seed_ages(range(20, 70))
+    # Inserts leave the stored sketches alone; reads fold the pending rows
+    assert _scalar('SELECT COUNT(*) FROM column_sketches') == 0
+    sketch = db.get_column_sketch('clinical_predictions', 'age')
+    assert (sketch.count, sketch.min, sketch.max) == (50, 20, 69)
+
+    assert db.update_sketches() == {'clinical_predictions': 50, 'lifestyle_predictions': 0}
+    assert db.update_sketches() == {'clinical_predictions': 0, 'lifestyle_predictions': 0}
+    _seed_ages([90])
+    sketch = db.get_column_sketch('clinical_predictions', 'age')
+    assert (sketch.count, sketch.max) == (51, 90)
+    assert sketch.mean == pytest.approx((sum(range(20, 70)) + 90) / 51)
+    assert db.update_sketches()['clinical_predictions'] == 1
+    assert db.get_column_sketch('clinical_predictions', 'age').count == 51
+
+
+def test_sketches_kept_on_insert_cover_existing_rows_after_upgrade(db_path):
+    _seed_ages(range(20, 30))
+    db.update_sketches()
+    # A database from before sketch_progress: its sketches already hold every row
+    conn = db._connect()
+    conn.execute('DELETE FROM sketch_progress')
+    conn.commit()
+    conn.close()
+    db.init_db(force=True)
+    assert _scalar("SELECT last_id FROM sketch_progress WHERE table_name = 'clinical_predictions'") == 10
+    assert db.get_column_sketch('clinical_predictions', 'age').count == 10
+
+
+# --- DELETES ---
+def _derived_counts():
+    conn = db._connect()
+    histograms = conn.execute('SELECT mode, feature, bin, count FROM feature_histograms '
+                              'WHERE count > 0 ORDER BY 1, 2, 3').fetchall()
+    # Sums subtracted in a different order than a recount adds them differ in the last bits
+    cells = conn.execute('SELECT mode, month, age_band, bmi_band, glucose_band, risk_class, flags, count, '
+                         'ROUND(bmi_sum, 6), ROUND(risk_sum, 6) FROM cohort_cube '
+                         'ORDER BY 1, 2, 3, 4, 5, 6, 7').fetchall()
+    conn.close()
+    return histograms, cells
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_delete_takes_the_row_out_of_the_statistics(db_path, monkeypatch, compact):
+    if compact:
+        monkeypatch.setattr(db, 'COMPACT_STORAGE', True)
+        db.init_db(force=True)
+    _seed()
+    db.update_sketches()
+    db.delete_record('clinical_predictions', 2)
+    db.delete_record('lifestyle_predictions', 3)
+    db.delete_record('lifestyle_predictions', 99)
+    decremented = _derived_counts()
+
+    conn = db._connect()
+    cursor = conn.cursor()
+    for mode in MODES:
+        drift.rebuild_histograms(cursor, mode, db.RECORD_VIEWS[mode])
+        cube.rebuild(cursor, mode, db.RECORD_VIEWS[mode], db.LIFESTYLE_FLAGS)
+    conn.commit()
+    conn.close()
+    assert decremented == _derived_counts()
+
+    # The sketches still count the deleted rows until the job rebuilds them
+    assert _scalar('SELECT SUM(stale) FROM sketch_progress') == 2
+    assert db.update_sketches() == {'clinical_predictions': 4, 'lifestyle_predictions': 3}
+    assert db.get_column_sketch('clinical_predictions', 'age').count == 4
+    assert db.get_column_sketch('lifestyle_predictions', 'bmi').count == 3